@@ -0,0 +1,121 @@
+"""
+Admission Control
+التحكم في قبول الطلبات حسب الأولوية عند الضغط العالي
+"""
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from config import settings
+
+# Highest priority first; waiters are always woken in this order
+PRIORITY_CLASSES = ("critical", "high", "normal", "low")
+
+
+class AdmissionRejected(Exception):
+    """The wait queue is full; the request should be shed immediately"""
+
+
+class PriorityLimiter:
+    """حد للطلبات المتزامنة مع طابور انتظار محدود مرتب بالأولوية
+
+    At most `limit` requests run at once. Each class may hold at most its
+    `shares` fraction of those slots, so analytics can never occupy the whole
+    server, and "critical" may run `critical_reserve` slots beyond the limit,
+    so security events keep flowing while everything else is saturated.
+    Waiters are bounded by `queue_size` (critical requests are never
+    rejected for a full queue) and a freed slot goes to the highest waiting
+    class. Runs on one event loop; no locking needed.
+    """
+
+    def __init__(self, limit: int = settings.ADMISSION_MAX_CONCURRENCY,
+                 queue_size: int = settings.ADMISSION_QUEUE_SIZE,
+                 critical_reserve: int = settings.ADMISSION_CRITICAL_RESERVE,
+                 shares: Optional[Dict[str, float]] = None):
+        shares = shares if shares is not None else settings.ADMISSION_CLASS_SHARES
+        self.limit = limit
+        self.queue_size = queue_size
+        self.capacity = {cls: limit + (critical_reserve if cls == "critical" else 0) for cls in PRIORITY_CLASSES}
+        self.class_limit = {
+            cls: max(1, int(limit * shares.get(cls, 1.0))) + (critical_reserve if cls == "critical" else 0)
+            for cls in PRIORITY_CLASSES
+        }
+        self.running = 0
+        self._running: Dict[str, int] = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._stats = {cls: {'admitted': 0, 'queued': 0, 'shed': 0, 'timed_out': 0} for cls in PRIORITY_CLASSES}
+
+    def _can_run(self, cls: str) -> bool:
+        return self.running < self.capacity[cls] and self._running[cls] < self.class_limit[cls]
+
+    def _waiting(self, up_to: str) -> bool:
+        """Whether any request of class `up_to` or higher is already waiting"""
+        for cls in PRIORITY_CLASSES:
+            if self._waiters[cls]:
+                return True
+            if cls == up_to:
+                return False
+        return False
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _grant(self, cls: str):
+        self.running += 1
+        self._running[cls] += 1
+        self._stats[cls]['admitted'] += 1
+
+    async def acquire(self, cls: str, timeout: float):
+        """Wait up to `timeout` for a slot; raises AdmissionRejected or asyncio.TimeoutError"""
+        if self._can_run(cls) and not self._waiting(cls):
+            self._grant(cls)
+            return
+        if cls != "critical" and self.queued >= self.queue_size:
+            self._stats[cls]['shed'] += 1
+            raise AdmissionRejected(f"admission queue is full ({self.queue_size} waiting)")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[cls].append(waiter)
+        self._stats[cls]['queued'] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the wait ended: hand the slot on
+                self.release(cls)
+            else:
+                waiter.cancel()
+                self._waiters[cls].remove(waiter)
+            self._stats[cls]['timed_out'] += 1
+            raise
+
+    def release(self, cls: str):
+        self.running -= 1
+        self._running[cls] -= 1
+        for waiting_cls in PRIORITY_CLASSES:
+            waiters = self._waiters[waiting_cls]
+            while waiters and self._can_run(waiting_cls):
+                waiter = waiters.popleft()
+                self._grant(waiting_cls)
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'queue_size': self.queue_size,
+            'running': self.running,
+            'queued': self.queued,
+            'classes': {
+                cls: {
+                    'running': self._running[cls],
+                    'waiting': len(self._waiters[cls]),
+                    'max_running': self.class_limit[cls],
+                    **self._stats[cls],
+                }
+                for cls in PRIORITY_CLASSES
+            },
+        }
+
+
+admission = PriorityLimiter()
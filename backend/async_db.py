@@ -0,0 +1,88 @@
+"""
+Async Data Access
+واجهة غير متزامنة لقاعدة البيانات بمنفذين منفصلين للقراءة والكتابة
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, FrozenSet
+
+import auth
+import database
+import events_management
+from config import settings
+
+# Bounded, dedicated executors: analytics reads can fill theirs without
+# delaying writes, and neither competes with the framework threadpool
+read_executor = ThreadPoolExecutor(max_workers=settings.DB_READ_WORKERS, thread_name_prefix="db-read")
+write_executor = ThreadPoolExecutor(max_workers=settings.DB_WRITE_WORKERS, thread_name_prefix="db-write")
+
+
+async def run_read(fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking read on the read executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(read_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_write(fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking write on the write executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(write_executor, functools.partial(fn, *args, **kwargs))
+
+
+class AsyncMirror:
+    """نسخة غير متزامنة من وحدة أو كائن وصول للبيانات
+
+    `mirror.some_function(...)` returns a coroutine running the original
+    on the read executor, or on the write executor when its name is in
+    `writes`.
+    """
+
+    def __init__(self, target: Any, writes: FrozenSet[str]):
+        self._target = target
+        self._writes = writes
+        self._cache: Dict[str, Callable] = {}
+
+    def __getattr__(self, name: str) -> Callable:
+        wrapper = self._cache.get(name)
+        if wrapper is None:
+            fn = getattr(self._target, name)
+            if not callable(fn):
+                raise AttributeError(f"{name} is not a data-access function")
+            run = run_write if name in self._writes else run_read
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                return await run(fn, *args, **kwargs)
+
+            self._cache[name] = wrapper
+        return wrapper
+
+
+# add_event is not mirrored: use database.add_event_async, which awaits the
+# ingest queue's group commit instead of parking a writer thread on it
+db = AsyncMirror(database, frozenset({
+    'init_database', 'add_event', 'add_events', 'resolve_all_events', 'update_event',
+    'delete_all_events', 'add_resolution', 'add_officer', 'update_officer_position',
+    'add_danger_zone', 'update_danger_zone', 'delete_danger_zone',
+}))
+
+users = AsyncMirror(auth, frozenset({
+    'create_user', 'authenticate_user', 'update_user_status', 'change_password',
+    'log_activity', 'init_default_users',
+}))
+
+events_db = AsyncMirror(events_management.events_db, frozenset({
+    'init_events_tables', 'create_event', 'update_event', 'register_iot_device', 'update_device_status',
+    'register_participant', 'register_participants', 'save_import_job', 'verify_participant', 'register_biometric',
+    'verify_biometric', 'log_access', 'log_exit', 'track_location', 'track_locations', 'save_positions',
+    'log_security_alert', 'log_security_alerts', 'log_fraud_attempt', 'create_access_credential',
+}))
+
+
+def executor_stats() -> Dict[str, Any]:
+    """Queued work per executor"""
+    return {
+        name: {'workers': executor._max_workers, 'queued': executor._work_queue.qsize()}
+        for name, executor in (('read', read_executor), ('write', write_executor))
+    }
@@ -68,7 +68,7 @@ def create_user(username: str, password: str, role: str, full_name: str, email:
     """Create a new user"""
     password_hash = hash_password(password)
     
-    with db.get_db() as conn:
+    with db.get_db('create_user') as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO users (username, password_hash, role, full_name, email, officer_id)
@@ -79,7 +79,7 @@ def create_user(username: str, password: str, role: str, full_name: str, email:
 
 def authenticate_user(username: str, password: str) -> Optional[dict]:
     """Authenticate user and return user data"""
-    with db.get_db() as conn:
+    with db.get_db('authenticate_user') as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM users WHERE username = ? AND is_active = 1', (username,))
         user = cursor.fetchone()
@@ -99,7 +99,7 @@ def authenticate_user(username: str, password: str) -> Optional[dict]:
 
 def get_user_by_id(user_id: int) -> Optional[dict]:
     """Get user by ID"""
-    with db.get_db() as conn:
+    with db.get_db('get_user_by_id') as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
         user = cursor.fetchone()
@@ -107,14 +107,14 @@ def get_user_by_id(user_id: int) -> Optional[dict]:
 
 def get_all_users() -> list:
     """Get all users"""
-    with db.get_db() as conn:
+    with db.get_db('get_all_users') as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, username, role, full_name, email, is_active, created_at, last_login FROM users')
         return [dict(row) for row in cursor.fetchall()]
 
 def update_user_status(user_id: int, is_active: bool) -> bool:
     """Activate or deactivate a user"""
-    with db.get_db() as conn:
+    with db.get_db('update_user_status') as conn:
         cursor = conn.cursor()
         cursor.execute('UPDATE users SET is_active = ? WHERE id = ?', (is_active, user_id))
         conn.commit()
@@ -124,7 +124,7 @@ def change_password(user_id: int, new_password: str) -> bool:
     """Change user password"""
     password_hash = hash_password(new_password)
     
-    with db.get_db() as conn:
+    with db.get_db('change_password') as conn:
         cursor = conn.cursor()
         cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
         conn.commit()
@@ -134,7 +134,7 @@ def log_activity(user_id: Optional[int], action: str, entity_type: Optional[str]
                 entity_id: Optional[str] = None, details: Optional[str] = None, 
                 ip_address: Optional[str] = None) -> int:
     """Log user activity"""
-    with db.get_db() as conn:
+    with db.get_db('log_activity') as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO activity_log (user_id, action, entity_type, entity_id, details, ip_address)
@@ -146,7 +146,7 @@ def log_activity(user_id: Optional[int], action: str, entity_type: Optional[str]
 # Initialize default admin user
 def init_default_users():
     """Create default admin user if not exists"""
-    with db.get_db() as conn:
+    with db.get_db('init_default_users') as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) as count FROM users WHERE role = ?', ('admin',))
         admin_count = cursor.fetchone()['count']
@@ -0,0 +1,183 @@
+"""
+Middleware Overhead Benchmark
+قياس الزمن الإضافي لكل طلب بسبب طبقة الـ middleware
+
+Run from backend/:  python benchmarks/middleware_benchmark.py
+Calls the ASGI app in-process (no sockets) on /health and /api/events and
+compares three builds of the same app: without user middleware ("bare"),
+with the error, logging, rate-limit and security-header middlewares as they
+were before the pure-ASGI rewrite ("before", BaseHTTPMiddleware.dispatch
+doing today's per-request work), and the current stack ("after"). Request
+logging is silenced so only the middleware machinery is measured.
+"""
+import asyncio
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="middleware-bench-"))
+os.symlink(os.path.join(BACKEND_DIR, "static"), "static")  # main.py mounts ./static
+
+from config import settings  # noqa: E402
+
+settings.RATE_LIMIT_REQUESTS = 10 ** 9  # keep the limiter out of the way
+
+import database as db  # noqa: E402
+import main  # noqa: E402
+import middleware  # noqa: E402
+from fastapi import Request, status  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from logger import log_api_call, log_error  # noqa: E402
+from metrics import http_request_duration, http_requests  # noqa: E402
+from starlette.middleware import Middleware  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+ROUNDS = 2000
+PATHS = ["/health", "/api/events?limit=50"]
+
+
+# ===== Before: the BaseHTTPMiddleware versions =====
+
+class LegacyErrorHandlerMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            log_error(e, context=f"{request.method} {request.url.path}")
+            return JSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content={
+                    "error": "Internal Server Error",
+                    "message": "حدث خطأ في الخادم، يرجى المحاولة لاحقاً",
+                    "detail": None
+                }
+            )
+
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        duration = time.time() - start_time
+        log_api_call(
+            endpoint=request.url.path,
+            method=request.method,
+            status_code=response.status_code,
+            duration=duration
+        )
+        middleware.request_metrics.record(response.status_code, "if-none-match" in request.headers)
+        route = request.scope.get("route")
+        labels = (request.method, getattr(route, "path", "unmatched"), str(response.status_code))
+        http_requests.inc(labels)
+        http_request_duration.observe(labels, duration)
+        response.headers["X-Process-Time"] = str(duration)
+        return response
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    """Same clients, buckets and limits as RateLimitMiddleware, run through dispatch()"""
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app)
+        self.limits = middleware.RateLimitMiddleware(app, **kwargs)
+
+    async def dispatch(self, request: Request, call_next):
+        client, requests, period = self.limits._identify(request.scope)
+        retry_after = self.limits.limiter.hit(client, requests, period)
+        route = self.limits._route_limit(request.url.path)
+        if route is not None and not retry_after:
+            prefix, route_requests, route_period = route
+            retry_after = self.limits.limiter.hit(f"{client}|{prefix}", route_requests, route_period)
+        if retry_after:
+            return JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "error": "Too Many Requests",
+                    "message": "تم تجاوز الحد المسموح من الطلبات، يرجى الانتظار"
+                },
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+        return await call_next(request)
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        response.headers.update(middleware.SecurityHeadersMiddleware.SECURITY_HEADERS)
+        return response
+
+
+LEGACY = {
+    middleware.ErrorHandlerMiddleware: LegacyErrorHandlerMiddleware,
+    middleware.RequestLoggingMiddleware: LegacyRequestLoggingMiddleware,
+    middleware.RateLimitMiddleware: LegacyRateLimitMiddleware,
+    middleware.SecurityHeadersMiddleware: LegacySecurityHeadersMiddleware,
+}
+
+
+async def call(app, path: str) -> int:
+    """One in-process GET; returns the status code"""
+    raw_path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench"), (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def timed(app, path: str) -> float:
+    """Average microseconds per request"""
+    for _ in range(50):
+        await call(app, path)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await call(app, path)
+    return (time.perf_counter() - start) * 1e6 / ROUNDS
+
+
+async def run():
+    db.add_events([
+        {"device_id": f"officer_{i % 20}", "type": "status_update", "level": "info"}
+        for i in range(200)
+    ])
+    app = main.app
+    user_middleware = app.user_middleware
+    after = app.build_middleware_stack()
+    app.user_middleware = [Middleware(LEGACY.get(m.cls, m.cls), *m.args, **m.kwargs) for m in user_middleware]
+    before = app.build_middleware_stack()
+    app.user_middleware = []
+    bare = app.build_middleware_stack()  # same FastAPI plumbing, no user middleware
+    app.user_middleware = user_middleware
+
+    print(f"{'path':<24}{'bare µs':>10}{'before µs':>11}{'after µs':>10}"
+          f"{'before overhead':>17}{'after overhead':>16}")
+    for path in PATHS:
+        bare_us = await timed(bare, path)
+        before_us = await timed(before, path)
+        after_us = await timed(after, path)
+        print(f"{path:<24}{bare_us:>10.1f}{before_us:>11.1f}{after_us:>10.1f}"
+              f"{before_us - bare_us:>17.1f}{after_us - bare_us:>16.1f}")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    asyncio.run(run())
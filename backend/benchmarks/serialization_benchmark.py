@@ -0,0 +1,84 @@
+"""
+Serialization Benchmark
+مقارنة زمن تحويل get_events(1000) إلى JSON وحجم البيانات المرسلة
+
+Run from backend/:  python benchmarks/serialization_benchmark.py
+A throwaway database is created in a temp directory and seeded with 1000 events.
+"""
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="serialization-bench-"))
+
+import database as db  # noqa: E402  (creates smart_security.db in the temp dir)
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from middleware import brotli  # noqa: E402
+from responses import dumps, orjson  # noqa: E402
+from config import settings  # noqa: E402
+
+ROUNDS = 50
+LEVELS = ["info", "warning", "danger"]
+
+
+def seed(count: int = 1000):
+    now = datetime.now()
+    db.add_events([
+        {
+            "timestamp": (now - timedelta(seconds=i)).isoformat(),
+            "device_id": f"officer_riyadh_{i % 40}",
+            "type": "status_update",
+            "level": random.choice(LEVELS),
+            "status": "open",
+            "home_id": f"ZONE-RIYADH-{i % 12}",
+            "absher_id": "9876543210",
+            "location": {"lat": 24.7 + random.random() / 10, "lng": 46.6 + random.random() / 10},
+        }
+        for i in range(count)
+    ])
+
+
+def timed(fn, rounds: int = ROUNDS) -> float:
+    """Average milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+def main():
+    seed()
+    rows = db.get_events(1000)
+
+    baseline = lambda: json.dumps(jsonable_encoder(rows)).encode("utf-8")
+    plain = baseline()
+    fast = dumps(rows)
+
+    print(f"rows: {len(rows)}  encoder: {'orjson' if orjson else 'stdlib json (compact)'}")
+    print(f"{'path':<40}{'ms/call':>10}{'bytes':>12}")
+    print(f"{'jsonable_encoder + json.dumps':<40}{timed(baseline):>10.2f}{len(plain):>12}")
+    print(f"{'FastJSONResponse.render':<40}{timed(lambda: dumps(rows)):>10.2f}{len(fast):>12}")
+
+    level = settings.GZIP_COMPRESS_LEVEL
+    gz = gzip.compress(fast, compresslevel=level)
+    print(f"{f'  + gzip (level {level})':<40}"
+          f"{timed(lambda: gzip.compress(dumps(rows), compresslevel=level)):>10.2f}{len(gz):>12}")
+
+    if brotli is not None:
+        quality = settings.BROTLI_QUALITY
+        br = brotli.compress(fast, quality=quality)
+        print(f"{f'  + brotli (quality {quality})':<40}"
+              f"{timed(lambda: brotli.compress(dumps(rows), quality=quality)):>10.2f}{len(br):>12}")
+    else:
+        print("  + brotli: not installed (pip install brotli)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Application Cache
+تخزين مؤقت بمدة صلاحية مع إبطال عند الكتابة
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from config import settings
+from shared_state import SharedStore, get_store
+
+
+class TTLCache:
+    """ذاكرة مؤقتة LRU بمدة صلاحية، مع إبطال حسب الجداول وحساب واحد للمفتاح
+
+    Entries are tagged with the tables they were computed from; writers call
+    invalidate(<table>) after committing. Concurrent misses on one key share
+    a single computation (no stampede), and a value computed while one of its
+    tags was invalidated is returned to its callers but never stored.
+
+    With a shared `store`, tag versions live in the store (an invalidation in
+    one worker reaches all of them) and computed values are written through
+    so other workers start warm. Keys must then be strings.
+    """
+
+    def __init__(self, ttl: float = settings.CACHE_TTL,
+                 max_size: int = settings.CACHE_MAX_SIZE,
+                 name: str = "cache",
+                 store: Optional[SharedStore] = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.name = name
+        self.store = store if store is not None and store.shared else None
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, Tuple[str, ...], Tuple[int, ...]]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._tag_versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                       tags: Iterable[str] = ()) -> Any:
+        """Cached value for `key`, computing it at most once across threads"""
+        tags = tuple(tags)
+        versions = self._versions(tags) if self.store else None
+        with self._lock:
+            entry = self._data.get(key)
+            if (entry is not None and entry[0] > time.monotonic()
+                    and (versions is None or entry[3] == versions)):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                if versions is None:
+                    versions = self._versions(tags)
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result(timeout=settings.REQUEST_TIMEOUT)
+
+        try:
+            shared = self._shared_get(key, versions)
+            if shared is not None:
+                value = shared[0]
+            else:
+                value = compute()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        # Shared entries carry their versions and are re-checked on every read,
+        # so only the in-process check has to happen under the lock
+        fresh = self.store is not None and versions == self._versions(tags)
+        with self._lock:
+            self._inflight.pop(key, None)
+            if shared is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if fresh or (self.store is None and versions == self._versions(tags)):
+                self._data[key] = (time.monotonic() + self.ttl, value, tags, versions)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+        if fresh and shared is None:
+            self.store.set(self._shared_key(key), {'versions': list(versions), 'value': value}, self.ttl)
+        future.set_result(value)
+        return value
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _shared_get(self, key: Hashable, versions: Tuple[int, ...]) -> Optional[Tuple[Any]]:
+        """(value,) from the shared store when it was computed at `versions`"""
+        if not self.store:
+            return None
+        entry = self.store.get(self._shared_key(key))
+        if entry is None or tuple(entry['versions']) != versions:
+            return None
+        return (entry['value'],)
+
+    def _versions(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        if self.store:
+            return tuple(self.store.get(f"tag:{tag}") or 0 for tag in tags)
+        return tuple(self._tag_versions.get(tag, 0) for tag in tags)
+
+    def invalidate(self, *tags: str):
+        """Drop every entry computed from any of `tags` (table names)"""
+        if self.store:
+            for tag in tags:
+                self.store.incr(f"tag:{tag}")
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+            stale = [key for key, (_, _, entry_tags, _) in self._data.items()
+                     if any(tag in entry_tags for tag in tags)]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'invalidations': self.invalidations,
+                'hit_ratio': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared cache for the statistics endpoints
+stats_cache = TTLCache(name="stats", store=get_store())
+
+
+class ResponseCache:
+    """ذاكرة مؤقتة LRU لاستجابات HTTP كاملة (الحالة، الرؤوس، المحتوى)
+
+    Entries are bounded by count and total body bytes, expire after their
+    route's TTL, and are valid only while the change versions of the tables
+    they were built from are unchanged.
+    """
+
+    def __init__(self, max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = settings.RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Tuple[float, Tuple[int, ...], int, list, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, versions: Tuple[int, ...]) -> Optional[Tuple[int, list, bytes]]:
+        """(status, headers, body) if cached at `versions` and not expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[1] == versions:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2], entry[3], entry[4]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, versions: Tuple[int, ...], ttl: float,
+            status: int, headers: list, body: bytes):
+        if len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, versions, status, headers, body)
+            self._bytes += len(body)
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        self._bytes -= len(self._data.pop(key)[4])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Shared cache for opted-in GET routes (see RESPONSE_CACHE_ROUTES in main.py)
+response_cache = ResponseCache()
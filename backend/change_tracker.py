@@ -0,0 +1,70 @@
+"""
+Table Change Tracker
+عدّاد تغييرات لكل جدول لإنشاء ETag بدون الاستعلام من قاعدة البيانات
+"""
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from shared_state import SharedStore, get_store
+
+
+class ChangeTracker:
+    """Change sequence per table, bumped by every writer after commit.
+
+    Versions restart at 0 with the process, so validators also carry a boot
+    epoch: an ETag issued before a restart can never match after it.
+    With a shared `store` the versions and the epoch live in the store, so
+    every worker issues the same ETag and sees every other worker's writes.
+    """
+
+    def __init__(self, store: Optional[SharedStore] = None):
+        self.store = store if store is not None and store.shared else None
+        epoch = format(time.time_ns() // 1000, 'x')
+        self.epoch = self.store.setdefault("changes:epoch", epoch) if self.store else epoch
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *tables: str):
+        """Record a committed write to `tables`"""
+        if self.store:
+            for table in tables:
+                self.store.incr(f"changes:{table}")
+            return
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def version(self, table: str) -> int:
+        if self.store:
+            return self.store.get(f"changes:{table}") or 0
+        return self._versions.get(table, 0)
+
+    def versions(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self.version(table) for table in tables)
+
+    async def versions_async(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """versions() for the event loop: a shared store is read on its own threads"""
+        if self.store:
+            return await self.store.run(self.versions, tuple(tables))
+        return self.versions(tables)
+
+    def etag(self, tables: Iterable[str], period: Optional[int] = None) -> str:
+        """Weak validator for a response built from `tables`.
+
+        `period` (seconds) folds in a time bucket for responses that also
+        depend on the clock (e.g. "last 24 hours" counts).
+        """
+        parts = [self.epoch] + [f"{table}.{self.version(table)}" for table in tables]
+        if period:
+            parts.append(format(int(time.time() // period), 'x'))
+        return 'W/"' + '-'.join(parts) + '"'
+
+    async def etag_async(self, tables: Iterable[str], period: Optional[int] = None) -> str:
+        """etag() for the event loop: a shared store is read on its own threads"""
+        if self.store:
+            return await self.store.run(self.etag, tuple(tables), period)
+        return self.etag(tables, period)
+
+
+changes = ChangeTracker(get_store())
@@ -27,15 +27,36 @@ class Settings:
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = 100  # requests per minute
     RATE_LIMIT_PERIOD: int = 60  # seconds
+    RATE_LIMIT_USER_REQUESTS: int = 600  # per period, for requests with a valid bearer token
+    RATE_LIMIT_USERS: dict = {}  # {username: (requests, period)} overrides, e.g. gate controllers
+    RATE_LIMIT_ROUTES: dict = {  # {path prefix: (requests, period)}, on top of the client limit
+        "/api/auth/login": (10, 60),
+        "/api/auth/register": (10, 60),
+    }
+    RATE_LIMIT_MAX_KEYS: int = 50000  # buckets kept in memory (least recently used evicted)
     
     # Cache
     CACHE_TTL: int = 300  # 5 minutes
     CACHE_MAX_SIZE: int = 128
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024  # cached GET responses
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024  # 32 MB of response bodies
+    
+    # State shared across uvicorn workers (rate limits, caches, ETag versions)
+    SHARED_STATE_BACKEND: str = os.getenv("SHARED_STATE_BACKEND", "local")  # local | sqlite | redis
+    SHARED_STATE_PATH: str = os.getenv("SHARED_STATE_PATH", "shared_state.db")
+    SHARED_STATE_URL: str = os.getenv("SHARED_STATE_URL", "redis://localhost:6379/0")
+    SHARED_STATE_WORKERS: int = 4  # threads for store calls made from the event loop (sqlite / redis)
     
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE: str = "app.log"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_CONSOLE_JSON: bool = os.getenv("LOG_CONSOLE_JSON", "false").lower() == "true"  # files are always JSON
+    LOG_QUEUE_SIZE: int = 10000  # records buffered for the writer thread; extra records are dropped
+    LOG_SAMPLE_RATES: dict = {  # {"METHOD path": fraction of successful calls logged}
+        "POST /api/events": 0.01,
+        "POST /api/events/batch": 0.1,
+    }
     
     # Production URLs
     PRODUCTION_URL: str = "https://syntrue-absher.onrender.com"
@@ -44,14 +65,71 @@ class Settings:
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10 MB
     ALLOWED_EXTENSIONS: set = {".csv", ".pdf", ".jpg", ".png"}
     
+    # Batch Ingestion
+    MAX_BATCH_EVENTS: int = 10000  # events per POST /api/events/batch
+    
+    # Write-behind ingest queue for add_event
+    INGEST_DURABILITY: str = os.getenv("INGEST_DURABILITY", "commit")  # commit | enqueue
+    INGEST_QUEUE_MAX_SIZE: int = 20000
+    INGEST_BATCH_SIZE: int = 500  # rows per group commit
+    INGEST_FLUSH_INTERVAL_MS: int = 20
+    INGEST_ENQUEUE_TIMEOUT: float = 1.0  # seconds to wait for room before rejecting
+    
+    # Location Ingestion (bracelet and gateway fixes)
+    LOCATION_INGEST_DURABILITY: str = os.getenv("LOCATION_INGEST_DURABILITY", "enqueue")  # commit | enqueue
+    LOCATION_INGEST_QUEUE_MAX_SIZE: int = 200000  # buffered fixes
+    LOCATION_INGEST_BATCH_SIZE: int = 5000  # fixes per transaction
+    LOCATION_INGEST_FLUSH_INTERVAL_MS: int = 100
+    MAX_BATCH_LOCATIONS: int = 20000  # fixes per JSON request (NDJSON streams are unbounded)
+    POSITIONS_PERSIST_INTERVAL: float = 5.0  # seconds between saves of last-known positions
+    SPATIAL_GRID_CELL_METERS: float = 200.0  # cell size of the in-memory position grids
+    MAX_NEARBY_RADIUS_METERS: float = 50000.0
+    MAX_LOCATION_HISTORY_ROWS: int = 50000  # per spatial history query
+    LOCATION_HISTORY_INDEX_INTERVAL: float = 30.0  # seconds between R*Tree indexing passes over new fixes
+    MAX_DANGER_ZONE_RADIUS_METERS: float = 20000.0
+    GEOFENCE_MAX_PAIRS_PER_CHUNK: int = 1 << 20  # fix x zone pairs per vectorized step (bounds temporary arrays)
+    
+    # Live event stream (WebSocket / SSE)
+    EVENT_STREAM_BUFFER_SIZE: int = 256  # messages buffered per slow client
+    EVENT_STREAM_HEARTBEAT: int = 15  # seconds between keep-alives
+
+    # Response compression (gzip, or brotli when installed)
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes; smaller bodies are sent as-is
+    GZIP_COMPRESS_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+    COMPRESSION_LARGE_BODY_SIZE: int = 256 * 1024  # bytes; larger bodies use the fastest level, off the event loop
+
+    # Slow query log
+    SLOW_QUERY_THRESHOLD_MS: float = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+    SLOW_QUERY_BUFFER_SIZE: int = 200  # most recent slow executions kept
+    SLOW_QUERY_MAX_STATEMENTS: int = 500  # distinct normalized statements tracked
+    SLOW_QUERY_LARGE_TABLE_ROWS: int = 10000  # SCANs of tables this big are flagged
+    
     # Events Management
     MAX_PARTICIPANTS_PER_EVENT: int = 100000
+    PARTICIPANT_IMPORT_CHUNK_SIZE: int = 5000  # rows per transaction in bulk imports
+    PARTICIPANT_IMPORT_MAX_BYTES: int = 256 * 1024 * 1024  # largest accepted upload
+    PARTICIPANT_IMPORT_UPLOAD_TIMEOUT: int = 900  # seconds to receive an upload (instead of REQUEST_TIMEOUT)
+    PARTICIPANT_IMPORT_MAX_ERRORS: int = 1000  # per-row errors kept per job (the count is always exact)
+    PARTICIPANT_IMPORT_JOBS_KEPT: int = 100  # finished jobs whose status stays queryable
     DEFAULT_SECURITY_LEVEL: str = "high"
     
     # Performance
     DB_POOL_SIZE: int = 5
     DB_MAX_OVERFLOW: int = 10
-    REQUEST_TIMEOUT: int = 30  # seconds
+    REQUEST_TIMEOUT: int = 30  # seconds, enforced per request (queueing included) by admission control
+    ADMISSION_MAX_CONCURRENCY: int = 64  # requests running at once per worker
+    ADMISSION_CRITICAL_RESERVE: int = 16  # extra slots only "critical" requests may use
+    ADMISSION_QUEUE_SIZE: int = 256  # waiting requests; beyond this they get an immediate 503
+    ADMISSION_CLASS_SHARES: dict = {  # fraction of the slots each priority class may hold
+        "critical": 1.0,
+        "high": 1.0,
+        "normal": 0.75,
+        "low": 0.5,
+    }
+    ADMISSION_RETRY_AFTER: int = 2  # seconds, sent with 503/504 from admission control
+    DB_READ_WORKERS: int = 8  # executor threads for async-route reads
+    DB_WRITE_WORKERS: int = 2  # separate, so ingest never queues behind analytics
 
 # Singleton instance
 settings = Settings()
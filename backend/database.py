@@ -1,178 +1,140 @@
 import sqlite3
 import json
+import logging
+import time
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
+from config import settings
+from cache import stats_cache
+from change_tracker import changes
+from db_pool import get_pool
+from event_hub import hub
+from ingest_queue import IngestQueue
+from metrics import db_function_duration
+from migrations import migrate
+from query_log import TracedConnection, query_log
+from spatial import PointIndex
+
+logger = logging.getLogger(__name__)
 
 DATABASE_PATH = "smart_security.db"
 
 @contextmanager
-def get_db():
-    """Context manager for database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+def get_db(function: str):
+    """Context manager for a pooled, statement-traced connection; the time it is
+    held is recorded under `function` (the data-access function's name)"""
+    start = time.perf_counter()
     try:
-        yield conn
+        with get_pool(DATABASE_PATH).connection() as conn:
+            traced = TracedConnection(conn, query_log)
+            try:
+                yield traced
+            finally:
+                traced.flush()
     finally:
-        conn.close()
+        db_function_duration.observe(('database', function), time.perf_counter() - start)
 
 def init_database():
-    """Initialize database tables"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Events table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                device_id TEXT NOT NULL,
-                type TEXT NOT NULL,
-                level TEXT NOT NULL,
-                status TEXT DEFAULT 'open',
-                home_id TEXT,
-                absher_id TEXT,
-                location TEXT,
-                resolved_at TEXT,
-                resolved_by TEXT,
-                resolution_notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Officers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS officers (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                badge_number TEXT UNIQUE NOT NULL,
-                rank TEXT,
-                phone TEXT,
-                email TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Users table (for authentication)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL,
-                full_name TEXT,
-                email TEXT,
-                officer_id TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                last_login TEXT,
-                FOREIGN KEY (officer_id) REFERENCES officers(id)
-            )
-        ''')
-        
-        # Danger zones table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS danger_zones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                center_lat REAL NOT NULL,
-                center_lng REAL NOT NULL,
-                radius REAL NOT NULL,
-                severity TEXT DEFAULT 'medium',
-                description TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Messages table (for internal communication)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                from_user_id INTEGER,
-                to_user_id INTEGER,
-                to_officer_id TEXT,
-                subject TEXT,
-                body TEXT NOT NULL,
-                is_broadcast BOOLEAN DEFAULT 0,
-                is_read BOOLEAN DEFAULT 0,
-                priority TEXT DEFAULT 'normal',
-                sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                read_at TEXT,
-                FOREIGN KEY (from_user_id) REFERENCES users(id),
-                FOREIGN KEY (to_user_id) REFERENCES users(id),
-                FOREIGN KEY (to_officer_id) REFERENCES officers(id)
-            )
-        ''')
-        
-        # Activity log table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS activity_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action TEXT NOT NULL,
-                entity_type TEXT,
-                entity_id TEXT,
-                details TEXT,
-                ip_address TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-        
-        # Resolutions table (track all resolved issues)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS resolutions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_id INTEGER,
-                device_id TEXT NOT NULL,
-                device_name TEXT,
-                original_type TEXT NOT NULL,
-                original_level TEXT NOT NULL,
-                resolved_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                resolved_by TEXT,
-                resolution_type TEXT,
-                notes TEXT,
-                response_time_seconds INTEGER,
-                FOREIGN KEY (event_id) REFERENCES events(id)
-            )
-        ''')
-        
-        conn.commit()
-        print("✅ Database initialized successfully")
+    """Initialize database tables by applying pending schema migrations"""
+    migrate(DATABASE_PATH)
+    print("✅ Database initialized successfully")
+
+def tables_changed(*tables: str):
+    """Call after committing writes to `tables`: drops cached stats and moves their ETags.
+
+    Never raises: the write is already committed, and a caller that saw an
+    error here (e.g. the ingest queue) would write it again.
+    """
+    try:
+        stats_cache.invalidate(*tables)
+        changes.bump(*tables)
+    except Exception as e:
+        logger.error(f"Post-commit invalidation of {', '.join(tables)} failed: {e}")
 
 # ===== Event Operations =====
 
-def add_event(event_data: Dict[str, Any]) -> int:
-    """Add a new event to the database"""
-    with get_db() as conn:
+INSERT_EVENT_SQL = '''
+    INSERT INTO events (timestamp, device_id, type, level, status, home_id, absher_id, location)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def _event_row(event_data: Dict[str, Any]) -> tuple:
+    """Build the INSERT parameters for one event"""
+    location_json = json.dumps(event_data.get('location')) if event_data.get('location') else None
+    return (
+        event_data.get('timestamp') or datetime.utcnow().isoformat(),
+        event_data['device_id'],
+        event_data['type'],
+        event_data['level'],
+        event_data.get('status') or 'open',
+        event_data.get('home_id'),
+        event_data.get('absher_id'),
+        location_json
+    )
+
+def add_event(event_data: Dict[str, Any]) -> Optional[int]:
+    """Add a new event through the write-behind ingest queue.
+
+    Returns the new id once the group commit lands, or None when
+    INGEST_DURABILITY is "enqueue". Raises IngestQueueFull under backpressure.
+    """
+    # Stamp at submit time so queueing delay never shifts the event time
+    if not event_data.get('timestamp'):
+        event_data = {**event_data, 'timestamp': datetime.utcnow().isoformat()}
+    return event_ingest.submit(event_data)
+
+async def add_event_async(event_data: Dict[str, Any]) -> Optional[int]:
+    """add_event for async endpoints: awaits the group commit without holding a thread"""
+    if not event_data.get('timestamp'):
+        event_data = {**event_data, 'timestamp': datetime.utcnow().isoformat()}
+    return await event_ingest.submit_async(event_data)
+
+def add_events(events: List[Dict[str, Any]]) -> List[int]:
+    """Add many events with one executemany in a single transaction"""
+    if not events:
+        return []
+    
+    rows = [_event_row(event_data) for event_data in events]
+    
+    with get_db('add_events') as conn:
         cursor = conn.cursor()
-        
-        location_json = json.dumps(event_data.get('location')) if event_data.get('location') else None
-        
-        cursor.execute('''
-            INSERT INTO events (timestamp, device_id, type, level, status, home_id, absher_id, location)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            event_data.get('timestamp', datetime.utcnow().isoformat()),
-            event_data['device_id'],
-            event_data['type'],
-            event_data['level'],
-            event_data.get('status', 'open'),
-            event_data.get('home_id'),
-            event_data.get('absher_id'),
-            location_json
-        ))
-        
+        cursor.executemany(INSERT_EVENT_SQL, rows)
+        # executemany leaves lastrowid unset; ids are contiguous inside the write transaction
+        last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
         conn.commit()
-        return cursor.lastrowid
+    
+    first_id = last_id - len(rows) + 1
+    ids = list(range(first_id, last_id + 1))
+    tables_changed('events')
+    
+    if hub.has_subscribers:
+        for event_id, event_data, row in zip(ids, events, rows):
+            hub.publish('event.created', {**event_data, 'id': event_id, 'timestamp': row[0], 'status': row[4]})
+    
+    return ids
+
+event_ingest = IngestQueue(
+    add_events,
+    max_size=settings.INGEST_QUEUE_MAX_SIZE,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval_ms=settings.INGEST_FLUSH_INTERVAL_MS,
+    durability=settings.INGEST_DURABILITY,
+    enqueue_timeout=settings.INGEST_ENQUEUE_TIMEOUT,
+    ack_timeout=settings.REQUEST_TIMEOUT,
+    name="events"
+)
+
+def _decode_event(row) -> Dict:
+    """Row to dict with the JSON location decoded"""
+    event = dict(row)
+    if event['location']:
+        event['location'] = json.loads(event['location'])
+    return event
 
 def get_events(limit: Optional[int] = 1000, status: Optional[str] = None) -> List[Dict]:
     """Get events from database"""
-    with get_db() as conn:
+    with get_db('get_events') as conn:
         cursor = conn.cursor()
         
         query = 'SELECT * FROM events'
@@ -185,29 +147,142 @@ def get_events(limit: Optional[int] = 1000, status: Optional[str] = None) -> Lis
         query += ' ORDER BY timestamp DESC LIMIT ?'
         params.append(limit)
         
+        cursor.execute(query, params)
+        return [_decode_event(row) for row in cursor.fetchall()]
+
+EVENT_FIELDS = (
+    'id', 'timestamp', 'device_id', 'type', 'level', 'status', 'home_id', 'absher_id',
+    'location', 'resolved_at', 'resolved_by', 'resolution_notes', 'created_at', 'change_seq'
+)
+
+def get_events_page(limit: int = 1000, before: Optional[str] = None,
+                    fields: Optional[List[str]] = None, status: Optional[str] = None,
+                    device_id: Optional[str] = None, level: Optional[str] = None,
+                    home_id: Optional[str] = None, start: Optional[str] = None,
+                    end: Optional[str] = None) -> Dict[str, Any]:
+    """One page of events, newest first, with keyset pagination.
+
+    `before` is the "<timestamp>,<id>" cursor returned as `next_before` by the
+    previous page, so every page is an index seek regardless of depth.
+    `fields` limits the selected and returned columns; `start`/`end` bound
+    the timestamp (inclusive/exclusive).
+    """
+    if fields:
+        unknown = [field for field in fields if field not in EVENT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        selected = list(dict.fromkeys(['id', 'timestamp'] + list(fields)))
+    else:
+        fields = list(EVENT_FIELDS)
+        selected = fields
+    
+    conditions = []
+    params: List[Any] = []
+    for column, value in (('status', status), ('device_id', device_id),
+                          ('level', level), ('home_id', home_id)):
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    if start:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    if before:
+        try:
+            before_ts, before_id = before.rsplit(',', 1)
+            before_id = int(before_id)
+        except ValueError:
+            raise ValueError("Invalid cursor, expected '<timestamp>,<id>'")
+        conditions.append('(timestamp, id) < (?, ?)')
+        params += [before_ts, before_id]
+    
+    query = f'SELECT {", ".join(selected)} FROM events'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY timestamp DESC, id DESC LIMIT ?'
+    params.append(limit)
+    
+    with get_db('get_events_page') as conn:
+        cursor = conn.cursor()
         cursor.execute(query, params)
         rows = cursor.fetchall()
+    
+    events = []
+    for row in rows:
+        event = {field: row[field] for field in fields}
+        if event.get('location'):
+            event['location'] = json.loads(event['location'])
+        events.append(event)
+    
+    next_before = None
+    if len(rows) == limit:
+        next_before = f"{rows[-1]['timestamp']},{rows[-1]['id']}"
+    
+    return {
+        'count': len(events),
+        'next_before': next_before,
+        'events': events
+    }
+
+def get_events_since(since: int, limit: int = 1000) -> Dict[str, Any]:
+    """Events inserted or updated after a change cursor (delta feed).
+
+    `since` is the `cursor` from a previous response. A cursor of 0, or one
+    that predates a deletion, gets a reset: the latest `limit` events and a
+    fresh cursor. Clients pass `has_more` results straight back as `since`.
+    """
+    with get_db('get_events_since') as conn:
+        cursor = conn.cursor()
+        
+        # Read the counters first: anything committed after this is re-sent next poll
+        cursor.execute("SELECT name, value FROM change_counters WHERE name IN ('events', 'events_reset')")
+        counters = {row['name']: row['value'] for row in cursor.fetchall()}
+        current = counters.get('events', 0)
+        reset_seq = counters.get('events_reset', 0)
+        
+        if since == current:
+            return {'changed': False, 'cursor': current}
         
-        events = []
-        for row in rows:
-            event = dict(row)
-            if event['location']:
-                event['location'] = json.loads(event['location'])
-            events.append(event)
+        if since <= 0 or since < reset_seq or since > current:
+            return {
+                'changed': True,
+                'reset': True,
+                'cursor': current,
+                'has_more': False,
+                'events': get_events(limit=limit)
+            }
         
-        return events
+        cursor.execute(
+            'SELECT * FROM events WHERE change_seq > ? ORDER BY change_seq LIMIT ?',
+            (since, limit)
+        )
+        events = [_decode_event(row) for row in cursor.fetchall()]
+        has_more = len(events) == limit
+        last_seq = events[-1]['change_seq'] if events else since
+        
+        return {
+            'changed': bool(events),
+            'reset': False,
+            'cursor': last_seq if has_more else max(current, last_seq),
+            'has_more': has_more,
+            'events': events
+        }
 
 def resolve_all_events() -> int:
     """Mark all open events as resolved"""
-    with get_db() as conn:
+    with get_db('resolve_all_events') as conn:
         cursor = conn.cursor()
         cursor.execute('UPDATE events SET status = ? WHERE status = ?', ('resolved', 'open'))
         conn.commit()
+        tables_changed('events')
+        hub.publish('events.resolved', {'count': cursor.rowcount})
         return cursor.rowcount
 
 def update_event(event_id: int, event_data: Dict[str, Any]) -> bool:
     """Update an existing event"""
-    with get_db() as conn:
+    with get_db('update_event') as conn:
         cursor = conn.cursor()
         
         location_json = json.dumps(event_data.get('location')) if event_data.get('location') else None
@@ -236,19 +311,24 @@ def update_event(event_id: int, event_data: Dict[str, Any]) -> bool:
         ))
         
         conn.commit()
+        if cursor.rowcount > 0:
+            tables_changed('events')
+            hub.publish('event.updated', {**event_data, 'id': event_id})
         return cursor.rowcount > 0
 
 def delete_all_events() -> bool:
     """Delete all events"""
-    with get_db() as conn:
+    with get_db('delete_all_events') as conn:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM events')
         conn.commit()
+        tables_changed('events')
+        hub.publish('events.reset', {})
         return True
 
 def add_resolution(resolution_data: Dict[str, Any]) -> int:
     """Add a resolution record"""
-    with get_db() as conn:
+    with get_db('add_resolution') as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO resolutions 
@@ -267,11 +347,13 @@ def add_resolution(resolution_data: Dict[str, Any]) -> int:
             resolution_data.get('response_time_seconds')
         ))
         conn.commit()
+        tables_changed('resolutions')
+        hub.publish('resolution.created', {**resolution_data, 'id': cursor.lastrowid})
         return cursor.lastrowid
 
 def get_resolutions(limit: int = 100) -> List[Dict]:
     """Get recent resolutions"""
-    with get_db() as conn:
+    with get_db('get_resolutions') as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT * FROM resolutions 
@@ -283,7 +365,7 @@ def get_resolutions(limit: int = 100) -> List[Dict]:
 
 def get_resolution_stats() -> Dict[str, Any]:
     """Get resolution statistics"""
-    with get_db() as conn:
+    with get_db('get_resolution_stats') as conn:
         cursor = conn.cursor()
         
         # Total resolutions
@@ -321,7 +403,7 @@ def get_resolution_stats() -> Dict[str, Any]:
 
 def add_officer(officer_data: Dict[str, Any]) -> str:
     """Add a new officer"""
-    with get_db() as conn:
+    with get_db('add_officer') as conn:
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO officers (id, name, badge_number, rank, phone, email)
@@ -335,66 +417,183 @@ def add_officer(officer_data: Dict[str, Any]) -> str:
             officer_data.get('email')
         ))
         conn.commit()
+        tables_changed('officers')
         return officer_data['id']
 
 def get_officers() -> List[Dict]:
     """Get all officers"""
-    with get_db() as conn:
+    with get_db('get_officers') as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM officers WHERE status = ?', ('active',))
         return [dict(row) for row in cursor.fetchall()]
 
 def get_officer(officer_id: str) -> Optional[Dict]:
     """Get single officer"""
-    with get_db() as conn:
+    with get_db('get_officer') as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM officers WHERE id = ?', (officer_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
 
+# ===== Officer Positions =====
+
+def _load_officer_positions() -> List[tuple]:
+    """Saved officer positions as (officer_id, lat, lng, row) for the in-memory index"""
+    with get_db('_load_officer_positions') as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM officer_positions')
+        return [(row['officer_id'], row['latitude'], row['longitude'], dict(row)) for row in cursor.fetchall()]
+
+# Last-known officer positions, indexed on a grid for radius/bbox lookups
+officer_positions = PointIndex(_load_officer_positions)
+
+def update_officer_position(officer_id: str, position: Dict[str, Any]) -> bool:
+    """Save an officer's last-known position; False when a newer one is already stored"""
+    row = {
+        'officer_id': officer_id,
+        'latitude': position['latitude'],
+        'longitude': position['longitude'],
+        'accuracy': position.get('accuracy'),
+        'timestamp': position.get('timestamp') or datetime.utcnow().isoformat(),
+    }
+    current = officer_positions.get(officer_id)
+    if current is not None and current['timestamp'] > row['timestamp']:
+        return False
+    
+    with get_db('update_officer_position') as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO officer_positions (officer_id, latitude, longitude, accuracy, timestamp)
+            VALUES (:officer_id, :latitude, :longitude, :accuracy, :timestamp)
+            ON CONFLICT (officer_id) DO UPDATE SET
+                latitude = excluded.latitude, longitude = excluded.longitude,
+                accuracy = excluded.accuracy, timestamp = excluded.timestamp
+            WHERE excluded.timestamp >= officer_positions.timestamp
+        ''', row)
+        updated = cursor.rowcount > 0
+        conn.commit()
+    
+    if updated:
+        officer_positions.set(officer_id, row['latitude'], row['longitude'], row)
+        tables_changed('officer_positions')
+    return updated
+
+def get_officer_positions(bbox: Optional[tuple] = None) -> List[Dict]:
+    """Last-known officer positions, optionally inside bbox (min_lng, min_lat, max_lng, max_lat)"""
+    if bbox is None:
+        return officer_positions.all()
+    return officer_positions.within_bbox(*bbox)
+
+def get_officers_near(lat: float, lng: float, radius_m: float, limit: Optional[int] = None) -> List[Dict]:
+    """Officers within radius_m meters of (lat, lng), nearest first"""
+    return [
+        {**position, 'distance_m': round(distance, 1)}
+        for distance, position in officer_positions.within_radius(lat, lng, radius_m, limit)
+    ]
+
+# ===== Danger Zones =====
+
+DANGER_ZONE_FIELDS = ('name', 'center_lat', 'center_lng', 'radius', 'severity', 'description', 'is_active')
+
+def add_danger_zone(zone_data: Dict[str, Any]) -> int:
+    """Add a danger zone (circle of `radius` meters)"""
+    with get_db('add_danger_zone') as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO danger_zones (name, center_lat, center_lng, radius, severity, description, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            zone_data['name'],
+            zone_data['center_lat'],
+            zone_data['center_lng'],
+            zone_data['radius'],
+            zone_data.get('severity') or 'medium',
+            zone_data.get('description'),
+            zone_data.get('is_active', True)
+        ))
+        zone_id = cursor.lastrowid
+        conn.commit()
+    tables_changed('danger_zones')
+    return zone_id
+
+def get_danger_zones(active_only: bool = False) -> List[Dict]:
+    """Get danger zones"""
+    with get_db('get_danger_zones') as conn:
+        cursor = conn.cursor()
+        if active_only:
+            cursor.execute('SELECT * FROM danger_zones WHERE is_active = 1 ORDER BY id')
+        else:
+            cursor.execute('SELECT * FROM danger_zones ORDER BY id')
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_danger_zone(zone_id: int) -> Optional[Dict]:
+    """Get single danger zone"""
+    with get_db('get_danger_zone') as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM danger_zones WHERE id = ?', (zone_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def update_danger_zone(zone_id: int, zone_data: Dict[str, Any]) -> bool:
+    """Update the given fields of a danger zone"""
+    fields = [field for field in DANGER_ZONE_FIELDS if field in zone_data]
+    if not fields:
+        return get_danger_zone(zone_id) is not None
+    
+    with get_db('update_danger_zone') as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"UPDATE danger_zones SET {', '.join(f'{field} = ?' for field in fields)}, "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            [zone_data[field] for field in fields] + [zone_id]
+        )
+        updated = cursor.rowcount > 0
+        conn.commit()
+    if updated:
+        tables_changed('danger_zones')
+    return updated
+
+def delete_danger_zone(zone_id: int) -> bool:
+    """Delete a danger zone"""
+    with get_db('delete_danger_zone') as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM danger_zones WHERE id = ?', (zone_id,))
+        deleted = cursor.rowcount > 0
+        conn.commit()
+    if deleted:
+        tables_changed('danger_zones')
+    return deleted
+
 # ===== Statistics =====
 
 def get_statistics() -> Dict:
-    """Get system statistics"""
-    with get_db() as conn:
+    """Get system statistics from the trigger-maintained counters (O(1) in event count)"""
+    with get_db('get_statistics') as conn:
         cursor = conn.cursor()
         
-        # Total events
-        cursor.execute('SELECT COUNT(*) as count FROM events')
-        total_events = cursor.fetchone()['count']
-        
-        # Events by level
-        cursor.execute('''
-            SELECT level, COUNT(*) as count 
-            FROM events 
-            GROUP BY level
-        ''')
-        events_by_level = {row['level']: row['count'] for row in cursor.fetchall()}
-        
-        # Events by status
-        cursor.execute('''
-            SELECT status, COUNT(*) as count 
-            FROM events 
-            GROUP BY status
-        ''')
-        events_by_status = {row['status']: row['count'] for row in cursor.fetchall()}
+        # Totals by level / status
+        cursor.execute('SELECT dimension, key, count FROM event_counters WHERE count != 0')
+        counters = {'total': {}, 'level': {}, 'status': {}}
+        for row in cursor.fetchall():
+            counters[row['dimension']][row['key']] = row['count']
+        total_events = counters['total'].get('all', 0)
         
         # Active officers
         cursor.execute('SELECT COUNT(*) as count FROM officers WHERE status = ?', ('active',))
         total_officers = cursor.fetchone()['count']
         
-        # Recent events (last 24 hours)
+        # Recent events (last 24 hours, minute buckets)
         cursor.execute('''
-            SELECT COUNT(*) as count 
-            FROM events 
-            WHERE datetime(timestamp) >= datetime('now', '-1 day')
+            SELECT COALESCE(SUM(count), 0) as count 
+            FROM event_minute_buckets 
+            WHERE minute >= strftime('%Y-%m-%d %H:%M', 'now', '-1 day')
         ''')
         recent_events = cursor.fetchone()['count']
         
         return {
             'total_events': total_events,
-            'events_by_level': events_by_level,
-            'events_by_status': events_by_status,
+            'events_by_level': counters['level'],
+            'events_by_status': counters['status'],
             'total_officers': total_officers,
             'recent_events_24h': recent_events
         }
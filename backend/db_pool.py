@@ -0,0 +1,159 @@
+"""
+SQLite Connection Pool
+مجمع اتصالات قاعدة البيانات
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from config import settings
+
+# Pragmas applied once per physical connection
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # readers never block the writer
+    "PRAGMA synchronous=NORMAL",      # safe with WAL, one fsync per checkpoint
+    "PRAGMA cache_size=-16000",       # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",     # 256 MB memory-mapped reads
+    "PRAGMA busy_timeout=5000",       # wait for locks instead of failing
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionPool:
+    """مجمع اتصالات SQLite محدود الحجم مع إعادة استخدام الاتصال داخل نفس الـ thread"""
+
+    def __init__(self, db_path: str,
+                 pool_size: int = settings.DB_POOL_SIZE,
+                 max_overflow: int = settings.DB_MAX_OVERFLOW,
+                 timeout: float = settings.REQUEST_TIMEOUT):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._slots = threading.BoundedSemaphore(pool_size + max_overflow)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new physical connection with the tuned pragmas"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection, waiting up to `timeout` seconds for a free slot"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(
+                f"Connection pool exhausted ({self.pool_size + self.max_overflow} connections in use)"
+            )
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool; overflow connections are closed"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager for a pooled connection.
+
+        Nested calls on the same thread reuse the connection already checked
+        out, so helpers that call each other never hold two slots.
+        """
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        conn = self.acquire()
+        local.conn = conn
+        local.depth = 1
+        try:
+            yield conn
+        finally:
+            local.conn = None
+            local.depth = 0
+            self.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current pool usage"""
+        with self._lock:
+            return {
+                'db_path': self.db_path,
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+            }
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Shared pool per database file"""
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                _pools[db_path] = pool
+    return pool
+
+
+def all_pool_stats() -> List[Dict[str, Any]]:
+    """Usage of every pool (for /metrics)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_all_pools():
+    """Close idle connections of every pool"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
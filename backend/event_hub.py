@@ -0,0 +1,117 @@
+"""
+Live Event Hub
+موزع الأحداث اللحظية (WebSocket / Server-Sent Events)
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Set
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """مشترك واحد مع مخزن مؤقت محدود الحجم"""
+
+    def __init__(self, filters: Dict[str, str], buffer_size: int):
+        self.filters = filters
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def matches(self, topic: str, data: Dict[str, Any]) -> bool:
+        """Filters apply only to keys the message carries; bulk notices reach everyone"""
+        for key, expected in self.filters.items():
+            if key == 'topics':
+                if not any(topic.startswith(prefix) for prefix in expected.split(',')):
+                    return False
+            elif key in data and str(data[key]) != expected:
+                return False
+        return True
+
+    def offer(self, message: str):
+        """Enqueue without blocking; a slow consumer loses its oldest messages"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            self.dropped += 1
+
+    async def get(self, timeout: float) -> Optional[str]:
+        """Next message, or None after `timeout` seconds (heartbeat)"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """نشر الأحداث لجميع المشتركين مرة واحدة بدلاً من استطلاع كل عميل"""
+
+    def __init__(self, buffer_size: int = settings.EVENT_STREAM_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.published = 0
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, **filters: Any) -> Subscriber:
+        """Register a subscriber; must be called from the event loop"""
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(
+            {key: str(value) for key, value in filters.items() if value is not None},
+            self.buffer_size
+        )
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, topic: str, data: Dict[str, Any]):
+        """Thread-safe publish; serializes once and fans out on the event loop.
+
+        Never raises: publishers call this after committing, and live
+        notifications are best effort.
+        """
+        if not self._subscribers or self._loop is None:
+            return
+        try:
+            message = json.dumps({'topic': topic, 'data': data}, default=str)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Could not publish {topic}: {e}")
+            return
+        self.published += 1
+        try:
+            self._loop.call_soon_threadsafe(self._fan_out, topic, data, message)
+        except RuntimeError:
+            # Event loop already closed (shutdown)
+            pass
+
+    def _fan_out(self, topic: str, data: Dict[str, Any], message: str):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.matches(topic, data):
+                subscriber.offer(message)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'published': self.published,
+            'dropped': sum(subscriber.dropped for subscriber in subscribers),
+        }
+
+
+hub = EventHub()
@@ -8,10 +8,34 @@
 - تتبع المشاركين والموقع الجغرافي
 """
 
+import logging
 import sqlite3
-from datetime import datetime, timedelta
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any
 import json
+from change_tracker import changes
+from db_pool import get_pool
+from config import settings
+from event_hub import hub
+from geofence import GeofenceEngine
+from ingest_queue import IngestQueue
+from metrics import db_function_duration
+from migrations import migrate
+from positions import PositionStore
+from query_log import TracedConnection, query_log
+from spatial import haversine_m
+
+logger = logging.getLogger(__name__)
+
+def location_timestamp(value: Optional[datetime] = None) -> str:
+    """وقت UTC بصيغة CURRENT_TIMESTAMP في SQLite (مع أجزاء الألف من الثانية) ليُرتَّب السجل نصياً"""
+    if value is None:
+        value = datetime.utcnow()
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
 
 class EventsManagementDB:
     """قاعدة بيانات إدارة الفعاليات والأحداث الموسمية"""
@@ -19,208 +43,38 @@ class EventsManagementDB:
     def __init__(self, db_path: str = "smart_security.db"):
         self.db_path = db_path
         self.init_events_tables()
-    
-    def get_connection(self):
-        """الحصول على اتصال قاعدة البيانات"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        self.positions = PositionStore(self.load_positions, self.save_positions)
+        self.geofence = GeofenceEngine(
+            self.load_danger_zones, self.log_security_alerts,
+            seed_fn=self.load_positions, version_fn=lambda: changes.version('danger_zones')
+        )
+        self._next_history_index = 0.0
+    
+    @contextmanager
+    def get_connection(self, function: str):
+        """الحصول على اتصال قاعدة البيانات من المجمع المشترك (يُسجَّل زمنه باسم الدالة `function`)"""
+        start = time.perf_counter()
+        try:
+            with get_pool(self.db_path).connection() as conn:
+                traced = TracedConnection(conn, query_log)
+                try:
+                    yield traced
+                finally:
+                    traced.flush()
+        finally:
+            db_function_duration.observe(('events_management', function), time.perf_counter() - start)
     
     def init_events_tables(self):
-        """إنشء جداول الفعاليات والأحداث"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # جدول الفعاليات الموسمية
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS seasonal_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_name TEXT NOT NULL,
-                event_type TEXT NOT NULL,
-                description TEXT,
-                start_date DATETIME NOT NULL,
-                end_date DATETIME NOT NULL,
-                location_lat REAL,
-                location_lng REAL,
-                location_name TEXT,
-                max_participants INTEGER,
-                current_participants INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'planned',
-                security_level TEXT DEFAULT 'high',
-                requires_biometric BOOLEAN DEFAULT 1,
-                requires_iot_device BOOLEAN DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # جدول أجهزة IoT والأساور الذكية
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS iot_devices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                device_id TEXT UNIQUE NOT NULL,
-                device_type TEXT NOT NULL,
-                device_name TEXT NOT NULL,
-                participant_id TEXT NOT NULL,
-                event_id INTEGER NOT NULL,
-                battery_level REAL DEFAULT 100,
-                is_active BOOLEAN DEFAULT 1,
-                signal_strength REAL,
-                last_sync DATETIME,
-                firmware_version TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
-            )
-        ''')
-        
-        # جدول المشاركين في الفعاليات
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS event_participants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                participant_id TEXT UNIQUE NOT NULL,
-                event_id INTEGER NOT NULL,
-                full_name TEXT NOT NULL,
-                national_id TEXT,
-                passport_number TEXT,
-                phone TEXT,
-                email TEXT,
-                age INTEGER,
-                gender TEXT,
-                registration_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'registered',
-                verification_status TEXT DEFAULT 'pending',
-                access_level TEXT DEFAULT 'basic',
-                is_verified BOOLEAN DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
-            )
-        ''')
-        
-        # جدول البيانات البيومترية
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS biometric_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                participant_id TEXT NOT NULL,
-                event_id INTEGER NOT NULL,
-                fingerprint_hash TEXT,
-                facial_recognition_data TEXT,
-                iris_scan_data TEXT,
-                voice_recognition_data TEXT,
-                verification_time DATETIME,
-                verification_status TEXT DEFAULT 'pending',
-                confidence_score REAL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
-            )
-        ''')
-        
-        # جدول تتبع الدخول والخروج
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS access_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                participant_id TEXT NOT NULL,
-                event_id INTEGER NOT NULL,
-                device_id TEXT,
-                access_type TEXT,
-                entry_time DATETIME,
-                exit_time DATETIME,
-                entry_location_lat REAL,
-                entry_location_lng REAL,
-                exit_location_lat REAL,
-                exit_location_lng REAL,
-                access_point TEXT,
-                status TEXT DEFAULT 'active',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
-            )
-        ''')
-        
-        # جدول تتبع الموقع الجغرافي
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS location_tracking (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                participant_id TEXT NOT NULL,
-                event_id INTEGER NOT NULL,
-                device_id TEXT,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                accuracy REAL,
-                altitude REAL,
-                speed REAL,
-                heading REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
-            )
-        ''')
-        
-        # جدول التنبيهات الأمنية
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS security_alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_id INTEGER NOT NULL,
-                participant_id TEXT,
-                device_id TEXT,
-                alert_type TEXT NOT NULL,
-                severity TEXT DEFAULT 'medium',
-                description TEXT,
-                location_lat REAL,
-                location_lng REAL,
-                action_taken TEXT,
-                resolved BOOLEAN DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                resolved_at DATETIME,
-                FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
-            )
-        ''')
-        
-        # جدول محاولات الدخول المزيفة
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fraud_attempts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_id INTEGER NOT NULL,
-                participant_id TEXT,
-                device_id TEXT,
-                attempt_type TEXT NOT NULL,
-                details TEXT,
-                location_lat REAL,
-                location_lng REAL,
-                ip_address TEXT,
-                user_agent TEXT,
-                severity TEXT DEFAULT 'high',
-                action_taken TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # جدول معرفات الدخول الشخصية
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS access_credentials (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                participant_id TEXT NOT NULL,
-                event_id INTEGER NOT NULL,
-                credential_type TEXT NOT NULL,
-                credential_data TEXT NOT NULL,
-                qr_code TEXT,
-                nfc_uid TEXT,
-                expiry_date DATETIME,
-                is_active BOOLEAN DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        """إنشاء جداول الفعاليات والأحداث عبر ترحيلات المخطط"""
+        migrate(self.db_path)
     
     # ===== عمليات الفعاليات =====
     
     def create_event(self, event_data: Dict[str, Any]) -> int:
         """إنشاء فعالية جديدة"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('create_event') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 INSERT INTO seasonal_events 
                 (event_name, event_type, description, start_date, end_date, 
@@ -245,86 +99,79 @@ class EventsManagementDB:
             
             event_id = cursor.lastrowid
             conn.commit()
+            changes.bump('seasonal_events')
             return event_id
-        finally:
-            conn.close()
     
     def get_event(self, event_id: int) -> Dict[str, Any]:
         """الحصول على بيانات الفعالية"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM seasonal_events WHERE id = ?
-        ''', (event_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        return dict(row) if row else None
+        with self.get_connection('get_event') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM seasonal_events WHERE id = ?
+            ''', (event_id,))
+            
+            row = cursor.fetchone()
+            
+            return dict(row) if row else None
     
     def list_events(self, status: str = None, event_type: str = None) -> List[Dict[str, Any]]:
         """قائمة الفعاليات"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        query = 'SELECT * FROM seasonal_events WHERE 1=1'
-        params = []
-        
-        if status:
-            query += ' AND status = ?'
-            params.append(status)
-        
-        if event_type:
-            query += ' AND event_type = ?'
-            params.append(event_type)
-        
-        query += ' ORDER BY start_date DESC'
-        
-        cursor.execute(query, params)
-        events = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return events
+        with self.get_connection('list_events') as conn:
+            cursor = conn.cursor()
+            
+            query = 'SELECT * FROM seasonal_events WHERE 1=1'
+            params = []
+            
+            if status:
+                query += ' AND status = ?'
+                params.append(status)
+            
+            if event_type:
+                query += ' AND event_type = ?'
+                params.append(event_type)
+            
+            query += ' ORDER BY start_date DESC'
+            
+            cursor.execute(query, params)
+            events = [dict(row) for row in cursor.fetchall()]
+            
+            return events
     
     def update_event(self, event_id: int, event_data: Dict[str, Any]) -> bool:
         """تحديث بيانات الفعالية"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        allowed_fields = ['event_name', 'description', 'end_date', 'status', 'security_level']
-        updates = []
-        params = []
-        
-        for field in allowed_fields:
-            if field in event_data:
-                updates.append(f'{field} = ?')
-                params.append(event_data[field])
-        
-        if not updates:
-            conn.close()
-            return False
-        
-        updates.append('updated_at = CURRENT_TIMESTAMP')
-        params.append(event_id)
-        
-        query = f'UPDATE seasonal_events SET {", ".join(updates)} WHERE id = ?'
-        
-        try:
+        with self.get_connection('update_event') as conn:
+            cursor = conn.cursor()
+            
+            allowed_fields = ['event_name', 'description', 'end_date', 'status', 'security_level']
+            updates = []
+            params = []
+            
+            for field in allowed_fields:
+                if field in event_data:
+                    updates.append(f'{field} = ?')
+                    params.append(event_data[field])
+            
+            if not updates:
+                return False
+            
+            updates.append('updated_at = CURRENT_TIMESTAMP')
+            params.append(event_id)
+            
+            query = f'UPDATE seasonal_events SET {", ".join(updates)} WHERE id = ?'
+            
             cursor.execute(query, params)
             conn.commit()
+            changes.bump('seasonal_events')
             return True
-        finally:
-            conn.close()
     
     # ===== عمليات أجهزة IoT =====
     
     def register_iot_device(self, device_data: Dict[str, Any]) -> int:
         """تسجيل جهاز IoT جديد"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('register_iot_device') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 INSERT INTO iot_devices 
                 (device_id, device_type, device_name, participant_id, event_id, 
@@ -342,16 +189,14 @@ class EventsManagementDB:
             
             device_record_id = cursor.lastrowid
             conn.commit()
+            changes.bump('iot_devices')
             return device_record_id
-        finally:
-            conn.close()
     
     def update_device_status(self, device_id: str, status_data: Dict[str, Any]) -> bool:
         """تحديث حالة جهاز IoT"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('update_device_status') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 UPDATE iot_devices 
                 SET battery_level = ?, signal_strength = ?, last_sync = CURRENT_TIMESTAMP
@@ -363,32 +208,44 @@ class EventsManagementDB:
             ))
             
             conn.commit()
+            changes.bump('iot_devices')
             return cursor.rowcount > 0
-        finally:
-            conn.close()
     
     def get_iot_device(self, device_id: str) -> Dict[str, Any]:
         """الحصول على بيانات جهاز IoT"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM iot_devices WHERE device_id = ?
-        ''', (device_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        return dict(row) if row else None
+        with self.get_connection('get_iot_device') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM iot_devices WHERE device_id = ?
+            ''', (device_id,))
+            
+            row = cursor.fetchone()
+            
+            return dict(row) if row else None
+    
+    def get_device_participants(self, event_id: int, device_ids: List[str]) -> Dict[str, str]:
+        """المشارك المرتبط بكل جهاز (للنقاط المرسلة بمعرف الجهاز فقط)"""
+        owners = {}
+        with self.get_connection('get_device_participants') as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(device_ids), 500):
+                chunk = device_ids[start:start + 500]
+                cursor.execute(
+                    'SELECT device_id, participant_id FROM iot_devices WHERE event_id = ? AND device_id IN (%s)'
+                    % ','.join('?' * len(chunk)),
+                    [event_id] + chunk
+                )
+                owners.update((row['device_id'], row['participant_id']) for row in cursor.fetchall())
+        return owners
     
     # ===== عمليات المشاركين =====
     
     def register_participant(self, participant_data: Dict[str, Any]) -> str:
         """تسجيل مشارك جديد في الفعالية"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('register_participant') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 INSERT INTO event_participants 
                 (participant_id, event_id, full_name, national_id, passport_number, 
@@ -409,31 +266,108 @@ class EventsManagementDB:
             
             participant_id = participant_data.get('participant_id')
             conn.commit()
+            changes.bump('event_participants')
             return participant_id
-        finally:
-            conn.close()
     
+    def register_participants(self, event_id: int, participants: List[Dict[str, Any]]) -> List[str]:
+        """تسجيل دفعة من المشاركين في معاملة واحدة
+
+        Returns the participant_ids that were already registered (and skipped).
+        """
+        ids = [participant['participant_id'] for participant in participants]
+        with self.get_connection('register_participants') as conn:
+            cursor = conn.cursor()
+            # Hold the write lock from the lookup to the commit: a concurrent import
+            # cannot insert in between, so every id is counted once, here or there
+            if not conn.in_transaction:
+                cursor.execute('BEGIN IMMEDIATE')
+
+            existing = set()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(
+                    'SELECT participant_id FROM event_participants WHERE participant_id IN (%s)'
+                    % ','.join('?' * len(chunk)),
+                    chunk
+                )
+                existing.update(row[0] for row in cursor.fetchall())
+
+            cursor.executemany('''
+                INSERT OR IGNORE INTO event_participants
+                (participant_id, event_id, full_name, national_id, passport_number,
+                 phone, email, age, gender, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (
+                    participant['participant_id'],
+                    event_id,
+                    participant.get('full_name'),
+                    participant.get('national_id'),
+                    participant.get('passport_number'),
+                    participant.get('phone'),
+                    participant.get('email'),
+                    participant.get('age'),
+                    participant.get('gender'),
+                    participant.get('status', 'registered')
+                )
+                for participant in participants if participant['participant_id'] not in existing
+            ])
+
+            conn.commit()
+            changes.bump('event_participants')
+            return [participant_id for participant_id in ids if participant_id in existing]
+
+    def save_import_job(self, job: Dict[str, Any], keep: int):
+        """حفظ حالة مهمة استيراد (مع حذف المهام المنتهية الأقدم من آخر `keep` مهمة)"""
+        with self.get_connection('save_import_job') as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO participant_import_jobs (job_id, event_id, status, state, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (job['job_id'], job['event_id'], job['status'], json.dumps(job), time.time()))
+            if job['status'] in ('completed', 'failed'):
+                cursor.execute('''
+                    DELETE FROM participant_import_jobs
+                    WHERE status IN ('completed', 'failed') AND job_id NOT IN (
+                        SELECT job_id FROM participant_import_jobs ORDER BY updated_at DESC LIMIT ?
+                    )
+                ''', (keep,))
+            conn.commit()
+
+    def get_import_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """آخر حالة محفوظة لمهمة استيراد"""
+        with self.get_connection('get_import_job') as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT state FROM participant_import_jobs WHERE job_id = ?', (job_id,))
+            row = cursor.fetchone()
+            return json.loads(row[0]) if row else None
+
+    def count_event_participants(self, event_id: int) -> int:
+        """عدد مشاركي الفعالية"""
+        with self.get_connection('count_event_participants') as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM event_participants WHERE event_id = ?', (event_id,))
+            return cursor.fetchone()[0]
+
     def get_participant(self, participant_id: str, event_id: int) -> Dict[str, Any]:
         """الحصول على بيانات المشارك"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM event_participants 
-            WHERE participant_id = ? AND event_id = ?
-        ''', (participant_id, event_id))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        return dict(row) if row else None
+        with self.get_connection('get_participant') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM event_participants 
+                WHERE participant_id = ? AND event_id = ?
+            ''', (participant_id, event_id))
+            
+            row = cursor.fetchone()
+            
+            return dict(row) if row else None
     
     def verify_participant(self, participant_id: str, event_id: int, verification_status: str = 'verified') -> bool:
         """التحقق من بيانات المشارك"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('verify_participant') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 UPDATE event_participants 
                 SET verification_status = ?, is_verified = 1
@@ -441,38 +375,35 @@ class EventsManagementDB:
             ''', (verification_status, participant_id, event_id))
             
             conn.commit()
+            changes.bump('event_participants')
             return cursor.rowcount > 0
-        finally:
-            conn.close()
     
     def list_event_participants(self, event_id: int, status: str = None) -> List[Dict[str, Any]]:
         """قائمة مشاركي الفعالية"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        query = 'SELECT * FROM event_participants WHERE event_id = ?'
-        params = [event_id]
-        
-        if status:
-            query += ' AND status = ?'
-            params.append(status)
-        
-        query += ' ORDER BY registration_date DESC'
-        
-        cursor.execute(query, params)
-        participants = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return participants
+        with self.get_connection('list_event_participants') as conn:
+            cursor = conn.cursor()
+            
+            query = 'SELECT * FROM event_participants WHERE event_id = ?'
+            params = [event_id]
+            
+            if status:
+                query += ' AND status = ?'
+                params.append(status)
+            
+            query += ' ORDER BY registration_date DESC'
+            
+            cursor.execute(query, params)
+            participants = [dict(row) for row in cursor.fetchall()]
+            
+            return participants
     
     # ===== عمليات البيانات البيومترية =====
     
     def register_biometric(self, biometric_data: Dict[str, Any]) -> int:
         """تسجيل البيانات البيومترية للمشارك"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('register_biometric') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 INSERT INTO biometric_data 
                 (participant_id, event_id, fingerprint_hash, facial_recognition_data, 
@@ -491,16 +422,14 @@ class EventsManagementDB:
             
             biometric_id = cursor.lastrowid
             conn.commit()
+            changes.bump('biometric_data')
             return biometric_id
-        finally:
-            conn.close()
     
     def verify_biometric(self, participant_id: str, event_id: int, confidence_score: float) -> bool:
         """التحقق من البيانات البيومترية"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('verify_biometric') as conn:
+            cursor = conn.cursor()
+            
             status = 'verified' if confidence_score > 0.85 else 'failed'
             
             cursor.execute('''
@@ -510,18 +439,16 @@ class EventsManagementDB:
             ''', (status, confidence_score, participant_id, event_id))
             
             conn.commit()
+            changes.bump('biometric_data')
             return status == 'verified'
-        finally:
-            conn.close()
     
     # ===== عمليات تتبع الدخول =====
     
     def log_access(self, access_data: Dict[str, Any]) -> int:
         """تسجيل محاولة دخول أو خروج"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('log_access') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 INSERT INTO access_logs 
                 (participant_id, event_id, device_id, access_type, entry_time,
@@ -541,16 +468,14 @@ class EventsManagementDB:
             
             access_log_id = cursor.lastrowid
             conn.commit()
+            changes.bump('access_logs')
             return access_log_id
-        finally:
-            conn.close()
     
     def log_exit(self, access_log_id: int, exit_data: Dict[str, Any]) -> bool:
         """تسجيل الخروج"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('log_exit') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 UPDATE access_logs 
                 SET exit_time = ?, exit_location_lat = ?, exit_location_lng = ?, status = 'completed'
@@ -563,95 +488,274 @@ class EventsManagementDB:
             ))
             
             conn.commit()
+            changes.bump('access_logs')
             return cursor.rowcount > 0
-        finally:
-            conn.close()
     
     # ===== عمليات تتبع الموقع =====
     
     def track_location(self, location_data: Dict[str, Any]) -> int:
         """تتبع موقع المشارك"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        return self.track_locations([location_data])[0]
+    
+    def track_locations(self, locations: List[Dict[str, Any]]) -> List[int]:
+        """حفظ دفعة من المواقع في معاملة واحدة وتحديث آخر موقع لكل مشارك
+
+        History rows go to location_tracking; the in-memory last-known
+        positions are updated after commit and saved to participant_positions
+        by their own periodic writer. Returns the location_tracking ids in
+        input order.
+        """
+        if not locations:
+            return []
+        
+        rows = []
+        latest: Dict[int, list] = {}
+        for location in locations:
+            timestamp = location.get('timestamp') or location_timestamp()
+            row = (
+                location.get('participant_id'),
+                location.get('event_id'),
+                location.get('device_id'),
+                location.get('latitude'),
+                location.get('longitude'),
+                location.get('accuracy'),
+                location.get('altitude'),
+                location.get('speed'),
+                location.get('heading'),
+                timestamp
+            )
+            rows.append(row)
+            participant_id, event_id, device_id, latitude, longitude, accuracy, _, speed, heading, _ = row
+            latest.setdefault(event_id, []).append(
+                (participant_id, device_id, latitude, longitude, accuracy, speed, heading, timestamp)
+            )
         
-        try:
-            cursor.execute('''
+        with self.get_connection('track_locations') as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
                 INSERT INTO location_tracking 
                 (participant_id, event_id, device_id, latitude, longitude, 
-                 accuracy, altitude, speed, heading)
+                 accuracy, altitude, speed, heading, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            # ids are contiguous inside the write transaction
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+            if time.monotonic() >= self._next_history_index:
+                self._index_location_history(cursor)
+                self._next_history_index = time.monotonic() + settings.LOCATION_HISTORY_INDEX_INTERVAL
+            
+            conn.commit()
+        
+        # Committed: nothing below may raise, or the ingest queue would write the rows again
+        try:
+            changes.bump('location_tracking')
+        except Exception as e:
+            logger.error(f"Post-commit invalidation of location_tracking failed: {e}")
+        for event_id, fixes in latest.items():
+            try:
+                changed = self.positions.update(event_id, fixes)
+                self.geofence.evaluate(event_id, changed)
+            except Exception as e:
+                logger.error(f"Position update failed for event {event_id}: {e}")
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+    
+    def _index_location_history(self, cursor):
+        """إضافة المواقع غير المفهرسة إلى location_segments: مقطع واحد لكل مشارك
+
+        Runs inside the caller's write transaction, so concurrent writers
+        never index the same rows twice.
+        """
+        cursor.execute('''
+            INSERT INTO location_segments
+            (min_lat, max_lat, min_lng, max_lng, event_id, participant_id, start_time, end_time, first_id, last_id)
+            SELECT MIN(latitude), MAX(latitude), MIN(longitude), MAX(longitude), event_id, participant_id,
+                   MIN(timestamp), MAX(timestamp), MIN(id), MAX(id)
+            FROM location_tracking
+            WHERE id > (SELECT last_id FROM spatial_index_state WHERE name = 'location_tracking')
+            GROUP BY event_id, participant_id
+        ''')
+        cursor.execute('''
+            UPDATE spatial_index_state SET last_id = (SELECT COALESCE(MAX(id), 0) FROM location_tracking)
+            WHERE name = 'location_tracking'
+        ''')
+    
+    def load_positions(self, event_id: int) -> List[tuple]:
+        """آخر المواقع المحفوظة للفعالية (بترتيب positions.FIELDS)"""
+        with self.get_connection('load_positions') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT participant_id, device_id, latitude, longitude, accuracy, speed, heading, timestamp
+                FROM participant_positions WHERE event_id = ?
+                ORDER BY timestamp
+            ''', (event_id,))
+            
+            return [tuple(row) for row in cursor.fetchall()]
+    
+    def save_positions(self, event_id: int, positions: List[tuple]):
+        """حفظ آخر المواقع (لا يُستبدل موقع أحدث بموقع أقدم)"""
+        with self.get_connection('save_positions') as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
+                INSERT INTO participant_positions
+                (event_id, participant_id, device_id, latitude, longitude, accuracy, speed, heading, timestamp)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                location_data.get('participant_id'),
-                location_data.get('event_id'),
-                location_data.get('device_id'),
-                location_data.get('latitude'),
-                location_data.get('longitude'),
-                location_data.get('accuracy'),
-                location_data.get('altitude'),
-                location_data.get('speed'),
-                location_data.get('heading')
-            ))
+                ON CONFLICT (event_id, participant_id) DO UPDATE SET
+                    device_id = excluded.device_id, latitude = excluded.latitude,
+                    longitude = excluded.longitude, accuracy = excluded.accuracy,
+                    speed = excluded.speed, heading = excluded.heading, timestamp = excluded.timestamp
+                WHERE excluded.timestamp >= participant_positions.timestamp
+            ''', [(event_id,) + tuple(position) for position in positions])
             
-            location_id = cursor.lastrowid
             conn.commit()
-            return location_id
-        finally:
-            conn.close()
     
     def get_participant_location_history(self, participant_id: str, event_id: int, 
                                         limit: int = 100) -> List[Dict[str, Any]]:
         """الحصول على سجل مواقع المشارك"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM location_tracking 
-            WHERE participant_id = ? AND event_id = ?
-            ORDER BY timestamp DESC LIMIT ?
-        ''', (participant_id, event_id, limit))
-        
-        locations = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return locations
+        with self.get_connection('get_participant_location_history') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM location_tracking 
+                WHERE participant_id = ? AND event_id = ?
+                ORDER BY timestamp DESC LIMIT ?
+            ''', (participant_id, event_id, limit))
+            
+            locations = [dict(row) for row in cursor.fetchall()]
+            
+            return locations
+    
+    def get_locations_in_area(self, event_id: int, bbox: tuple, start: str = None, end: str = None,
+                              center: tuple = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """سجل المواقع داخل مستطيل (min_lng, min_lat, max_lng, max_lat) أو دائرة، الأحدث أولاً
+
+        Indexed history is found through the location_segments R*Tree (each
+        hit is a participant's track segment, read back from location_tracking
+        by its index); rows written since the last indexing pass are scanned
+        directly. With `center` as (lat, lng, radius_m) rows outside that
+        circle are dropped.
+        """
+        min_lng, min_lat, max_lng, max_lat = bbox
+        area = [min_lat, max_lat, min_lng, max_lng]
+        period = ''
+        period_params = []
+        if start:
+            period += ' AND lt.timestamp >= ?'
+            period_params.append(start)
+        if end:
+            period += ' AND lt.timestamp <= ?'
+            period_params.append(end)
+        segment_period = ''
+        segment_params = []
+        if start:
+            segment_period += ' AND s.end_time >= ?'
+            segment_params.append(start)
+        if end:
+            segment_period += ' AND s.start_time <= ?'
+            segment_params.append(end)
+        
+        query = f'''
+            SELECT lt.* FROM location_segments s
+            JOIN location_tracking lt
+              ON lt.participant_id = s.participant_id AND lt.event_id = s.event_id
+             AND lt.timestamp BETWEEN s.start_time AND s.end_time
+             AND lt.id BETWEEN s.first_id AND s.last_id
+            WHERE s.max_lat >= ? AND s.min_lat <= ? AND s.max_lng >= ? AND s.min_lng <= ?
+              AND s.event_id = ?{segment_period}
+              AND lt.latitude BETWEEN ? AND ? AND lt.longitude BETWEEN ? AND ?{period}
+            UNION ALL
+            SELECT lt.* FROM location_tracking lt
+            WHERE lt.id > (SELECT last_id FROM spatial_index_state WHERE name = 'location_tracking')
+              AND lt.event_id = ?
+              AND lt.latitude BETWEEN ? AND ? AND lt.longitude BETWEEN ? AND ?{period}
+            ORDER BY timestamp DESC, id DESC
+        '''
+        params = (
+            [min_lat, max_lat, min_lng, max_lng, event_id] + segment_params + area + period_params
+            + [event_id] + area + period_params
+        )
+        if center is None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        
+        with self.get_connection('get_locations_in_area') as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            
+            if center is None:
+                return [dict(row) for row in cursor.fetchall()]
+            
+            lat, lng, radius_m = center
+            locations = []
+            for row in cursor:
+                distance = haversine_m(lat, lng, row['latitude'], row['longitude'])
+                if distance <= radius_m:
+                    locations.append({**dict(row), 'distance_m': round(distance, 1)})
+                    if len(locations) >= limit:
+                        break
+            return locations
     
     # ===== عمليات الأمان والتنبيهات =====
     
     def log_security_alert(self, alert_data: Dict[str, Any]) -> int:
         """تسجيل تنبيه أمني"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
+        return self.log_security_alerts([alert_data])[0]
+    
+    def log_security_alerts(self, alerts: List[Dict[str, Any]]) -> List[int]:
+        """تسجيل دفعة من التنبيهات الأمنية في معاملة واحدة"""
+        if not alerts:
+            return []
+        
+        rows = [(
+            alert_data.get('event_id'),
+            alert_data.get('participant_id'),
+            alert_data.get('device_id'),
+            alert_data.get('alert_type'),
+            alert_data.get('severity', 'medium'),
+            alert_data.get('description'),
+            alert_data.get('location_lat'),
+            alert_data.get('location_lng'),
+            alert_data.get('action_taken')
+        ) for alert_data in alerts]
+        
+        with self.get_connection('log_security_alerts') as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
                 INSERT INTO security_alerts 
                 (event_id, participant_id, device_id, alert_type, severity, 
                  description, location_lat, location_lng, action_taken)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                alert_data.get('event_id'),
-                alert_data.get('participant_id'),
-                alert_data.get('device_id'),
-                alert_data.get('alert_type'),
-                alert_data.get('severity', 'medium'),
-                alert_data.get('description'),
-                alert_data.get('location_lat'),
-                alert_data.get('location_lng'),
-                alert_data.get('action_taken')
-            ))
+            ''', rows)
+            last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
             
-            alert_id = cursor.lastrowid
             conn.commit()
-            return alert_id
-        finally:
-            conn.close()
+            changes.bump('security_alerts')
+        
+        alert_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+        for alert_id, alert_data in zip(alert_ids, alerts):
+            hub.publish('security_alert.created', {**alert_data, 'id': alert_id})
+        return alert_ids
+    
+    def load_danger_zones(self) -> List[Dict[str, Any]]:
+        """مناطق الخطر النشطة (لمحرك السياج الجغرافي)"""
+        with self.get_connection('load_danger_zones') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id, name, center_lat, center_lng, radius, severity
+                FROM danger_zones WHERE is_active = 1
+            ''')
+            
+            return [dict(row) for row in cursor.fetchall()]
     
     def log_fraud_attempt(self, fraud_data: Dict[str, Any]) -> int:
         """تسجيل محاولة احتيال أو دخول مزيف"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('log_fraud_attempt') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 INSERT INTO fraud_attempts 
                 (event_id, participant_id, device_id, attempt_type, details,
@@ -673,34 +777,31 @@ class EventsManagementDB:
             
             fraud_id = cursor.lastrowid
             conn.commit()
+            changes.bump('fraud_attempts')
             return fraud_id
-        finally:
-            conn.close()
     
     def get_active_alerts(self, event_id: int) -> List[Dict[str, Any]]:
         """الحصول على التنبيهات النشطة"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM security_alerts 
-            WHERE event_id = ? AND resolved = 0
-            ORDER BY created_at DESC
-        ''', (event_id,))
-        
-        alerts = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return alerts
+        with self.get_connection('get_active_alerts') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM security_alerts 
+                WHERE event_id = ? AND resolved = 0
+                ORDER BY created_at DESC
+            ''', (event_id,))
+            
+            alerts = [dict(row) for row in cursor.fetchall()]
+            
+            return alerts
     
     # ===== عمليات معرفات الدخول =====
     
     def create_access_credential(self, credential_data: Dict[str, Any]) -> int:
         """إنشاء معرف دخول للمشارك"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        with self.get_connection('create_access_credential') as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
                 INSERT INTO access_credentials 
                 (participant_id, event_id, credential_type, credential_data, 
@@ -718,109 +819,115 @@ class EventsManagementDB:
             
             credential_id = cursor.lastrowid
             conn.commit()
+            changes.bump('access_credentials')
             return credential_id
-        finally:
-            conn.close()
     
     def verify_credential(self, credential_data: str, event_id: int) -> Dict[str, Any]:
         """التحقق من معرف الدخول"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT ac.*, ep.full_name, ep.participant_id, ep.verification_status
-            FROM access_credentials ac
-            JOIN event_participants ep ON ac.participant_id = ep.participant_id
-            WHERE (ac.qr_code = ? OR ac.nfc_uid = ? OR ac.credential_data = ?)
-            AND ac.event_id = ? AND ac.is_active = 1
-            AND (ac.expiry_date IS NULL OR ac.expiry_date > CURRENT_TIMESTAMP)
-        ''', (credential_data, credential_data, credential_data, event_id))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        return dict(row) if row else None
+        with self.get_connection('verify_credential') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT ac.*, ep.full_name, ep.participant_id, ep.verification_status
+                FROM access_credentials ac
+                JOIN event_participants ep ON ac.participant_id = ep.participant_id
+                WHERE (ac.qr_code = ? OR ac.nfc_uid = ? OR ac.credential_data = ?)
+                AND ac.event_id = ? AND ac.is_active = 1
+                AND (ac.expiry_date IS NULL OR ac.expiry_date > CURRENT_TIMESTAMP)
+            ''', (credential_data, credential_data, credential_data, event_id))
+            
+            row = cursor.fetchone()
+            
+            return dict(row) if row else None
     
     # ===== التقارير والإحصائيات =====
     
     def get_event_statistics(self, event_id: int) -> Dict[str, Any]:
         """الحصول على إحصائيات الفعالية"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # إجمالي المشاركين
-        cursor.execute('SELECT COUNT(*) as total FROM event_participants WHERE event_id = ?', (event_id,))
-        total_participants = cursor.fetchone()['total']
-        
-        # المشاركين المتحققين
-        cursor.execute('SELECT COUNT(*) as total FROM event_participants WHERE event_id = ? AND is_verified = 1', 
-                      (event_id,))
-        verified_participants = cursor.fetchone()['total']
-        
-        # أجهزة IoT النشطة
-        cursor.execute('SELECT COUNT(*) as total FROM iot_devices WHERE event_id = ? AND is_active = 1', 
-                      (event_id,))
-        active_devices = cursor.fetchone()['total']
-        
-        # التنبيهات النشطة
-        cursor.execute('SELECT COUNT(*) as total FROM security_alerts WHERE event_id = ? AND resolved = 0', 
-                      (event_id,))
-        active_alerts = cursor.fetchone()['total']
-        
-        # محاولات الاحتيال
-        cursor.execute('SELECT COUNT(*) as total FROM fraud_attempts WHERE event_id = ?', (event_id,))
-        fraud_attempts = cursor.fetchone()['total']
-        
-        # المشاركين الحاليين
-        cursor.execute('''
-            SELECT COUNT(*) as total FROM access_logs 
-            WHERE event_id = ? AND status = 'active'
-        ''', (event_id,))
-        current_participants_onsite = cursor.fetchone()['total']
-        
-        conn.close()
-        
-        return {
-            'total_participants': total_participants,
-            'verified_participants': verified_participants,
-            'active_devices': active_devices,
-            'active_alerts': active_alerts,
-            'fraud_attempts': fraud_attempts,
-            'current_participants_onsite': current_participants_onsite,
-            'verification_rate': (verified_participants / total_participants * 100) if total_participants > 0 else 0
-        }
+        with self.get_connection('get_event_statistics') as conn:
+            cursor = conn.cursor()
+            
+            # إجمالي المشاركين
+            cursor.execute('SELECT COUNT(*) as total FROM event_participants WHERE event_id = ?', (event_id,))
+            total_participants = cursor.fetchone()['total']
+            
+            # المشاركين المتحققين
+            cursor.execute('SELECT COUNT(*) as total FROM event_participants WHERE event_id = ? AND is_verified = 1', 
+                          (event_id,))
+            verified_participants = cursor.fetchone()['total']
+            
+            # أجهزة IoT النشطة
+            cursor.execute('SELECT COUNT(*) as total FROM iot_devices WHERE event_id = ? AND is_active = 1', 
+                          (event_id,))
+            active_devices = cursor.fetchone()['total']
+            
+            # التنبيهات النشطة
+            cursor.execute('SELECT COUNT(*) as total FROM security_alerts WHERE event_id = ? AND resolved = 0', 
+                          (event_id,))
+            active_alerts = cursor.fetchone()['total']
+            
+            # محاولات الاحتيال
+            cursor.execute('SELECT COUNT(*) as total FROM fraud_attempts WHERE event_id = ?', (event_id,))
+            fraud_attempts = cursor.fetchone()['total']
+            
+            # المشاركين الحاليين
+            cursor.execute('''
+                SELECT COUNT(*) as total FROM access_logs 
+                WHERE event_id = ? AND status = 'active'
+            ''', (event_id,))
+            current_participants_onsite = cursor.fetchone()['total']
+            
+            return {
+                'total_participants': total_participants,
+                'verified_participants': verified_participants,
+                'active_devices': active_devices,
+                'active_alerts': active_alerts,
+                'fraud_attempts': fraud_attempts,
+                'current_participants_onsite': current_participants_onsite,
+                'verification_rate': (verified_participants / total_participants * 100) if total_participants > 0 else 0
+            }
     
     def get_fraud_report(self, event_id: int, limit: int = 100) -> List[Dict[str, Any]]:
         """تقرير محاولات الاحتيال"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM fraud_attempts 
-            WHERE event_id = ?
-            ORDER BY created_at DESC LIMIT ?
-        ''', (event_id, limit))
-        
-        frauds = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return frauds
+        with self.get_connection('get_fraud_report') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM fraud_attempts 
+                WHERE event_id = ?
+                ORDER BY created_at DESC LIMIT ?
+            ''', (event_id, limit))
+            
+            frauds = [dict(row) for row in cursor.fetchall()]
+            
+            return frauds
     
     def get_security_report(self, event_id: int, limit: int = 100) -> List[Dict[str, Any]]:
         """تقرير الأمان والتنبيهات"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM security_alerts 
-            WHERE event_id = ?
-            ORDER BY created_at DESC LIMIT ?
-        ''', (event_id, limit))
-        
-        alerts = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return alerts
+        with self.get_connection('get_security_report') as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM security_alerts 
+                WHERE event_id = ?
+                ORDER BY created_at DESC LIMIT ?
+            ''', (event_id, limit))
+            
+            alerts = [dict(row) for row in cursor.fetchall()]
+            
+            return alerts
 
 # إنشاء instance عام للاستخدام
 events_db = EventsManagementDB()
+
+# طابور المواقع: تُجمع نقاط التتبع وتُحفظ في معاملات كبيرة
+location_ingest = IngestQueue(
+    events_db.track_locations,
+    max_size=settings.LOCATION_INGEST_QUEUE_MAX_SIZE,
+    batch_size=settings.LOCATION_INGEST_BATCH_SIZE,
+    flush_interval_ms=settings.LOCATION_INGEST_FLUSH_INTERVAL_MS,
+    durability=settings.LOCATION_INGEST_DURABILITY,
+    enqueue_timeout=settings.INGEST_ENQUEUE_TIMEOUT,
+    ack_timeout=settings.REQUEST_TIMEOUT,
+    name="locations"
+)
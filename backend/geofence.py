@@ -0,0 +1,251 @@
+"""
+Geofence Engine
+محرك السياج الجغرافي: رصد دخول المشاركين إلى مناطق الخطر وخروجهم منها
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence
+
+from config import settings
+from positions import FIELDS
+from spatial import EARTH_RADIUS_M, METERS_PER_DEGREE, haversine_m
+
+try:
+    import numpy as np
+except ImportError:  # optional: without it zones are checked one fix at a time
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_PARTICIPANT, _DEVICE, _LAT, _LNG = (FIELDS.index(name) for name in ('participant_id', 'device_id', 'latitude', 'longitude'))
+_NOWHERE: FrozenSet[int] = frozenset()
+_fallback_logged = False  # the pure-Python fallback is reported once per process
+
+
+class ZoneSet:
+    """مناطق الخطر النشطة مرتبة حسب خط العرض، جاهزة للحساب المتجه
+
+    A fix can only be inside zones whose center latitude is within the
+    largest radius of its own, so fixes are sorted by latitude and each
+    chunk is compared with that band of zones only. Within the band, pairs
+    whose latitude or longitude gap alone rules them out are dropped; the
+    haversine test then runs on the pairs that are left.
+    """
+
+    def __init__(self, zones: List[Dict[str, Any]]):
+        zones = sorted(zones, key=lambda zone: zone['center_lat'])
+        self.zones = zones
+        self.ids = [zone['id'] for zone in zones]
+        self.by_id = {zone['id']: zone for zone in zones}
+        self.lats = [zone['center_lat'] for zone in zones]
+        self.lngs = [zone['center_lng'] for zone in zones]
+        self.radii = [zone['radius'] for zone in zones]
+        self.margin = max(self.radii, default=0.0) / METERS_PER_DEGREE
+        if np is not None:
+            lats = np.radians(np.asarray(self.lats, dtype=np.float64))
+            angles = np.asarray(self.radii, dtype=np.float64) / EARTH_RADIUS_M
+            self._lat_deg = np.asarray(self.lats, dtype=np.float64)
+            self._lat = lats
+            self._lng = np.radians(np.asarray(self.lngs, dtype=np.float64))
+            self._cos = np.cos(lats)
+            self._angle = angles
+            # inside <=> haversine term a <= sin^2(radius / 2R): no sqrt or asin per pair
+            self._threshold = np.sin(angles / 2) ** 2
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def locate(self, lats: Sequence[float], lngs: Sequence[float]) -> Dict[int, List[int]]:
+        """Positions (index into lats/lngs) that fall in any zone -> indexes of those zones"""
+        if not self.ids or not lats:
+            return {}
+        if np is None:
+            return self._locate_python(lats, lngs)
+        return self._locate_numpy(np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64))
+
+    def _locate_numpy(self, lat_deg, lng_deg) -> Dict[int, List[int]]:
+        order = np.argsort(lat_deg, kind='stable')
+        lat = np.radians(lat_deg)
+        lng = np.radians(lng_deg)
+        cos = np.cos(lat)
+        chunk = max(64, settings.GEOFENCE_MAX_PAIRS_PER_CHUNK // len(self.ids))
+        hits: Dict[int, List[int]] = {}
+
+        for start in range(0, len(order), chunk):
+            rows = order[start:start + chunk]
+            lo = int(np.searchsorted(self._lat_deg, lat_deg[rows[0]] - self.margin, side='left'))
+            hi = int(np.searchsorted(self._lat_deg, lat_deg[rows[-1]] + self.margin, side='right'))
+            if lo >= hi:
+                continue
+            angle = self._angle[None, lo:hi]
+            # Cheap necessary conditions first: the great-circle distance is
+            # at least the latitude gap, and at least 2/pi * cos(lat) of the
+            # longitude gap for the smallest cos(lat) involved
+            lng_slack = (np.pi / 2) / max(min(cos[rows].min(), self._cos[lo:hi].min()), 1e-6)
+            near = np.abs(lat[rows, None] - self._lat[None, lo:hi]) <= angle
+            near &= np.abs(lng[rows, None] - self._lng[None, lo:hi]) <= angle * lng_slack
+            fix, zone = np.nonzero(near)
+            if not len(fix):
+                continue
+            fix = rows[fix]
+            zone = zone + lo
+            a = (np.sin((lat[fix] - self._lat[zone]) / 2) ** 2
+                 + cos[fix] * self._cos[zone] * np.sin((lng[fix] - self._lng[zone]) / 2) ** 2)
+            inside = a <= self._threshold[zone]
+            for i, z in zip(fix[inside].tolist(), zone[inside].tolist()):
+                hits.setdefault(i, []).append(z)
+        return hits
+
+    def _locate_python(self, lats: Sequence[float], lngs: Sequence[float]) -> Dict[int, List[int]]:
+        hits: Dict[int, List[int]] = {}
+        zone_lats, zone_lngs, radii = self.lats, self.lngs, self.radii
+        for i, (lat, lng) in enumerate(zip(lats, lngs)):
+            lo = bisect.bisect_left(zone_lats, lat - self.margin)
+            hi = bisect.bisect_right(zone_lats, lat + self.margin, lo)
+            for z in range(lo, hi):
+                if abs(lat - zone_lats[z]) * METERS_PER_DEGREE <= radii[z] \
+                        and haversine_m(lat, lng, zone_lats[z], zone_lngs[z]) <= radii[z]:
+                    hits.setdefault(i, []).append(z)
+        return hits
+
+
+class GeofenceEngine:
+    """يقيّم كل دفعة مواقع مقابل جميع مناطق الخطر ويسجّل تنبيهات الدخول والخروج
+
+    Zones come from `load_fn()` (active danger_zones rows) and are reloaded
+    whenever `version_fn()` changes, so zone CRUD from any worker takes
+    effect on the next batch. The engine remembers which zones each
+    participant is in, per event: an alert is written only when that set
+    changes, through `alert_fn(alerts)`. The first time an event is seen its
+    state is rebuilt silently from `seed_fn(event_id)` (saved last-known
+    positions), so a restart does not re-alert everyone already inside.
+    """
+
+    def __init__(self, load_fn: Callable[[], List[Dict[str, Any]]],
+                 alert_fn: Callable[[List[Dict[str, Any]]], Any],
+                 seed_fn: Optional[Callable[[int], List[Sequence]]] = None,
+                 version_fn: Optional[Callable[[], Any]] = None):
+        self.load_fn = load_fn
+        self.alert_fn = alert_fn
+        self.seed_fn = seed_fn
+        self.version_fn = version_fn
+        self._zones: Optional[ZoneSet] = None
+        self._version = None
+        self._inside: Dict[int, Dict[str, FrozenSet[int]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'evaluated': 0, 'alerts': 0, 'last_batch_ms': 0.0, 'max_batch_ms': 0.0}
+        global _fallback_logged
+        if np is None and not _fallback_logged:
+            _fallback_logged = True
+            logger.warning("numpy is not installed: geofence checks run in pure Python, one fix at a time")
+
+    def reload(self) -> int:
+        """Load the active zones again; returns how many there are"""
+        version = self.version_fn() if self.version_fn else None
+        zones = ZoneSet(self.load_fn())
+        with self._lock:
+            self._zones = zones
+            self._version = version
+            # Zones that are gone (or deactivated) end silently
+            known = set(zones.ids)
+            for inside in self._inside.values():
+                for participant_id, zone_ids in list(inside.items()):
+                    if not zone_ids <= known:
+                        zone_ids = zone_ids & known
+                        if zone_ids:
+                            inside[participant_id] = zone_ids
+                        else:
+                            del inside[participant_id]
+        logger.info(f"Geofence loaded {len(zones)} active danger zones")
+        return len(zones)
+
+    def _current_zones(self) -> ZoneSet:
+        if self._zones is None or (self.version_fn and self.version_fn() != self._version):
+            self.reload()
+        return self._zones
+
+    def _transitions(self, event_id: int, zones: ZoneSet, fixes: Sequence[Sequence],
+                     alerts: Optional[List[Dict[str, Any]]]):
+        """Update per-participant state from fixes (in order), collecting alerts when given a list"""
+        hits = zones.locate([fix[_LAT] for fix in fixes], [fix[_LNG] for fix in fixes])
+        ids = zones.ids
+        with self._lock:
+            inside = self._inside.setdefault(event_id, {})
+            for i, fix in enumerate(fixes):
+                participant_id = fix[_PARTICIPANT]
+                current = inside.get(participant_id, _NOWHERE)
+                found = hits.get(i)
+                now = frozenset(ids[z] for z in found) if found else _NOWHERE
+                if now == current:
+                    continue
+                if now:
+                    inside[participant_id] = now
+                else:
+                    del inside[participant_id]
+                if alerts is None:
+                    continue
+                for zone_id in now - current:
+                    alerts.append(self._alert(event_id, fix, zones.by_id[zone_id], entered=True))
+                for zone_id in current - now:
+                    zone = zones.by_id.get(zone_id)  # None if a reload raced this batch
+                    if zone is not None:
+                        alerts.append(self._alert(event_id, fix, zone, entered=False))
+
+    @staticmethod
+    def _alert(event_id: int, fix: Sequence, zone: Dict[str, Any], entered: bool) -> Dict[str, Any]:
+        if entered:
+            alert_type, severity = 'geofence_enter', zone.get('severity') or 'medium'
+            description = f"دخول منطقة خطر: {zone['name']} (#{zone['id']})"
+        else:
+            alert_type, severity = 'geofence_exit', 'low'
+            description = f"خروج من منطقة خطر: {zone['name']} (#{zone['id']})"
+        return {
+            'event_id': event_id,
+            'participant_id': fix[_PARTICIPANT],
+            'device_id': fix[_DEVICE],
+            'alert_type': alert_type,
+            'severity': severity,
+            'description': description,
+            'location_lat': fix[_LAT],
+            'location_lng': fix[_LNG],
+            'zone_id': zone['id'],
+        }
+
+    def evaluate(self, event_id: int, fixes: Sequence[Sequence]) -> int:
+        """Check fixes laid out as positions.FIELDS, oldest first; returns the alerts written"""
+        if not fixes:
+            return 0
+        start = time.perf_counter()
+        zones = self._current_zones()
+        if not len(zones):
+            return 0
+        if event_id not in self._inside and self.seed_fn is not None:
+            self._transitions(event_id, zones, self.seed_fn(event_id), None)
+
+        alerts: List[Dict[str, Any]] = []
+        self._transitions(event_id, zones, fixes, alerts)
+        if alerts:
+            try:
+                self.alert_fn(alerts)
+            except Exception as e:
+                logger.error(f"Writing {len(alerts)} geofence alerts failed: {e}")
+                alerts = []
+
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['evaluated'] += len(fixes)
+            self._stats['alerts'] += len(alerts)
+            self._stats['last_batch_ms'] = elapsed
+            self._stats['max_batch_ms'] = max(self._stats['max_batch_ms'], elapsed)
+        return len(alerts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': 'numpy' if np is not None else 'python',
+                'zones': len(self._zones) if self._zones is not None else 0,
+                'participants_inside': sum(len(inside) for inside in self._inside.values()),
+                **self._stats,
+            }
@@ -0,0 +1,275 @@
+"""
+Write-Behind Ingest Queue
+طابور إدخال الأحداث مع الحفظ الجماعي (Group Commit)
+"""
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_COMMIT = "commit"    # ack after the row is committed (returns the new id)
+DURABILITY_ENQUEUE = "enqueue"  # ack as soon as the row is queued (returns None)
+
+
+class IngestQueueFull(Exception):
+    """The ingest queue stayed full for the whole enqueue timeout"""
+
+
+def _resolve(future: Optional[Future], result: Any = None, error: Optional[BaseException] = None):
+    """Ack a queued item; a future its waiter already gave up on is left alone"""
+    if future is None or future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:  # cancelled between done() and here
+        pass
+
+
+class _BatchQueue(queue.Queue):
+    """queue.Queue that can also take a batch all-or-nothing"""
+
+    def put_many_nowait(self, entries: List[Any]):
+        """Queue every entry, or none of them (raises queue.Full) if they do not all fit"""
+        with self.not_full:
+            if self.maxsize > 0 and self._qsize() + len(entries) > self.maxsize:
+                raise queue.Full
+            for entry in entries:
+                self._put(entry)
+            self.unfinished_tasks += len(entries)
+            self.not_empty.notify(len(entries))
+
+
+class IngestQueue:
+    """طابور في الذاكرة يجمع الإدخالات ويحفظها كمعاملة واحدة
+
+    Producers call submit(); a single background writer drains up to
+    `batch_size` items or whatever arrived within `flush_interval_ms`
+    of the first one, and hands them to `flush_fn` as one list.
+    `flush_fn` must return one id per item, in order.
+    """
+
+    IDLE_GAP = 0.002  # seconds without a new item that ends a collection window
+
+    def __init__(self, flush_fn: Callable[[List[Any]], List[int]],
+                 max_size: int = 10000,
+                 batch_size: int = 500,
+                 flush_interval_ms: int = 20,
+                 durability: str = DURABILITY_COMMIT,
+                 enqueue_timeout: float = 1.0,
+                 ack_timeout: float = 30.0,
+                 name: str = "ingest"):
+        if durability not in (DURABILITY_COMMIT, DURABILITY_ENQUEUE):
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.durability = durability
+        self.enqueue_timeout = enqueue_timeout
+        self.ack_timeout = ack_timeout
+        self.name = name
+        self._queue = _BatchQueue(maxsize=max_size)
+        self._writer = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'committed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+        }
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run, name=f"{self.name}-writer", daemon=True
+                )
+                self._writer.start()
+                atexit.register(self.stop)
+
+    def _put(self, item: Any, block: bool) -> Optional[Future]:
+        """Enqueue one item; returns its ack future in commit mode, else None"""
+        self._ensure_writer()
+        future = Future() if self.durability == DURABILITY_COMMIT else None
+        try:
+            if block:
+                self._queue.put((item, future), timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait((item, future))
+        except queue.Full:
+            if block:
+                with self._stats_lock:
+                    self._stats['rejected'] += 1
+                raise IngestQueueFull(f"{self.name} queue is full ({self._queue.maxsize} items)")
+            raise
+
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+        return future
+
+    def submit(self, item: Any) -> Optional[int]:
+        """Queue one item; in commit mode wait for and return its id"""
+        future = self._put(item, block=True)
+        if future is None:
+            return None
+        return future.result(timeout=self.ack_timeout)
+
+    async def submit_async(self, item: Any) -> Optional[int]:
+        """submit() for the event loop: neither the enqueue nor the ack wait holds a thread"""
+        deadline = time.monotonic() + self.enqueue_timeout
+        while True:
+            try:
+                future = self._put(item, block=False)
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    with self._stats_lock:
+                        self._stats['rejected'] += 1
+                    raise IngestQueueFull(f"{self.name} queue is full ({self._queue.maxsize} items)")
+                await asyncio.sleep(self.flush_interval)
+
+        if future is None:
+            return None
+        # The item is queued and will be written: a caller that times out or is
+        # cancelled stops waiting, but must not cancel the item's future
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=self.ack_timeout)
+
+    async def submit_many_async(self, items: List[Any]) -> List[Optional[int]]:
+        """Queue a batch all-or-nothing (waiting up to enqueue_timeout for room);
+        in commit mode await every id, in order"""
+        self._ensure_writer()
+        futures = [Future() if self.durability == DURABILITY_COMMIT else None for _ in items]
+        entries = list(zip(items, futures))
+        deadline = time.monotonic() + self.enqueue_timeout
+        while True:
+            try:
+                self._queue.put_many_nowait(entries)
+                break
+            except queue.Full:
+                if len(items) > self._queue.maxsize or time.monotonic() >= deadline:
+                    with self._stats_lock:
+                        self._stats['rejected'] += len(items)
+                    raise IngestQueueFull(f"{self.name} queue cannot take {len(items)} more items")
+                await asyncio.sleep(self.flush_interval)
+
+        with self._stats_lock:
+            self._stats['enqueued'] += len(items)
+        if self.durability != DURABILITY_COMMIT:
+            return [None] * len(items)
+        # As in submit_async: giving up must not cancel items already queued
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.gather(*(asyncio.wrap_future(future) for future in futures))),
+            timeout=self.ack_timeout
+        )
+
+    def _drain(self) -> List[tuple]:
+        """Block for the first item, then keep collecting while items keep arriving.
+
+        Collection stops at `batch_size`, at the `flush_interval_ms` window,
+        or once the queue stays idle for IDLE_GAP - so a lone caller is not
+        held for the whole window while bursts still coalesce.
+        """
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, self.IDLE_GAP)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[tuple]):
+        items = [item for item, _ in batch]
+        start = time.perf_counter()
+        try:
+            ids = self.flush_fn(items)
+        except Exception as e:
+            # One bad row must not fail the whole group: retry item by item
+            logger.warning(f"{self.name} group commit of {len(items)} items failed ({e}); retrying individually")
+            self._flush_individually(batch)
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        for (_, future), item_id in zip(batch, ids):
+            _resolve(future, item_id)
+
+        with self._stats_lock:
+            stats = self._stats
+            stats['committed'] += len(items)
+            stats['batches'] += 1
+            stats['last_batch_size'] = len(items)
+            stats['last_commit_ms'] = elapsed_ms
+            stats['max_commit_ms'] = max(stats['max_commit_ms'], elapsed_ms)
+            stats['total_commit_ms'] += elapsed_ms
+
+    def _flush_individually(self, batch: List[tuple]):
+        for item, future in batch:
+            try:
+                item_id = self.flush_fn([item])[0]
+            except Exception as e:
+                logger.error(f"{self.name} dropped item after failed commit: {e}")
+                with self._stats_lock:
+                    self._stats['failed'] += 1
+                _resolve(future, error=e)
+                continue
+            with self._stats_lock:
+                self._stats['committed'] += 1
+            _resolve(future, item_id)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = []
+            try:
+                batch = self._drain()
+                if batch:
+                    self._flush(batch)
+            except Exception as e:
+                # The writer is the only consumer: it must outlive any one batch
+                logger.exception(f"{self.name} writer error: {e}")
+                for _, future in batch:
+                    _resolve(future, error=e)
+
+    def stop(self, timeout: float = 5.0):
+        """Flush everything still queued and stop the writer"""
+        self._stopping.set()
+        if self._writer is not None:
+            self._writer.join(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and commit latency metrics"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats.pop('batches')
+        total_ms = stats.pop('total_commit_ms')
+        stats.update({
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'durability': self.durability,
+            'batches': batches,
+            'avg_commit_ms': round(total_ms / batches, 3) if batches else 0.0,
+        })
+        return stats
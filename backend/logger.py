@@ -2,24 +2,85 @@
 Logging Configuration
 نظام تسجيل الأحداث المحترف
 """
+import atexit
+import json
 import logging
+import queue
+import random
 import sys
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from config import settings
 
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """سجل JSON منظم في سطر واحد"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is counted and dropped"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render message and traceback now (args may not outlive the call), keep extras
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_queue_handler = None
+_listener = None
+_sample_lock = threading.Lock()
+_sampled_out = 0
+
 def setup_logging():
-    """Setup application logging"""
+    """Setup application logging.
+    
+    Handlers (console + rotating files) run on a QueueListener thread; the
+    root logger only gets a non-blocking QueueHandler, so logging from the
+    request path never does file I/O or waits on a rotation lock.
+    """
+    global _queue_handler, _listener
     
     # Create logs directory if not exists
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
     
-    # Create formatter
+    # Create formatters
     formatter = logging.Formatter(
         settings.LOG_FORMAT,
         datefmt='%Y-%m-%d %H:%M:%S'
     )
+    json_formatter = JsonFormatter()
     
     # Root logger
     logger = logging.getLogger()
@@ -28,8 +89,7 @@ def setup_logging():
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    console_handler.setFormatter(json_formatter if settings.LOG_CONSOLE_JSON else formatter)
     
     # File handler (rotating)
     file_handler = RotatingFileHandler(
@@ -39,8 +99,7 @@ def setup_logging():
         encoding='utf-8'
     )
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    file_handler.setFormatter(json_formatter)
     
     # Error file handler
     error_handler = RotatingFileHandler(
@@ -50,8 +109,18 @@ def setup_logging():
         encoding='utf-8'
     )
     error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
+    error_handler.setFormatter(json_formatter)
+    
+    # Queue in front of all handlers
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    logger.addHandler(_queue_handler)
+    _listener = QueueListener(
+        log_queue, console_handler, file_handler, error_handler,
+        respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
     
     return logger
 
@@ -59,9 +128,22 @@ def setup_logging():
 logger = setup_logging()
 
 def log_api_call(endpoint: str, method: str, status_code: int, duration: float):
-    """Log API call details"""
+    """Log API call details (successful calls on high-volume routes are sampled)"""
+    global _sampled_out
+    sample_rate = settings.LOG_SAMPLE_RATES.get(f"{method} {endpoint}", 1.0)
+    if status_code < 400 and sample_rate < 1.0 and random.random() >= sample_rate:
+        with _sample_lock:
+            _sampled_out += 1
+        return
     logger.info(
-        f"API Call - {method} {endpoint} - Status: {status_code} - Duration: {duration:.3f}s"
+        "API Call - %s %s - Status: %s - Duration: %.3fs", method, endpoint, status_code, duration,
+        extra={
+            "endpoint": endpoint,
+            "method": method,
+            "status_code": status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "sample_rate": sample_rate,
+        }
     )
 
 def log_error(error: Exception, context: str = ""):
@@ -75,3 +157,12 @@ def log_security_event(event_type: str, user_id: int = None, details: str = ""):
 def log_database_operation(operation: str, table: str, affected_rows: int = 0):
     """Log database operations"""
     logger.debug(f"DB Operation - {operation} on {table} - Affected rows: {affected_rows}")
+
+def get_logging_stats() -> dict:
+    """Queue depth, dropped records and sampled-out API calls"""
+    return {
+        "queue_depth": _queue_handler.queue.qsize(),
+        "queue_capacity": _queue_handler.queue.maxsize,
+        "dropped": _queue_handler.dropped,
+        "sampled_out": _sampled_out,
+    }
@@ -1,43 +1,145 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
-from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import tempfile
 import database as db
 import auth
 import events_management as events_mgmt
+import async_db
+from ingest_queue import IngestQueueFull
+from event_hub import hub
+from cache import stats_cache, response_cache
+from shared_state import get_store
+from db_pool import all_pool_stats
+from metrics import registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from query_log import query_log
+from admission import admission, PRIORITY_CLASSES
+from participant_import import FORMATS as IMPORT_FORMATS, ParticipantImporter, detect_format, python_multipart
+from responses import FastJSONResponse, FastJSONRoute
+from spatial import radius_bbox
 
 # Import configurations and middleware
 from config import settings
-from logger import logger, log_error, log_security_event
+from logger import logger, log_error, log_security_event, get_logging_stats
 from middleware import (
     ErrorHandlerMiddleware,
     RequestLoggingMiddleware,
     RateLimitMiddleware,
-    SecurityHeadersMiddleware
+    AdmissionControlMiddleware,
+    SecurityHeadersMiddleware,
+    ConditionalGetMiddleware,
+    ResponseCacheMiddleware,
+    CompressionMiddleware,
+    request_metrics
 )
 
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    default_response_class=FastJSONResponse
 )
+# Plain dict/list results skip jsonable_encoder (rows are already JSON-ready)
+app.router.route_class = FastJSONRoute
 security = HTTPBearer()
 
 # ===== Middleware Configuration =====
+# Conditional GET: polled path -> (tables the body is built from, time bucket in seconds)
+CONDITIONAL_ROUTES = {
+    "/api/events": (("events",), None),
+    "/api/statistics": (("events", "officers"), 60),  # includes a "last 24 hours" count
+    "/api/resolutions": (("resolutions",), None),
+    "/api/resolutions/stats": (("resolutions",), 60),  # includes a "today" count
+    "/api/officers": (("officers",), None),
+    "/api/danger-zones": (("danger_zones",), None),
+}
+# Response cache (opt-in): route template -> (tables the body is built from, TTL seconds)
+RESPONSE_CACHE_ROUTES = {
+    "/api/events/seasonal": (("seasonal_events",), 300),
+    "/api/events/seasonal/{event_id}": (("seasonal_events",), 300),
+    "/api/events/seasonal/{event_id}/participants": (("event_participants",), 60),
+    "/api/events/seasonal/{event_id}/statistics": (
+        ("event_participants", "iot_devices", "security_alerts", "fraud_attempts", "access_logs"), 30
+    ),
+    "/api/events/seasonal/{event_id}/active-alerts": (("security_alerts",), 30),
+    "/api/events/seasonal/{event_id}/fraud-report": (("fraud_attempts",), 60),
+    "/api/events/seasonal/{event_id}/security-report": (("security_alerts",), 60),
+}
+# Admission priority: "METHOD route template" (or template for any method, * for a prefix) -> class.
+# First match wins; unmatched requests are "normal".
+ADMISSION_ROUTE_CLASSES = {
+    # Security events must keep flowing during a dashboard stampede
+    "POST /api/events": "critical",
+    "POST /api/events/seasonal/{event_id}/security-alert": "critical",
+    "POST /api/events/seasonal/{event_id}/fraud-attempt": "critical",
+    # Ingest, gate access and authentication
+    "POST /api/events/batch": "high",
+    "POST /api/events/seasonal/{event_id}/location-track": "high",
+    "POST /api/events/seasonal/{event_id}/locations/batch": "high",
+    "POST /api/events/seasonal/{event_id}/access-log": "high",
+    "POST /api/events/seasonal/{event_id}/verify-credential": "high",
+    "POST /api/events/seasonal/{event_id}/participants/{participant_id}/verify-biometric": "high",
+    "GET /api/events/seasonal/{event_id}/active-alerts": "high",
+    "GET /api/events/seasonal/{event_id}/positions/nearby": "high",
+    "GET /api/officers/nearby": "high",
+    "POST /api/officers/{officer_id}/location": "high",
+    "/api/auth/*": "high",
+    "/health": "high",
+    # Dashboard analytics and reports
+    "GET /api/events": "low",
+    "GET /api/statistics": "low",
+    "GET /api/resolutions/stats": "low",
+    "GET /api/events/seasonal/{event_id}/statistics": "low",
+    "GET /api/events/seasonal/{event_id}/fraud-report": "low",
+    "GET /api/events/seasonal/{event_id}/security-report": "low",
+    "GET /api/events/seasonal/{event_id}/participants/{participant_id}/location-history": "low",
+    "GET /api/events/seasonal/{event_id}/locations/history": "low",
+}
+# Long-lived streams are not subject to the concurrency limit or the request deadline
+ADMISSION_EXEMPT = ("/api/events/stream", "/static")
+# Request deadline overrides (seconds; None = none). Ingest routes wait on writes that are
+# already queued and bound those waits themselves: a 504 there would invite a duplicate retry.
+ADMISSION_ROUTE_TIMEOUTS = {
+    "POST /api/events": None,
+    "POST /api/events/batch": None,
+    "POST /api/events/seasonal/{event_id}/location-track": None,
+    "POST /api/events/seasonal/{event_id}/locations/batch": None,
+    "POST /api/events/seasonal/{event_id}/participants/import": settings.PARTICIPANT_IMPORT_UPLOAD_TIMEOUT,
+}
+
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, routes=RESPONSE_CACHE_ROUTES)
+
+app.add_middleware(ConditionalGetMiddleware, routes=CONDITIONAL_ROUTES)
+
 # Security headers
 app.add_middleware(SecurityHeadersMiddleware)
 
+# Admission control (inside the rate limiter, so rate-limited requests never take a slot)
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limiter=admission,
+    route_classes=ADMISSION_ROUTE_CLASSES,
+    exempt=ADMISSION_EXEMPT,
+    route_timeouts=ADMISSION_ROUTE_TIMEOUTS
+)
+
 # Rate limiting
 app.add_middleware(
     RateLimitMiddleware,
     max_requests=settings.RATE_LIMIT_REQUESTS,
-    window=settings.RATE_LIMIT_PERIOD
+    window=settings.RATE_LIMIT_PERIOD,
+    user_requests=settings.RATE_LIMIT_USER_REQUESTS,
+    user_limits=settings.RATE_LIMIT_USERS,
+    route_limits=settings.RATE_LIMIT_ROUTES,
+    store=get_store()
 )
 
 # Request logging
@@ -55,6 +157,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Response compression (outermost, sees the final body)
+app.add_middleware(CompressionMiddleware)
+
 logger.info("✅ Middleware configured successfully")
 
 # ===== Models =====
@@ -76,6 +181,30 @@ class Officer(BaseModel):
     phone: Optional[str] = None
     email: Optional[str] = None
 
+class OfficerLocation(BaseModel):
+    latitude: float
+    longitude: float
+    accuracy: Optional[float] = None
+    timestamp: Optional[datetime] = None  # device time; receipt time when omitted
+
+class DangerZone(BaseModel):
+    name: str
+    center_lat: float
+    center_lng: float
+    radius: float  # meters
+    severity: str = "medium"
+    description: Optional[str] = None
+    is_active: bool = True
+
+class DangerZoneUpdate(BaseModel):
+    name: Optional[str] = None
+    center_lat: Optional[float] = None
+    center_lng: Optional[float] = None
+    radius: Optional[float] = None
+    severity: Optional[str] = None
+    description: Optional[str] = None
+    is_active: Optional[bool] = None
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -122,6 +251,10 @@ class EventParticipantCreate(BaseModel):
     age: Optional[int] = None
     gender: Optional[str] = None
 
+participant_importer = ParticipantImporter(
+    events_mgmt.events_db, validate=lambda row: EventParticipantCreate(**row).dict()
+)
+
 class IoTDeviceCreate(BaseModel):
     device_id: str
     device_type: str  # bracelet, badge, wristband
@@ -156,6 +289,24 @@ class LocationTrackCreate(BaseModel):
     speed: Optional[float] = None
     heading: Optional[float] = None
 
+class LocationFix(BaseModel):
+    participant_id: Optional[str] = None  # resolved from device_id when omitted
+    device_id: Optional[str] = None
+    latitude: float
+    longitude: float
+    accuracy: Optional[float] = None
+    altitude: Optional[float] = None
+    speed: Optional[float] = None
+    heading: Optional[float] = None
+    timestamp: Optional[datetime] = None  # device time; receipt time when omitted
+
+class LocationFixGroup(BaseModel):
+    """Fixes reported by one device, or relayed by one gateway"""
+    gateway_id: Optional[str] = None
+    device_id: Optional[str] = None
+    participant_id: Optional[str] = None
+    fixes: List[LocationFix]
+
 class SecurityAlertCreate(BaseModel):
     participant_id: Optional[str] = None
     device_id: Optional[str] = None
@@ -208,11 +359,11 @@ def require_role(*allowed_roles: str):
 # ===== Authentication API =====
 
 @app.post("/api/auth/login")
-def login(credentials: UserLogin):
+async def login(credentials: UserLogin):
     """Login and get JWT token"""
     try:
         logger.info(f"Login attempt for user: {credentials.username}")
-        user = auth.authenticate_user(credentials.username, credentials.password)
+        user = await async_db.users.authenticate_user(credentials.username, credentials.password)
         
         if not user:
             log_security_event("failed_login", details=f"Username: {credentials.username}")
@@ -224,7 +375,7 @@ def login(credentials: UserLogin):
         )
         
         # Log activity
-        auth.log_activity(user['id'], "login", details=f"User {user['username']} logged in")
+        await async_db.users.log_activity(user['id'], "login", details=f"User {user['username']} logged in")
         log_security_event("successful_login", user_id=user['id'], details=user['username'])
         
         logger.info(f"✅ User {user['username']} logged in successfully")
@@ -294,24 +445,184 @@ def get_users(current_user: dict = Depends(require_role("admin", "supervisor")))
 # ===== Events API =====
 
 @app.get("/api/events")
-def get_events(limit: int = 1000, status: Optional[str] = None):
-    """Get all events from database"""
+async def get_events(limit: int = 1000, status: Optional[str] = None, since_id: Optional[int] = None,
+                     before: Optional[str] = None, fields: Optional[str] = None,
+                     device_id: Optional[str] = None, level: Optional[str] = None,
+                     home_id: Optional[str] = None, start: Optional[str] = None,
+                     end: Optional[str] = None):
+    """Get all events from database.
+
+    With `since_id` (the `cursor` of the previous response, 0 to start) only
+    events inserted or updated since then are returned, as a delta object.
+    With any of `before`, `fields`, `device_id`, `level`, `home_id`, `start`
+    or `end` a keyset page is returned: {count, next_before, events}; pass
+    `next_before` back as `before` for the next (older) page.
+    """
     try:
-        events = db.get_events(limit=limit, status=status)
+        if since_id is not None:
+            return await async_db.db.get_events_since(since_id, limit=limit)
+        if any(param is not None for param in (before, fields, device_id, level, home_id, start, end)):
+            return await async_db.db.get_events_page(
+                limit=limit,
+                before=before,
+                fields=[field.strip() for field in fields.split(',') if field.strip()] if fields else None,
+                status=status,
+                device_id=device_id,
+                level=level,
+                home_id=home_id,
+                start=start,
+                end=end
+            )
+        events = await async_db.db.get_events(limit=limit, status=status)
         return events
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _track_officer_event(ev: Event):
+    """Officer devices report their GPS fix with every status event: keep it as the officer's position"""
+    location = ev.location or {}
+    if not ev.type.startswith("officer_") or location.get('lat') is None or location.get('lng') is None:
+        return
+    try:
+        await async_db.db.update_officer_position(ev.device_id, {
+            'latitude': float(location['lat']),
+            'longitude': float(location['lng']),
+            'accuracy': location.get('accuracy'),
+        })
+    except Exception as e:
+        log_error(e, "track_officer_event")
+
 @app.post("/api/events")
-def add_event(ev: Event):
+async def add_event(ev: Event):
     """Add new event to database"""
     try:
         event_dict = ev.dict()
-        event_id = db.add_event(event_dict)
+        event_id = await db.add_event_async(event_dict)
+        await _track_officer_event(ev)
+        if event_id is None:
+            return {"ok": True, "id": None, "queued": True, "message": "Event queued"}
         return {"ok": True, "id": event_id, "message": "Event added successfully"}
+    except IngestQueueFull as e:
+        log_error(e, "add_event")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/events/batch")
+async def add_events_batch(request: Request):
+    """Add many events in one transaction (JSON array or NDJSON body)"""
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    
+    # Decode the body into raw items; NDJSON decode errors are reported per line
+    items: List[Any] = []
+    errors: Dict[int, str] = {}
+    if "ndjson" in content_type or not body.lstrip().startswith(b"["):
+        lines = [line for line in body.splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(None)
+                errors[index] = f"Invalid JSON: {e}"
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of events")
+    
+    if len(items) > settings.MAX_BATCH_EVENTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(items)} events (max {settings.MAX_BATCH_EVENTS})"
+        )
+    
+    # Validate in bulk; only valid events reach the database
+    valid_indexes = []
+    valid_events = []
+    for index, item in enumerate(items):
+        if index in errors:
+            continue
+        if not isinstance(item, dict):
+            errors[index] = "Event must be a JSON object"
+            continue
+        try:
+            valid_events.append(Event(**item).dict())
+            valid_indexes.append(index)
+        except ValidationError as e:
+            errors[index] = str(e)
+    
+    try:
+        ids = await async_db.db.add_events(valid_events)
+    except Exception as e:
+        log_error(e, "add_events_batch")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    results = [{"index": index, "error": error} for index, error in errors.items()]
+    results += [{"index": index, "id": event_id} for index, event_id in zip(valid_indexes, ids)]
+    results.sort(key=lambda result: result["index"])
+    
+    return {
+        "ok": not errors,
+        "accepted": len(ids),
+        "rejected": len(errors),
+        "results": results
+    }
+
+@app.get("/api/ingest/stats")
+def get_ingest_stats():
+    """Ingest queue depth and group-commit latency"""
+    return db.event_ingest.stats()
+
+# ===== Live Event Stream =====
+
+@app.websocket("/ws/events")
+async def events_websocket(websocket: WebSocket, level: Optional[str] = None,
+                           home_id: Optional[str] = None, event_id: Optional[int] = None,
+                           topics: Optional[str] = None):
+    """Push new/updated events, resolutions and security alerts over WebSocket"""
+    await websocket.accept()
+    subscriber = hub.subscribe(level=level, home_id=home_id, event_id=event_id, topics=topics)
+    try:
+        while True:
+            message = await subscriber.get(timeout=settings.EVENT_STREAM_HEARTBEAT)
+            await websocket.send_text(message or '{"topic": "ping"}')
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(subscriber)
+
+@app.get("/api/events/stream")
+async def events_stream(request: Request, level: Optional[str] = None,
+                        home_id: Optional[str] = None, event_id: Optional[int] = None,
+                        topics: Optional[str] = None):
+    """Same feed as /ws/events as Server-Sent Events"""
+    subscriber = hub.subscribe(level=level, home_id=home_id, event_id=event_id, topics=topics)
+    
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                message = await subscriber.get(timeout=settings.EVENT_STREAM_HEARTBEAT)
+                yield f"data: {message}\n\n" if message else ": keep-alive\n\n"
+        finally:
+            hub.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/events/stream/stats")
+def events_stream_stats():
+    """Live stream subscriber and fan-out counters"""
+    return hub.stats()
+
 @app.post("/api/events/resolve_all")
 def resolve_all():
     """Resolve all open events"""
@@ -356,41 +667,79 @@ def add_resolution(resolution: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/resolutions")
-def get_resolutions(limit: int = 100):
+async def get_resolutions(limit: int = 100):
     """Get recent resolutions"""
     try:
-        resolutions = db.get_resolutions(limit=limit)
+        resolutions = await async_db.db.get_resolutions(limit=limit)
         return resolutions
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/resolutions/stats")
-@lru_cache(maxsize=128)
-def get_resolution_stats():
-    """Get resolution statistics (cached)"""
+async def get_resolution_stats():
+    """Get resolution statistics (cached until the next resolution or CACHE_TTL)"""
     try:
-        stats = db.get_resolution_stats()
+        stats = await async_db.run_read(
+            stats_cache.get_or_compute,
+            'resolution_stats', db.get_resolution_stats, tags=('resolutions',)
+        )
         return stats
     except Exception as e:
         log_error(e, "get_resolution_stats")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/statistics")
-@lru_cache(maxsize=128)
-def get_statistics():
-    """Get system statistics (cached)"""
+async def get_statistics():
+    """Get system statistics (cached until the next event/officer write or CACHE_TTL)"""
     try:
-        stats = db.get_statistics()
+        stats = await async_db.run_read(
+            stats_cache.get_or_compute,
+            'statistics', db.get_statistics, tags=('events', 'officers')
+        )
         return stats
     except Exception as e:
         log_error(e, "get_statistics")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Statistics cache hit/miss counters"""
+    return stats_cache.stats()
+
+@app.get("/api/cache/responses/stats")
+def get_response_cache_stats():
+    """Hit/miss counters and size of the GET response cache"""
+    return response_cache.stats()
+
+@app.get("/api/http/stats")
+def get_http_stats():
+    """Request counters by status, including the 304 (not modified) ratio"""
+    return request_metrics.stats()
+
+@app.get("/api/admin/slow-queries")
+def get_slow_queries(limit: int = 20, reset: bool = False,
+                     current_user: dict = Depends(require_role("admin"))):
+    """Slowest normalized statements and recent slow executions with their query plans (admin only)"""
+    report = query_log.report(limit=limit)
+    if reset:
+        query_log.reset()
+    return report
+
+@app.get("/api/logging/stats")
+def get_log_stats():
+    """Log queue depth plus dropped and sampled-out record counts"""
+    return get_logging_stats()
+
+@app.get("/api/admission/stats")
+def get_admission_stats():
+    """Running and waiting requests per priority class, with admitted/shed/timed-out totals"""
+    return admission.stats()
+
 @app.get("/api/officers")
-def get_officers():
+async def get_officers():
     """Get all officers"""
     try:
-        officers = db.get_officers()
+        officers = await async_db.db.get_officers()
         return officers
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -405,6 +754,32 @@ def add_officer(officer: Officer):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/officers/{officer_id}/location")
+async def update_officer_location(officer_id: str, location: OfficerLocation):
+    """Report an officer's current position"""
+    position = location.dict()
+    timestamp = position.pop('timestamp')
+    if timestamp is not None:
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        position['timestamp'] = timestamp.isoformat()
+    try:
+        updated = await async_db.db.update_officer_position(officer_id, position)
+        return {"ok": True, "updated": updated}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/officers/positions")
+async def get_officer_positions(bbox: Optional[str] = None):
+    """Last-known position of every officer, optionally inside bbox (min_lng,min_lat,max_lng,max_lat)"""
+    return await async_db.db.get_officer_positions(_parse_bbox(bbox))
+
+@app.get("/api/officers/nearby")
+async def get_officers_nearby(lat: float, lng: float, radius: float, limit: Optional[int] = None):
+    """Officers within `radius` meters of (lat, lng), nearest first"""
+    _check_circle(lat, lng, radius)
+    return await async_db.db.get_officers_near(lat, lng, radius, limit)
+
 @app.get("/api/officers/{officer_id}")
 def get_officer(officer_id: str):
     """Get single officer"""
@@ -418,6 +793,84 @@ def get_officer(officer_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ===== Danger Zones (geofences) =====
+
+def _check_zone(zone: Dict[str, Any]):
+    """400 for coordinates or a radius out of range (only the fields present are checked)"""
+    if zone.get('center_lat') is not None and not -90 <= zone['center_lat'] <= 90:
+        raise HTTPException(status_code=400, detail="center_lat must be in [-90, 90]")
+    if zone.get('center_lng') is not None and not -180 <= zone['center_lng'] <= 180:
+        raise HTTPException(status_code=400, detail="center_lng must be in [-180, 180]")
+    if zone.get('radius') is not None and not 0 < zone['radius'] <= settings.MAX_DANGER_ZONE_RADIUS_METERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"radius must be between 0 and {settings.MAX_DANGER_ZONE_RADIUS_METERS:g} meters"
+        )
+
+async def _reload_geofences():
+    """Apply zone changes to the geofence engine now rather than on the next location batch"""
+    await async_db.run_read(events_mgmt.events_db.geofence.reload)
+
+@app.get("/api/danger-zones")
+async def get_danger_zones(active_only: bool = False):
+    """Get danger zones"""
+    return await async_db.db.get_danger_zones(active_only)
+
+@app.post("/api/danger-zones")
+async def add_danger_zone(zone: DangerZone):
+    """Add a danger zone; location batches are checked against it from now on"""
+    zone_dict = zone.dict()
+    _check_zone(zone_dict)
+    try:
+        zone_id = await async_db.db.add_danger_zone(zone_dict)
+        await _reload_geofences()
+        return {"ok": True, "id": zone_id, "message": "Danger zone added successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/geofence/stats")
+async def get_geofence_stats():
+    """Zones loaded, participants inside a zone, fixes evaluated and alerts written"""
+    return events_mgmt.events_db.geofence.stats()
+
+@app.get("/api/danger-zones/{zone_id}")
+async def get_danger_zone(zone_id: int):
+    """Get single danger zone"""
+    zone = await async_db.db.get_danger_zone(zone_id)
+    if not zone:
+        raise HTTPException(status_code=404, detail="Danger zone not found")
+    return zone
+
+@app.put("/api/danger-zones/{zone_id}")
+async def update_danger_zone(zone_id: int, zone: DangerZoneUpdate):
+    """Update a danger zone (only the fields sent)"""
+    # description may be cleared; the other columns are NOT NULL
+    zone_dict = {
+        key: value for key, value in zone.dict(exclude_unset=True).items()
+        if value is not None or key == 'description'
+    }
+    _check_zone(zone_dict)
+    try:
+        updated = await async_db.db.update_danger_zone(zone_id, zone_dict)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not updated:
+        raise HTTPException(status_code=404, detail="Danger zone not found")
+    await _reload_geofences()
+    return {"ok": True, "message": "Danger zone updated successfully"}
+
+@app.delete("/api/danger-zones/{zone_id}")
+async def delete_danger_zone(zone_id: int):
+    """Delete a danger zone"""
+    try:
+        deleted = await async_db.db.delete_danger_zone(zone_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Danger zone not found")
+    await _reload_geofences()
+    return {"ok": True, "message": "Danger zone deleted successfully"}
+
 # ===== static + الواجهة =====
 
 # مجلد الملفات الثابتة (فيه الواجهات)
@@ -497,6 +950,66 @@ def list_event_participants(event_id: int, status: Optional[str] = None):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/events/seasonal/{event_id}/participants/import", status_code=202)
+async def import_event_participants(event_id: int, request: Request, format: Optional[str] = None):
+    """استيراد المشاركين بالجملة (CSV أو NDJSON، كجسم الطلب أو كملف multipart)
+
+    The upload is streamed to a temporary file and imported in the
+    background; poll the returned `status_url` for progress and row errors.
+    """
+    if await async_db.events_db.get_event(event_id) is None:
+        raise HTTPException(status_code=404, detail="الفعالية غير موجودة")
+    
+    content_type = request.headers.get("content-type", "")
+    size = 0
+    spool = tempfile.NamedTemporaryFile(prefix="participants-", delete=False)
+    try:
+        if content_type.startswith("multipart/form-data"):
+            if python_multipart is None:
+                raise HTTPException(status_code=415, detail="multipart uploads need python-multipart; send text/csv or application/x-ndjson")
+            form = await request.form()
+            upload = next((value for value in form.values() if hasattr(value, "filename")), None)
+            if upload is None:
+                raise HTTPException(status_code=400, detail="No file part in the upload")
+            fmt = format or detect_format(upload.content_type or "", upload.filename or "")
+            while size <= settings.PARTICIPANT_IMPORT_MAX_BYTES and (chunk := await upload.read(1024 * 1024)):
+                size += len(chunk)
+                spool.write(chunk)
+            await form.close()
+        else:
+            fmt = format or detect_format(content_type)
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > settings.PARTICIPANT_IMPORT_MAX_BYTES:
+                    break
+                spool.write(chunk)
+        spool.close()
+        
+        if size > settings.PARTICIPANT_IMPORT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload larger than {settings.PARTICIPANT_IMPORT_MAX_BYTES} bytes")
+        if fmt not in IMPORT_FORMATS:
+            raise HTTPException(status_code=415, detail="Send CSV or NDJSON (or pass ?format=csv|ndjson)")
+        job = participant_importer.submit(event_id, spool.name, fmt)
+    except Exception:
+        spool.close()
+        os.unlink(spool.name)
+        raise
+    
+    return {
+        "ok": True,
+        "job_id": job.job_id,
+        "status_url": f"/api/events/seasonal/{event_id}/participants/import/{job.job_id}",
+        "message": "بدأ استيراد المشاركين"
+    }
+
+@app.get("/api/events/seasonal/{event_id}/participants/import/{job_id}")
+def get_participant_import(event_id: int, job_id: str):
+    """حالة مهمة الاستيراد: التقدم والأخطاء لكل صف"""
+    job = participant_importer.get(job_id)
+    if job is None or job['event_id'] != event_id:
+        raise HTTPException(status_code=404, detail="مهمة الاستيراد غير موجودة")
+    return job
+
 @app.get("/api/events/seasonal/{event_id}/participants/{participant_id}")
 def get_event_participant(event_id: int, participant_id: str):
     """الحصول على بيانات المشارك"""
@@ -624,20 +1137,212 @@ def log_participant_access(event_id: int, access_log: AccessLogCreate):
 # ===== API تتبع الموقع الجغرافي =====
 
 @app.post("/api/events/seasonal/{event_id}/location-track")
-def track_participant_location(event_id: int, location: LocationTrackCreate):
-    """تتبع موقع المشارك في الفعالية"""
+async def track_participant_location(event_id: int, location: LocationTrackCreate):
+    """تتبع موقع المشارك في الفعالية (عبر طابور الحفظ الجماعي)"""
     try:
         location_data = location.dict()
         location_data['event_id'] = event_id
-        location_id = events_mgmt.events_db.track_location(location_data)
+        location_data['timestamp'] = events_mgmt.location_timestamp()
+        location_id = await events_mgmt.location_ingest.submit_async(location_data)
         return {
             "ok": True,
             "location_id": location_id,
+            "queued": location_id is None,
             "message": "تم تسجيل الموقع"
         }
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _queue_location_items(event_id: int, items: List[tuple], errors: Dict[int, str]) -> int:
+    """Validate (index, fix or fix group) items, resolve device-only fixes and queue them.
+
+    Returns the number of fixes queued; rejected items are added to `errors`.
+    Raises IngestQueueFull when the location queue cannot take the batch.
+    """
+    fixes = []
+    for index, item in items:
+        if not isinstance(item, dict):
+            errors[index] = "Expected a fix or a group of fixes"
+            continue
+        try:
+            if 'fixes' in item:
+                group = LocationFixGroup(**item)
+                item_fixes = [fix.dict() for fix in group.fixes]
+                for fix in item_fixes:
+                    fix['device_id'] = fix['device_id'] or group.device_id
+                    fix['participant_id'] = fix['participant_id'] or group.participant_id
+            else:
+                item_fixes = [LocationFix(**item).dict()]
+        except ValidationError as e:
+            errors[index] = str(e)
+            continue
+        for fix in item_fixes:
+            fix['event_id'] = event_id
+            fix['timestamp'] = events_mgmt.location_timestamp(fix['timestamp'])
+            fixes.append((index, fix))
+    
+    unowned = list({fix['device_id'] for _, fix in fixes if not fix['participant_id'] and fix['device_id']})
+    if unowned:
+        owners = await async_db.events_db.get_device_participants(event_id, unowned)
+        for _, fix in fixes:
+            fix['participant_id'] = fix['participant_id'] or owners.get(fix['device_id'])
+    
+    queued = []
+    for index, fix in fixes:
+        if fix['participant_id']:
+            queued.append(fix)
+        else:
+            errors[index] = "Unknown participant: send participant_id or a device_id registered to this event"
+    await events_mgmt.location_ingest.submit_many_async(queued)
+    return len(queued)
+
+@app.post("/api/events/seasonal/{event_id}/locations/batch")
+async def track_locations_batch(event_id: int, request: Request):
+    """استقبال دفعات المواقع من الأجهزة أو البوابات
+
+    The body is a JSON array, or NDJSON streamed line by line, of fixes
+    and/or groups {"device_id" | "gateway_id", "participant_id", "fixes": [...]}.
+    Fixes are buffered and written in large transactions; per-item errors
+    are reported by array index (NDJSON: line index). A JSON body is queued
+    all-or-nothing; when the queue fills part-way through an NDJSON stream
+    the 503 reports `resume_from_index`, the first line that was not queued.
+    """
+    errors: Dict[int, str] = {}
+    accepted = 0
+    resume_from = 0  # first NDJSON line not yet queued
+    content_type = request.headers.get("content-type", "")
+    try:
+        if "ndjson" in content_type or "jsonl" in content_type:
+            pending: List[tuple] = []
+            index = 0
+            buffer = b""
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        try:
+                            pending.append((index, json.loads(line)))
+                        except ValueError as e:
+                            errors[index] = f"Invalid JSON: {e}"
+                    index += 1
+                if len(pending) >= settings.LOCATION_INGEST_BATCH_SIZE:
+                    accepted += await _queue_location_items(event_id, pending, errors)
+                    pending = []
+                    resume_from = index
+            if buffer.strip():
+                try:
+                    pending.append((index, json.loads(buffer)))
+                except ValueError as e:
+                    errors[index] = f"Invalid JSON: {e}"
+            accepted += await _queue_location_items(event_id, pending, errors)
+        else:
+            try:
+                items = json.loads(await request.body())
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+            if isinstance(items, dict):
+                items = [items]
+            if not isinstance(items, list):
+                raise HTTPException(status_code=400, detail="Expected a JSON array of fixes or fix groups")
+            if len(items) > settings.MAX_BATCH_LOCATIONS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Batch too large: {len(items)} items (max {settings.MAX_BATCH_LOCATIONS}); stream NDJSON instead"
+                )
+            accepted = await _queue_location_items(event_id, list(enumerate(items)), errors)
+    except IngestQueueFull as e:
+        log_error(e, "track_locations_batch")
+        detail: Any = str(e)
+        if accepted:
+            # Earlier NDJSON chunks are already queued: a retry must resend only the rest
+            detail = {
+                "message": str(e),
+                "accepted": accepted,
+                "resume_from_index": resume_from,
+                "errors": [{"index": i, "error": error} for i, error in sorted(errors.items()) if i < resume_from],
+            }
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+    
+    return {
+        "ok": not errors,
+        "accepted": accepted,
+        "rejected": len(errors),
+        "errors": [{"index": index, "error": error} for index, error in sorted(errors.items())]
+    }
+
+def _parse_bbox(bbox: Optional[str]):
+    """"min_lng,min_lat,max_lng,max_lat" -> tuple of floats (400 when malformed)"""
+    if bbox is None:
+        return None
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lng,min_lat,max_lng,max_lat")
+    if min_lng > max_lng or min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="bbox minimums must not exceed maximums")
+    return min_lng, min_lat, max_lng, max_lat
+
+@app.get("/api/events/seasonal/{event_id}/positions")
+async def get_event_positions(event_id: int, bbox: Optional[str] = None, since: Optional[int] = None):
+    """آخر موقع معروف لكل مشارك في الفعالية (للخريطة الحية)
+
+    `bbox` is "min_lng,min_lat,max_lng,max_lat". `since` is the `cursor` of
+    a previous response: only participants that moved after it are returned.
+    """
+    return await async_db.run_read(events_mgmt.events_db.positions.query, event_id, _parse_bbox(bbox), since)
+
+def _check_circle(lat: float, lng: float, radius: float):
+    """400 unless (lat, lng) is a coordinate and radius is in (0, MAX_NEARBY_RADIUS_METERS]"""
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="lat must be in [-90, 90] and lng in [-180, 180]")
+    if not 0 < radius <= settings.MAX_NEARBY_RADIUS_METERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"radius must be between 0 and {settings.MAX_NEARBY_RADIUS_METERS:g} meters"
+        )
+
+@app.get("/api/events/seasonal/{event_id}/positions/nearby")
+async def get_event_positions_nearby(event_id: int, lat: float, lng: float, radius: float,
+                                     limit: Optional[int] = None, officers: bool = True):
+    """المشاركون (والضباط) ضمن `radius` متراً من نقطة، الأقرب أولاً
+
+    Answered from the in-memory grids of last-known positions.
+    """
+    _check_circle(lat, lng, radius)
+    result = await async_db.run_read(events_mgmt.events_db.positions.nearby, event_id, lat, lng, radius, limit)
+    if officers:
+        result['officers'] = await async_db.db.get_officers_near(lat, lng, radius, limit)
+    return result
+
+@app.get("/api/events/seasonal/{event_id}/locations/history")
+async def get_locations_in_area(event_id: int, bbox: Optional[str] = None,
+                                lat: Optional[float] = None, lng: Optional[float] = None,
+                                radius: Optional[float] = None, start: Optional[datetime] = None,
+                                end: Optional[datetime] = None, limit: int = 1000):
+    """سجل المواقع داخل منطقة (bbox أو دائرة lat/lng/radius) خلال فترة، الأحدث أولاً"""
+    center = None
+    if lat is not None or lng is not None or radius is not None:
+        if lat is None or lng is None or radius is None:
+            raise HTTPException(status_code=400, detail="lat, lng and radius go together")
+        _check_circle(lat, lng, radius)
+        center = (lat, lng, radius)
+        area = radius_bbox(lat, lng, radius)
+    elif bbox is not None:
+        area = _parse_bbox(bbox)
+    else:
+        raise HTTPException(status_code=400, detail="Send bbox, or lat, lng and radius")
+    if not 0 < limit <= settings.MAX_LOCATION_HISTORY_ROWS:
+        raise HTTPException(
+            status_code=400, detail=f"limit must be between 1 and {settings.MAX_LOCATION_HISTORY_ROWS}"
+        )
+    start = events_mgmt.location_timestamp(start) if start else None
+    end = events_mgmt.location_timestamp(end) if end else None
+    locations = await async_db.events_db.get_locations_in_area(event_id, area, start, end, center, limit)
+    return {"count": len(locations), "locations": locations}
+
 @app.get("/api/events/seasonal/{event_id}/participants/{participant_id}/location-history")
 def get_participant_location_history(event_id: int, participant_id: str, limit: int = 100):
     """الحصول على سجل مواقع المشارك"""
@@ -655,12 +1360,12 @@ def get_participant_location_history(event_id: int, participant_id: str, limit:
 # ===== API الأمان والتنبيهات =====
 
 @app.post("/api/events/seasonal/{event_id}/security-alert")
-def log_security_alert(event_id: int, alert: SecurityAlertCreate):
+async def log_security_alert(event_id: int, alert: SecurityAlertCreate):
     """تسجيل تنبيه أمني (دخول غير مصرح، جهاز معطل)"""
     try:
         alert_data = alert.dict()
         alert_data['event_id'] = event_id
-        alert_id = events_mgmt.events_db.log_security_alert(alert_data)
+        alert_id = await async_db.events_db.log_security_alert(alert_data)
         return {
             "ok": True,
             "alert_id": alert_id,
@@ -685,10 +1390,10 @@ def log_fraud_attempt(event_id: int, fraud: FraudAttemptCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/events/seasonal/{event_id}/active-alerts")
-def get_event_active_alerts(event_id: int):
+async def get_event_active_alerts(event_id: int):
     """الحصول على التنبيهات النشطة للفعالية"""
     try:
-        alerts = events_mgmt.events_db.get_active_alerts(event_id)
+        alerts = await async_db.events_db.get_active_alerts(event_id)
         return {
             "count": len(alerts),
             "alerts": alerts
@@ -738,10 +1443,10 @@ def verify_access_credential(event_id: int, credential_data: dict):
 # ===== التقارير والإحصائيات =====
 
 @app.get("/api/events/seasonal/{event_id}/statistics")
-def get_event_statistics(event_id: int):
+async def get_event_statistics(event_id: int):
     """الحصول على إحصائيات الفعالية"""
     try:
-        stats = events_mgmt.events_db.get_event_statistics(event_id)
+        stats = await async_db.events_db.get_event_statistics(event_id)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -772,7 +1477,7 @@ def get_security_report(event_id: int, limit: int = 100):
 
 # Health check endpoint
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint for monitoring"""
     return {
         "status": "healthy",
@@ -781,6 +1486,83 @@ def health_check():
         "app": settings.APP_NAME
     }
 
+# ===== Prometheus metrics =====
+
+@registry.gauge("db_pool_connections", "Pooled SQLite connections by state", ("db", "state"))
+def _pool_connections():
+    values = {}
+    for pool in all_pool_stats():
+        values[(pool['db_path'], 'in_use')] = pool['in_use']
+        values[(pool['db_path'], 'idle')] = pool['idle']
+        values[(pool['db_path'], 'created')] = pool['created']
+    return values
+
+@registry.gauge("ingest_queue", "Write-behind ingest queue depth and totals", ("queue", "field"))
+def _ingest_queue():
+    fields = ('queue_depth', 'queue_capacity', 'enqueued', 'committed', 'failed', 'rejected', 'batches', 'avg_commit_ms')
+    values = {}
+    for ingest in (db.event_ingest, events_mgmt.location_ingest):
+        stats = ingest.stats()
+        values.update({(ingest.name, field): stats[field] for field in fields})
+    return values
+
+@registry.gauge("db_executor_queued", "Calls waiting for an async data-access executor thread", ("executor",))
+def _db_executors():
+    return {(name,): stats['queued'] for name, stats in async_db.executor_stats().items()}
+
+@registry.gauge("admission_requests", "Requests running or waiting for admission by priority class", ("class", "state"))
+def _admission_requests():
+    classes = admission.stats()['classes']
+    return {(cls, state): classes[cls][state] for cls in PRIORITY_CLASSES for state in ('running', 'waiting')}
+
+@registry.gauge("admission_rejections", "Requests shed (queue full) or timed out waiting, by priority class", ("class", "reason"))
+def _admission_rejections():
+    classes = admission.stats()['classes']
+    return {(cls, reason): classes[cls][reason] for cls in PRIORITY_CLASSES for reason in ('shed', 'timed_out')}
+
+@registry.gauge("positions", "Last-known participant positions held in memory and not yet saved, and officer positions held", ("state",))
+def _positions():
+    stats = events_mgmt.events_db.positions.stats()
+    return {('held',): stats['positions'], ('unsaved',): stats['unsaved'], ('officers',): len(db.officer_positions)}
+
+@registry.gauge("geofence", "Active danger zones loaded, and participants currently inside one", ("state",))
+def _geofence():
+    stats = events_mgmt.events_db.geofence.stats()
+    return {('zones',): stats['zones'], ('participants_inside',): stats['participants_inside']}
+
+@registry.gauge("cache_hit_ratio", "Hit ratio of the in-process caches", ("cache",))
+def _cache_hit_ratio():
+    return {
+        ('stats',): stats_cache.stats()['hit_ratio'],
+        ('responses',): response_cache.stats()['hit_ratio'],
+    }
+
+@registry.gauge("cache_lookups", "Cache lookups by result", ("cache", "result"))
+def _cache_lookups():
+    stats, responses = stats_cache.stats(), response_cache.stats()
+    return {
+        ('stats', 'hit'): stats['hits'],
+        ('stats', 'coalesced'): stats['coalesced'],
+        ('stats', 'miss'): stats['misses'],
+        ('responses', 'hit'): responses['hits'],
+        ('responses', 'miss'): responses['misses'],
+    }
+
+@registry.gauge("event_stream", "Live event stream subscribers and message totals", ("field",))
+def _event_stream():
+    stats = hub.stats()
+    return {(field,): stats[field] for field in ('subscribers', 'published', 'dropped')}
+
+@registry.gauge("log_records", "Queued logging: depth, dropped and sampled-out records", ("field",))
+def _log_records():
+    stats = get_logging_stats()
+    return {(field,): stats[field] for field in ('queue_depth', 'dropped', 'sampled_out')}
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus text exposition"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/api/version")
 def get_version():
     """Get application version"""
@@ -2,28 +2,71 @@
 Custom Middleware
 معالجات مخصصة للطلبات
 """
+import asyncio
+import gzip
+import hashlib
+import math
+import re
+import threading
 import time
-from fastapi import Request, status
+from fastapi import status
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from typing import Callable
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Any, Dict, Iterable, Optional, Tuple
 import logging
+import auth
+from admission import AdmissionRejected, PriorityLimiter
+from cache import ResponseCache
+from change_tracker import changes
+from config import settings
 from logger import log_api_call, log_error
+from metrics import http_request_duration, http_requests
+from rate_limit import TokenBucketLimiter
+from shared_state import SharedStore
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
 
 logger = logging.getLogger(__name__)
 
-class ErrorHandlerMiddleware(BaseHTTPMiddleware):
+def _route_pattern(template: str) -> "re.Pattern":
+    """Regex for a route template: {param} matches one segment, a trailing * any suffix"""
+    prefix = template.endswith("*")
+    pattern = re.sub(r"\\{\w+\\}", "[^/]+", re.escape(template.rstrip("*")))
+    return re.compile("^" + pattern + ("" if prefix else "$"))
+
+class ErrorHandlerMiddleware:
     """معالج الأخطاء المركزي"""
     
-    async def dispatch(self, request: Request, call_next: Callable):
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        response_started = False
+        
+        async def send_tracking(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send_tracking)
         except Exception as e:
-            log_error(e, context=f"{request.method} {request.url.path}")
+            log_error(e, context=f"{scope['method']} {scope['path']}")
+            if response_started:
+                # Headers already sent - nothing left to replace
+                raise
             
             # Return user-friendly error
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content={
                     "error": "Internal Server Error",
@@ -31,120 +74,473 @@ class ErrorHandlerMiddleware(BaseHTTPMiddleware):
                     "detail": str(e) if logger.level == logging.DEBUG else None
                 }
             )
+            await response(scope, receive, send)
+
+class RequestMetrics:
+    """عدادات الطلبات (الإجمالي، حسب الحالة، ونسبة 304)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.by_status: Dict[int, int] = {}
+        self.conditional = 0  # requests that carried If-None-Match
+
+    def record(self, status_code: int, conditional: bool):
+        with self._lock:
+            self.total += 1
+            self.by_status[status_code] = self.by_status.get(status_code, 0) + 1
+            if conditional:
+                self.conditional += 1
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            not_modified = self.by_status.get(304, 0)
+            return {
+                'total': self.total,
+                'by_status': dict(self.by_status),
+                'conditional': self.conditional,
+                'not_modified': not_modified,
+                'not_modified_ratio': round(not_modified / self.total, 4) if self.total else 0.0,
+                'revalidation_hit_ratio': round(not_modified / self.conditional, 4) if self.conditional else 0.0,
+            }
+
+
+request_metrics = RequestMetrics()
+
+class RequestLoggingMiddleware:
     """تسجيل جميع الطلبات"""
     
-    async def dispatch(self, request: Request, call_next: Callable):
-        start_time = time.time()
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Calculate duration
-        duration = time.time() - start_time
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Log the request
-        log_api_call(
-            endpoint=request.url.path,
-            method=request.method,
-            status_code=response.status_code,
-            duration=duration
-        )
+        start_time = time.time()
+        conditional = any(name == b"if-none-match" for name, _ in scope["headers"])
         
-        # Add custom headers
-        response.headers["X-Process-Time"] = str(duration)
+        async def send_logged(message: Message):
+            if message["type"] == "http.response.start":
+                # Calculate duration (time to response headers)
+                duration = time.time() - start_time
+                
+                # Log the request
+                log_api_call(
+                    endpoint=scope["path"],
+                    method=scope["method"],
+                    status_code=message["status"],
+                    duration=duration
+                )
+                request_metrics.record(message["status"], conditional)
+                route = scope.get("route")
+                labels = (scope["method"], getattr(route, "path", "unmatched"), str(message["status"]))
+                http_requests.inc(labels)
+                http_request_duration.observe(labels, duration)
+                
+                # Add custom headers
+                MutableHeaders(scope=message)["X-Process-Time"] = str(duration)
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_logged)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """معالج تحديد عدد الطلبات (Rate Limiting)"""
+class RateLimitMiddleware:
+    """معالج تحديد عدد الطلبات (Rate Limiting)
+
+    Clients are identified by their bearer token's user when it verifies,
+    else by IP, so devices sharing a NAT address can be given their own
+    budget. Route rules (path prefix) add a separate bucket on top.
+    """
     
-    def __init__(self, app, max_requests: int = 100, window: int = 60):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, max_requests: int = 100, window: int = 60,
+                 user_requests: int = settings.RATE_LIMIT_USER_REQUESTS,
+                 user_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 route_limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_keys: int = settings.RATE_LIMIT_MAX_KEYS,
+                 store: Optional[SharedStore] = None):
+        self.app = app
         self.max_requests = max_requests
         self.window = window
-        self.requests = {}  # {ip: [(timestamp, count)]}
+        self.user_requests = user_requests
+        self.user_limits = user_limits or {}
+        self.route_limits = sorted((route_limits or {}).items(), key=lambda rule: -len(rule[0]))
+        # A shared store keeps one budget per client across all workers
+        self.store = store if store is not None and store.shared else None
+        self.limiter = self.store or TokenBucketLimiter(max_keys=max_keys)
     
-    async def dispatch(self, request: Request, call_next: Callable):
-        # Get client IP
-        client_ip = request.client.host
-        current_time = time.time()
-        
-        # Clean old requests
-        if client_ip in self.requests:
-            self.requests[client_ip] = [
-                (ts, count) for ts, count in self.requests[client_ip]
-                if current_time - ts < self.window
-            ]
+    def _identify(self, scope: Scope) -> Tuple[str, int, int]:
+        """Bucket key and (requests, period) for the caller"""
+        authorization = Headers(scope=scope).get("authorization", "")
+        if authorization[:7].lower() == "bearer ":
+            payload = auth.decode_access_token(authorization[7:].strip())
+            if payload and payload.get("username"):
+                username = payload["username"]
+                requests, period = self.user_limits.get(username, (self.user_requests, self.window))
+                return f"user:{username}", requests, period
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        return f"ip:{client_ip}", self.max_requests, self.window
+    
+    def _route_limit(self, path: str) -> Optional[Tuple[str, int, int]]:
+        for prefix, (requests, period) in self.route_limits:
+            if path.startswith(prefix):
+                return prefix, requests, period
+        return None
+    
+    def _take(self, scope: Scope) -> Tuple[str, float]:
+        """(client, seconds until allowed - 0 when the request may go ahead)"""
+        client, requests, period = self._identify(scope)
+        retry_after = self.limiter.hit(client, requests, period)
         
-        # Count requests in window
-        if client_ip not in self.requests:
-            self.requests[client_ip] = []
+        route = self._route_limit(scope["path"])
+        if route is not None and not retry_after:
+            prefix, route_requests, route_period = route
+            retry_after = self.limiter.hit(f"{client}|{prefix}", route_requests, route_period)
+        return client, retry_after
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        request_count = sum(count for _, count in self.requests[client_ip])
+        # A shared store does blocking I/O: take the tokens on its threads, not on the loop
+        if self.store:
+            client, retry_after = await self.store.run(self._take, scope)
+        else:
+            client, retry_after = self._take(scope)
         
         # Check rate limit
-        if request_count >= self.max_requests:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return JSONResponse(
+        if retry_after:
+            logger.warning(f"Rate limit exceeded for {client} on {scope['path']}")
+            response = JSONResponse(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 content={
                     "error": "Too Many Requests",
                     "message": "تم تجاوز الحد المسموح من الطلبات، يرجى الانتظار"
-                }
+                },
+                headers={"Retry-After": str(math.ceil(retry_after))}
             )
-        
-        # Add current request
-        self.requests[client_ip].append((current_time, 1))
+            await response(scope, receive, send)
+            return
         
         # Process request
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
+
+class AdmissionControlMiddleware:
+    """التحكم في القبول: حد للتزامن بأولويات ومهلة REQUEST_TIMEOUT لكل طلب
 
-class CacheMiddleware(BaseHTTPMiddleware):
-    """معالج التخزين المؤقت للطلبات"""
+    `route_classes` maps "METHOD /route/{template}" (or a bare template for
+    any method; a trailing * matches a prefix) to a priority class; the first
+    matching rule wins and unmatched requests are "normal". A request waits
+    for a slot at most until its deadline; when the wait queue is full it is
+    shed at once with 503 and Retry-After. Work still running at the
+    deadline is cancelled and answered with 504. `route_timeouts` (same rule
+    format) overrides the deadline per route; None means no deadline, for
+    routes that must not be cancelled part-way (ingest waits on work that is
+    already queued) and that bound their own waits. Paths in `exempt`
+    (long-lived streams) bypass admission entirely.
+    """
+    
+    def __init__(self, app: ASGIApp, limiter: PriorityLimiter,
+                 route_classes: Dict[str, str],
+                 timeout: float = settings.REQUEST_TIMEOUT,
+                 retry_after: int = settings.ADMISSION_RETRY_AFTER,
+                 exempt: Iterable[str] = (),
+                 route_timeouts: Optional[Dict[str, Optional[float]]] = None):
+        self.app = app
+        self.limiter = limiter
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.exempt = tuple(exempt)
+        self.rules = self._compile(route_classes)
+        self.timeout_rules = self._compile(route_timeouts or {})
+    
+    @staticmethod
+    def _compile(rules: Dict[str, Any]) -> list:
+        compiled = []
+        for rule, value in rules.items():
+            method, _, template = rule.rpartition(" ")
+            compiled.append((method or None, _route_pattern(template), value))
+        return compiled
     
-    def __init__(self, app, ttl: int = 300):
-        super().__init__(app)
-        self.ttl = ttl
-        self.cache = {}  # {url: (response, timestamp)}
+    @staticmethod
+    def _match(rules: list, method: str, path: str, default: Any) -> Any:
+        for rule_method, pattern, value in rules:
+            if (rule_method is None or rule_method == method) and pattern.match(path):
+                return value
+        return default
     
-    async def dispatch(self, request: Request, call_next: Callable):
-        # Only cache GET requests
-        if request.method != "GET":
-            return await call_next(request)
+    def _classify(self, method: str, path: str) -> str:
+        return self._match(self.rules, method, path, "normal")
+    
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, status_code: int, message: str):
+        response = JSONResponse(
+            status_code=status_code,
+            content={"error": "Service Unavailable" if status_code == 503 else "Gateway Timeout", "message": message},
+            headers={"Retry-After": str(self.retry_after)}
+        )
+        await response(scope, receive, send)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
         
-        # Create cache key
-        cache_key = str(request.url)
-        current_time = time.time()
+        cls = self._classify(scope["method"], scope["path"])
+        arrived = time.monotonic()
+        timeout = self._match(self.timeout_rules, scope["method"], scope["path"], self.timeout)
+        deadline = None if timeout is None else arrived + timeout
+        try:
+            await self.limiter.acquire(cls, self.timeout)
+        except (AdmissionRejected, asyncio.TimeoutError):
+            logger.warning(f"Shed {cls} request {scope['method']} {scope['path']}")
+            await self._reject(scope, receive, send, status.HTTP_503_SERVICE_UNAVAILABLE,
+                               "الخادم مشغول حالياً، يرجى المحاولة لاحقاً")
+            return
         
-        # Check cache
-        if cache_key in self.cache:
-            cached_response, timestamp = self.cache[cache_key]
-            if current_time - timestamp < self.ttl:
-                logger.debug(f"Cache hit: {cache_key}")
-                return cached_response
+        response_started = False
         
-        # Process request
-        response = await call_next(request)
+        async def send_tracking(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        try:
+            async with asyncio.timeout(None if deadline is None else deadline - time.monotonic()):
+                await self.app(scope, receive, send_tracking)
+        except TimeoutError:
+            logger.warning(f"Request exceeded {timeout}s: {scope['method']} {scope['path']}")
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, status.HTTP_504_GATEWAY_TIMEOUT,
+                               "انتهت مهلة معالجة الطلب")
+        finally:
+            self.limiter.release(cls)
+
+class ResponseCacheMiddleware:
+    """تخزين مؤقت لاستجابات GET للمسارات المختارة فقط
+
+    `routes` maps a route template ("/api/events/seasonal/{event_id}/statistics")
+    to the tables its body is built from and a TTL in seconds. The key is the
+    path, the raw query string and a hash of the Authorization header; an
+    entry is served only while those tables' change versions are unchanged.
+    Only complete 200 responses are stored.
+    """
+    
+    def __init__(self, app: ASGIApp, cache: ResponseCache,
+                 routes: Dict[str, Tuple[Iterable[str], int]]):
+        self.app = app
+        self.cache = cache
+        self.routes = [
+            (_route_pattern(template), tuple(tables), ttl)
+            for template, (tables, ttl) in routes.items()
+        ]
+    
+    def _policy(self, path: str):
+        for pattern, tables, ttl in self.routes:
+            if pattern.match(path):
+                return tables, ttl
+        return None
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        policy = self._policy(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
         
-        # Cache successful responses
-        if response.status_code == 200:
-            self.cache[cache_key] = (response, current_time)
+        tables, ttl = policy
+        headers = Headers(scope=scope)
+        authorization = headers.get("authorization", "")
+        identity = hashlib.sha256(authorization.encode()).hexdigest()[:16] if authorization else ""
+        key = (scope["path"], scope["query_string"], identity)
+        versions = await changes.versions_async(tables)
         
-        return response
+        if "no-cache" not in headers.get("cache-control", ""):
+            cached = self.cache.get(key, versions)
+            if cached is not None:
+                status_code, cached_headers, body = cached
+                await send({
+                    "type": "http.response.start",
+                    "status": status_code,
+                    "headers": cached_headers + [(b"x-cache", b"HIT")],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        
+        start_message: Message = {}
+        chunks = []
+        
+        async def send_caching(message: Message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-cache", b"MISS")]
+            elif message["type"] == "http.response.body" and start_message.get("status") == 200:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    stored_headers = [(name, value) for name, value in start_message["headers"]
+                                      if name != b"x-cache"]
+                    self.cache.put(key, versions, ttl, 200, stored_headers, b"".join(chunks))
+            await send(message)
+        
+        await self.app(scope, receive, send_caching)
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+class SecurityHeadersMiddleware:
     """إضافة رؤوس الأمان"""
     
-    async def dispatch(self, request: Request, call_next: Callable):
-        response = await call_next(request)
+    SECURITY_HEADERS = {
+        "X-Content-Type-Options": "nosniff",
+        "X-Frame-Options": "DENY",
+        "X-XSS-Protection": "1; mode=block",
+        "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    }
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Add security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                # Add security headers
+                headers = MutableHeaders(scope=message)
+                for name, value in self.SECURITY_HEADERS.items():
+                    headers[name] = value
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_headers)
+
+class ConditionalGetMiddleware:
+    """ETag / If-None-Match للمسارات التي يتم استطلاعها باستمرار
+
+    `routes` maps a path to the tables its body is built from (and an optional
+    time bucket in seconds). The validator comes from the in-memory change
+    tracker, so a matching If-None-Match is answered with 304 before the
+    route runs - no SQLite query, no serialization.
+    """
+
+    def __init__(self, app: ASGIApp,
+                 routes: Dict[str, Tuple[Iterable[str], Optional[int]]]):
+        self.app = app
+        self.routes = {path: (tuple(tables), period) for path, (tables, period) in routes.items()}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        route = self.routes.get(scope.get("path")) if scope["type"] == "http" else None
+        if route is None or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        etag = await changes.etag_async(*route)
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [(b"etag", etag.encode()), (b"cache-control", b"no-cache")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_etag(message: Message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(scope=message)
+                headers["ETag"] = etag
+                headers["Cache-Control"] = "no-cache"
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+class CompressionMiddleware:
+    """ضغط الاستجابات (brotli أو gzip حسب Accept-Encoding)
+
+    Pure ASGI. Bodies with a known Content-Length of at least `minimum_size`
+    are collected and compressed in one pass; streams without a length
+    (SSE) and small bodies pass through untouched. Bodies of `large_size`
+    or more are compressed at the fastest level in a worker thread, so a
+    multi-megabyte response never stalls the event loop.
+    """
+
+    def __init__(self, app: ASGIApp,
+                 minimum_size: int = settings.COMPRESSION_MINIMUM_SIZE,
+                 gzip_level: int = settings.GZIP_COMPRESS_LEVEL,
+                 brotli_quality: int = settings.BROTLI_QUALITY,
+                 large_size: int = settings.COMPRESSION_LARGE_BODY_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.large_size = large_size
+
+    def _negotiate(self, scope: Scope):
+        accept = Headers(scope=scope).get("accept-encoding", "").lower()
+        if brotli is not None and "br" in accept:
+            return "br"
+        if "gzip" in accept:
+            return "gzip"
+        return None
+
+    def _compress(self, encoding: str, body: bytes, fast: bool = False) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=1 if fast else self.brotli_quality)
+        return gzip.compress(body, compresslevel=1 if fast else self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self._negotiate(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Message = {}
+        chunks = []
+        mode = None  # None until the first body chunk, then "compress" or "passthrough"
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, mode
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or mode == "passthrough":
+                await send(message)
+                return
+
+            if mode is None:
+                headers = Headers(raw=start_message["headers"])
+                length = headers.get("content-length")
+                size = int(length) if length and length.isdigit() else None
+                if message.get("more_body", False):
+                    eligible = size is not None and size >= self.minimum_size
+                else:
+                    eligible = len(message.get("body", b"")) >= self.minimum_size
+                if "content-encoding" in headers or not eligible:
+                    mode = "passthrough"
+                    await send(start_message)
+                    await send(message)
+                    return
+                mode = "compress"
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            if len(body) >= self.large_size:
+                # zlib and brotli release the GIL while compressing
+                body = await asyncio.get_running_loop().run_in_executor(None, self._compress, encoding, body, True)
+            else:
+                body = self._compress(encoding, body)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
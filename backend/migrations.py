@@ -0,0 +1,696 @@
+"""
+Schema Migrations
+ترحيل مخطط قاعدة البيانات بإصدارات مرتبة
+"""
+import threading
+from typing import List, Tuple
+
+from db_pool import get_pool
+
+# ===== Migration 1: core tables (database.py) =====
+CORE_TABLES = [
+    # Events table
+    '''
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        device_id TEXT NOT NULL,
+        type TEXT NOT NULL,
+        level TEXT NOT NULL,
+        status TEXT DEFAULT 'open',
+        home_id TEXT,
+        absher_id TEXT,
+        location TEXT,
+        resolved_at TEXT,
+        resolved_by TEXT,
+        resolution_notes TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+
+    # Officers table
+    '''
+    CREATE TABLE IF NOT EXISTS officers (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        badge_number TEXT UNIQUE NOT NULL,
+        rank TEXT,
+        phone TEXT,
+        email TEXT,
+        status TEXT DEFAULT 'active',
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+
+    # Users table (for authentication)
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL,
+        full_name TEXT,
+        email TEXT,
+        officer_id TEXT,
+        is_active BOOLEAN DEFAULT 1,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        last_login TEXT,
+        FOREIGN KEY (officer_id) REFERENCES officers(id)
+    )
+    ''',
+
+    # Danger zones table
+    '''
+    CREATE TABLE IF NOT EXISTS danger_zones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        center_lat REAL NOT NULL,
+        center_lng REAL NOT NULL,
+        radius REAL NOT NULL,
+        severity TEXT DEFAULT 'medium',
+        description TEXT,
+        is_active BOOLEAN DEFAULT 1,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+
+    # Messages table (for internal communication)
+    '''
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        from_user_id INTEGER,
+        to_user_id INTEGER,
+        to_officer_id TEXT,
+        subject TEXT,
+        body TEXT NOT NULL,
+        is_broadcast BOOLEAN DEFAULT 0,
+        is_read BOOLEAN DEFAULT 0,
+        priority TEXT DEFAULT 'normal',
+        sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        read_at TEXT,
+        FOREIGN KEY (from_user_id) REFERENCES users(id),
+        FOREIGN KEY (to_user_id) REFERENCES users(id),
+        FOREIGN KEY (to_officer_id) REFERENCES officers(id)
+    )
+    ''',
+
+    # Activity log table
+    '''
+    CREATE TABLE IF NOT EXISTS activity_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        action TEXT NOT NULL,
+        entity_type TEXT,
+        entity_id TEXT,
+        details TEXT,
+        ip_address TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    ''',
+
+    # Resolutions table (track all resolved issues)
+    '''
+    CREATE TABLE IF NOT EXISTS resolutions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER,
+        device_id TEXT NOT NULL,
+        device_name TEXT,
+        original_type TEXT NOT NULL,
+        original_level TEXT NOT NULL,
+        resolved_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        resolved_by TEXT,
+        resolution_type TEXT,
+        notes TEXT,
+        response_time_seconds INTEGER,
+        FOREIGN KEY (event_id) REFERENCES events(id)
+    )
+    ''',
+]
+
+# ===== Migration 2: seasonal events tables (events_management.py) =====
+EVENTS_TABLES = [
+    # جدول الفعاليات الموسمية
+    '''
+    CREATE TABLE IF NOT EXISTS seasonal_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_name TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        description TEXT,
+        start_date DATETIME NOT NULL,
+        end_date DATETIME NOT NULL,
+        location_lat REAL,
+        location_lng REAL,
+        location_name TEXT,
+        max_participants INTEGER,
+        current_participants INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'planned',
+        security_level TEXT DEFAULT 'high',
+        requires_biometric BOOLEAN DEFAULT 1,
+        requires_iot_device BOOLEAN DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+
+    # جدول أجهزة IoT والأساور الذكية
+    '''
+    CREATE TABLE IF NOT EXISTS iot_devices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id TEXT UNIQUE NOT NULL,
+        device_type TEXT NOT NULL,
+        device_name TEXT NOT NULL,
+        participant_id TEXT NOT NULL,
+        event_id INTEGER NOT NULL,
+        battery_level REAL DEFAULT 100,
+        is_active BOOLEAN DEFAULT 1,
+        signal_strength REAL,
+        last_sync DATETIME,
+        firmware_version TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
+    )
+    ''',
+
+    # جدول المشاركين في الفعاليات
+    '''
+    CREATE TABLE IF NOT EXISTS event_participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        participant_id TEXT UNIQUE NOT NULL,
+        event_id INTEGER NOT NULL,
+        full_name TEXT NOT NULL,
+        national_id TEXT,
+        passport_number TEXT,
+        phone TEXT,
+        email TEXT,
+        age INTEGER,
+        gender TEXT,
+        registration_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'registered',
+        verification_status TEXT DEFAULT 'pending',
+        access_level TEXT DEFAULT 'basic',
+        is_verified BOOLEAN DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
+    )
+    ''',
+
+    # جدول البيانات البيومترية
+    '''
+    CREATE TABLE IF NOT EXISTS biometric_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        participant_id TEXT NOT NULL,
+        event_id INTEGER NOT NULL,
+        fingerprint_hash TEXT,
+        facial_recognition_data TEXT,
+        iris_scan_data TEXT,
+        voice_recognition_data TEXT,
+        verification_time DATETIME,
+        verification_status TEXT DEFAULT 'pending',
+        confidence_score REAL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
+    )
+    ''',
+
+    # جدول تتبع الدخول والخروج
+    '''
+    CREATE TABLE IF NOT EXISTS access_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        participant_id TEXT NOT NULL,
+        event_id INTEGER NOT NULL,
+        device_id TEXT,
+        access_type TEXT,
+        entry_time DATETIME,
+        exit_time DATETIME,
+        entry_location_lat REAL,
+        entry_location_lng REAL,
+        exit_location_lat REAL,
+        exit_location_lng REAL,
+        access_point TEXT,
+        status TEXT DEFAULT 'active',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
+    )
+    ''',
+
+    # جدول تتبع الموقع الجغرافي
+    '''
+    CREATE TABLE IF NOT EXISTS location_tracking (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        participant_id TEXT NOT NULL,
+        event_id INTEGER NOT NULL,
+        device_id TEXT,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        accuracy REAL,
+        altitude REAL,
+        speed REAL,
+        heading REAL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
+    )
+    ''',
+
+    # جدول التنبيهات الأمنية
+    '''
+    CREATE TABLE IF NOT EXISTS security_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER NOT NULL,
+        participant_id TEXT,
+        device_id TEXT,
+        alert_type TEXT NOT NULL,
+        severity TEXT DEFAULT 'medium',
+        description TEXT,
+        location_lat REAL,
+        location_lng REAL,
+        action_taken TEXT,
+        resolved BOOLEAN DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        resolved_at DATETIME,
+        FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
+    )
+    ''',
+
+    # جدول محاولات الدخول المزيفة
+    '''
+    CREATE TABLE IF NOT EXISTS fraud_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER NOT NULL,
+        participant_id TEXT,
+        device_id TEXT,
+        attempt_type TEXT NOT NULL,
+        details TEXT,
+        location_lat REAL,
+        location_lng REAL,
+        ip_address TEXT,
+        user_agent TEXT,
+        severity TEXT DEFAULT 'high',
+        action_taken TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+
+    # جدول معرفات الدخول الشخصية
+    '''
+    CREATE TABLE IF NOT EXISTS access_credentials (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        participant_id TEXT NOT NULL,
+        event_id INTEGER NOT NULL,
+        credential_type TEXT NOT NULL,
+        credential_data TEXT NOT NULL,
+        qr_code TEXT,
+        nfc_uid TEXT,
+        expiry_date DATETIME,
+        is_active BOOLEAN DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(event_id) REFERENCES seasonal_events(id)
+    )
+    ''',
+]
+
+# ===== Migration 3: hot-path indexes =====
+HOT_PATH_INDEXES = [
+    # get_events: ORDER BY timestamp with and without a status filter
+    'CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_events_status_timestamp ON events (status, timestamp)',
+    # get_statistics: GROUP BY level
+    'CREATE INDEX IF NOT EXISTS idx_events_level ON events (level)',
+    # get_resolutions: ORDER BY resolved_at
+    'CREATE INDEX IF NOT EXISTS idx_resolutions_resolved_at ON resolutions (resolved_at)',
+    # get_participant_location_history
+    'CREATE INDEX IF NOT EXISTS idx_location_participant_event_ts '
+    'ON location_tracking (participant_id, event_id, timestamp)',
+    # get_active_alerts / get_security_report / get_event_statistics
+    'CREATE INDEX IF NOT EXISTS idx_alerts_event_resolved_created '
+    'ON security_alerts (event_id, resolved, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_alerts_event_created ON security_alerts (event_id, created_at)',
+    # get_fraud_report / get_event_statistics
+    'CREATE INDEX IF NOT EXISTS idx_fraud_event_created ON fraud_attempts (event_id, created_at)',
+    # list_event_participants / get_event_statistics
+    'CREATE INDEX IF NOT EXISTS idx_participants_event_verified '
+    'ON event_participants (event_id, is_verified)',
+    'CREATE INDEX IF NOT EXISTS idx_iot_devices_event_active ON iot_devices (event_id, is_active)',
+    'CREATE INDEX IF NOT EXISTS idx_access_logs_event_status ON access_logs (event_id, status)',
+    # verify_credential: one index per OR branch so SQLite can use a multi-index OR plan
+    'CREATE INDEX IF NOT EXISTS idx_credentials_qr_code ON access_credentials (qr_code, event_id)',
+    'CREATE INDEX IF NOT EXISTS idx_credentials_nfc_uid ON access_credentials (nfc_uid, event_id)',
+    'CREATE INDEX IF NOT EXISTS idx_credentials_data ON access_credentials (credential_data, event_id)',
+]
+
+# ===== Migration 4: change sequence for incremental event feeds =====
+# Every insert/update of an event stamps it with the next value of the
+# 'events' counter; deletes bump 'events_reset' so delta clients reload.
+EVENTS_CHANGE_SEQUENCE = [
+    'ALTER TABLE events ADD COLUMN change_seq INTEGER',
+    '''
+    CREATE TABLE IF NOT EXISTS change_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    "INSERT OR IGNORE INTO change_counters (name, value) VALUES ('events', 0), ('events_reset', 0)",
+    'UPDATE events SET change_seq = id',
+    "UPDATE change_counters SET value = (SELECT COALESCE(MAX(id), 0) FROM events) WHERE name = 'events'",
+    'CREATE INDEX IF NOT EXISTS idx_events_change_seq ON events (change_seq)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_events_insert_seq AFTER INSERT ON events
+    BEGIN
+        UPDATE change_counters SET value = value + 1 WHERE name = 'events';
+        UPDATE events SET change_seq = (SELECT value FROM change_counters WHERE name = 'events')
+        WHERE id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_events_update_seq
+    AFTER UPDATE OF timestamp, device_id, type, level, status, home_id, absher_id,
+                    location, resolved_at, resolved_by, resolution_notes ON events
+    BEGIN
+        UPDATE change_counters SET value = value + 1 WHERE name = 'events';
+        UPDATE events SET change_seq = (SELECT value FROM change_counters WHERE name = 'events')
+        WHERE id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_events_delete_seq AFTER DELETE ON events
+    BEGIN
+        UPDATE change_counters SET value = value + 1 WHERE name = 'events';
+        UPDATE change_counters SET value = (SELECT value FROM change_counters WHERE name = 'events')
+        WHERE name = 'events_reset';
+    END
+    ''',
+]
+
+# ===== Migration 5: materialized event counters for get_statistics =====
+# Totals by level/status and per-minute buckets (rolling 24h) kept in step
+# with the events table by triggers, inside the writing transaction.
+EVENT_MINUTE = "strftime('%Y-%m-%d %H:%M', {})"
+
+EVENTS_COUNTERS = [
+    '''
+    CREATE TABLE IF NOT EXISTS event_counters (
+        dimension TEXT NOT NULL,
+        key TEXT,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS event_minute_buckets (
+        minute TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    "INSERT INTO event_counters (dimension, key, count) SELECT 'total', 'all', COUNT(*) FROM events",
+    "INSERT INTO event_counters (dimension, key, count) SELECT 'level', level, COUNT(*) FROM events GROUP BY level",
+    "INSERT INTO event_counters (dimension, key, count) SELECT 'status', status, COUNT(*) FROM events GROUP BY status",
+    f'''
+    INSERT INTO event_minute_buckets (minute, count)
+    SELECT {EVENT_MINUTE.format('timestamp')} AS minute, COUNT(*) FROM events
+    WHERE datetime(timestamp) >= datetime('now', '-1 day')
+    GROUP BY minute
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_events_insert_counters AFTER INSERT ON events
+    BEGIN
+        INSERT INTO event_counters (dimension, key, count)
+        VALUES ('total', 'all', 1), ('level', NEW.level, 1), ('status', NEW.status, 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+        INSERT INTO event_minute_buckets (minute, count)
+        SELECT {EVENT_MINUTE.format('NEW.timestamp')}, 1 WHERE {EVENT_MINUTE.format('NEW.timestamp')} IS NOT NULL
+        ON CONFLICT (minute) DO UPDATE SET count = count + 1;
+        DELETE FROM event_minute_buckets WHERE minute < {EVENT_MINUTE.format("'now', '-1 day'")};
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_events_update_counters
+    AFTER UPDATE OF level, status, timestamp ON events
+    BEGIN
+        UPDATE event_counters SET count = count - 1
+        WHERE (dimension = 'level' AND key = OLD.level) OR (dimension = 'status' AND key = OLD.status);
+        INSERT INTO event_counters (dimension, key, count)
+        VALUES ('level', NEW.level, 1), ('status', NEW.status, 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+        UPDATE event_minute_buckets SET count = count - 1
+        WHERE minute = {EVENT_MINUTE.format('OLD.timestamp')};
+        INSERT INTO event_minute_buckets (minute, count)
+        SELECT {EVENT_MINUTE.format('NEW.timestamp')}, 1 WHERE {EVENT_MINUTE.format('NEW.timestamp')} IS NOT NULL
+        ON CONFLICT (minute) DO UPDATE SET count = count + 1;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_events_delete_counters AFTER DELETE ON events
+    BEGIN
+        UPDATE event_counters SET count = count - 1
+        WHERE (dimension = 'total' AND key = 'all')
+           OR (dimension = 'level' AND key = OLD.level)
+           OR (dimension = 'status' AND key = OLD.status);
+        UPDATE event_minute_buckets SET count = count - 1
+        WHERE minute = {EVENT_MINUTE.format('OLD.timestamp')};
+    END
+    ''',
+]
+
+# ===== Migration 6: filtered history indexes for keyset pagination =====
+# (filter, timestamp) with the implicit trailing rowid serves
+# WHERE filter = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC
+EVENTS_HISTORY_INDEXES = [
+    'DROP INDEX IF EXISTS idx_events_level',
+    'CREATE INDEX IF NOT EXISTS idx_events_level_timestamp ON events (level, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_events_device_timestamp ON events (device_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_events_home_timestamp ON events (home_id, timestamp)',
+]
+
+# ===== Migration 7: latest position per participant =====
+# Kept apart from the location_tracking history so live-map reads and the
+# per-flush upserts touch one small row per participant, never the history.
+LATEST_POSITIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS participant_positions (
+        event_id INTEGER NOT NULL,
+        participant_id TEXT NOT NULL,
+        device_id TEXT,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        accuracy REAL,
+        speed REAL,
+        heading REAL,
+        timestamp DATETIME NOT NULL,
+        PRIMARY KEY (event_id, participant_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    INSERT OR REPLACE INTO participant_positions
+    (event_id, participant_id, device_id, latitude, longitude, accuracy, speed, heading, timestamp)
+    SELECT event_id, participant_id, device_id, latitude, longitude, accuracy, speed, heading, MAX(timestamp)
+    FROM location_tracking GROUP BY event_id, participant_id
+    ''',
+]
+
+# ===== Migration 8: spatial access paths =====
+# An R*Tree of track segments for area queries on the location history: one
+# entry per participant per indexing pass (the bounding box of the fixes it
+# covers), so the tree grows by participants, not by fixes. first_id/last_id
+# bound the location_tracking rows a segment stands for; rows above
+# spatial_index_state.last_id are not indexed yet and are scanned directly.
+# Also the last-known position of each officer.
+SPATIAL_INDEXES = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS location_segments USING rtree (
+        id, min_lat, max_lat, min_lng, max_lng,
+        +event_id, +participant_id, +start_time, +end_time, +first_id, +last_id
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS spatial_index_state (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    )
+    ''',
+    # Existing history: one segment per participant per minute
+    '''
+    INSERT INTO location_segments
+    (min_lat, max_lat, min_lng, max_lng, event_id, participant_id, start_time, end_time, first_id, last_id)
+    SELECT MIN(latitude), MAX(latitude), MIN(longitude), MAX(longitude), event_id, participant_id,
+           MIN(timestamp), MAX(timestamp), MIN(id), MAX(id)
+    FROM location_tracking GROUP BY event_id, participant_id, substr(timestamp, 1, 16)
+    ''',
+    '''
+    INSERT OR REPLACE INTO spatial_index_state (name, last_id)
+    SELECT 'location_tracking', COALESCE(MAX(id), 0) FROM location_tracking
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS officer_positions (
+        officer_id TEXT PRIMARY KEY,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        accuracy REAL,
+        timestamp TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''',
+]
+
+# ===== Migration 9: NULL-safe event counter keys =====
+# SQLite treats NULL primary-key values as distinct, so events with a NULL
+# level or status added a new counter row each instead of bumping one.
+# Keys become NOT NULL ('' stands for NULL) and the counters are rebuilt.
+COUNTER_KEY = "COALESCE({}, '')"
+
+EVENTS_COUNTERS_NULL_KEYS = [
+    'DROP TRIGGER IF EXISTS trg_events_insert_counters',
+    'DROP TRIGGER IF EXISTS trg_events_update_counters',
+    'DROP TRIGGER IF EXISTS trg_events_delete_counters',
+    'DROP TABLE IF EXISTS event_counters',
+    '''
+    CREATE TABLE event_counters (
+        dimension TEXT NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key)
+    )
+    ''',
+    "INSERT INTO event_counters (dimension, key, count) SELECT 'total', 'all', COUNT(*) FROM events",
+    f"""
+    INSERT INTO event_counters (dimension, key, count)
+    SELECT 'level', {COUNTER_KEY.format('level')} AS level_key, COUNT(*) FROM events GROUP BY level_key
+    """,
+    f"""
+    INSERT INTO event_counters (dimension, key, count)
+    SELECT 'status', {COUNTER_KEY.format('status')} AS status_key, COUNT(*) FROM events GROUP BY status_key
+    """,
+    f'''
+    CREATE TRIGGER trg_events_insert_counters AFTER INSERT ON events
+    BEGIN
+        INSERT INTO event_counters (dimension, key, count)
+        VALUES ('total', 'all', 1), ('level', {COUNTER_KEY.format('NEW.level')}, 1),
+               ('status', {COUNTER_KEY.format('NEW.status')}, 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+        INSERT INTO event_minute_buckets (minute, count)
+        SELECT {EVENT_MINUTE.format('NEW.timestamp')}, 1 WHERE {EVENT_MINUTE.format('NEW.timestamp')} IS NOT NULL
+        ON CONFLICT (minute) DO UPDATE SET count = count + 1;
+        DELETE FROM event_minute_buckets WHERE minute < {EVENT_MINUTE.format("'now', '-1 day'")};
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_events_update_counters
+    AFTER UPDATE OF level, status, timestamp ON events
+    BEGIN
+        UPDATE event_counters SET count = count - 1
+        WHERE (dimension = 'level' AND key = {COUNTER_KEY.format('OLD.level')})
+           OR (dimension = 'status' AND key = {COUNTER_KEY.format('OLD.status')});
+        INSERT INTO event_counters (dimension, key, count)
+        VALUES ('level', {COUNTER_KEY.format('NEW.level')}, 1), ('status', {COUNTER_KEY.format('NEW.status')}, 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+        UPDATE event_minute_buckets SET count = count - 1
+        WHERE minute = {EVENT_MINUTE.format('OLD.timestamp')};
+        INSERT INTO event_minute_buckets (minute, count)
+        SELECT {EVENT_MINUTE.format('NEW.timestamp')}, 1 WHERE {EVENT_MINUTE.format('NEW.timestamp')} IS NOT NULL
+        ON CONFLICT (minute) DO UPDATE SET count = count + 1;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_events_delete_counters AFTER DELETE ON events
+    BEGIN
+        UPDATE event_counters SET count = count - 1
+        WHERE (dimension = 'total' AND key = 'all')
+           OR (dimension = 'level' AND key = {COUNTER_KEY.format('OLD.level')})
+           OR (dimension = 'status' AND key = {COUNTER_KEY.format('OLD.status')});
+        UPDATE event_minute_buckets SET count = count - 1
+        WHERE minute = {EVENT_MINUTE.format('OLD.timestamp')};
+    END
+    ''',
+]
+
+# ===== Migration 10: participant import job status =====
+# Jobs run in the worker that received the upload; their status is kept here
+# so a poll answered by any worker sees it (state is the job's status JSON).
+IMPORT_JOBS = [
+    '''
+    CREATE TABLE IF NOT EXISTS participant_import_jobs (
+        job_id TEXT PRIMARY KEY,
+        event_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        state TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_import_jobs_updated ON participant_import_jobs (updated_at)',
+]
+
+# Ordered list of (version, name, statements). Append only - never edit an applied step.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, 'core tables', CORE_TABLES),
+    (2, 'seasonal events tables', EVENTS_TABLES),
+    (3, 'hot path indexes', HOT_PATH_INDEXES),
+    (4, 'events change sequence', EVENTS_CHANGE_SEQUENCE),
+    (5, 'materialized event counters', EVENTS_COUNTERS),
+    (6, 'events history indexes', EVENTS_HISTORY_INDEXES),
+    (7, 'latest participant positions', LATEST_POSITIONS),
+    (8, 'spatial indexes', SPATIAL_INDEXES),
+    (9, 'null-safe event counter keys', EVENTS_COUNTERS_NULL_KEYS),
+    (10, 'participant import jobs', IMPORT_JOBS),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def get_schema_version(conn) -> int:
+    """Highest applied migration version (0 for a fresh database)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(db_path: str) -> int:
+    """Apply pending migrations once per process and return the schema version.
+
+    Each step runs in its own BEGIN IMMEDIATE transaction, so concurrent
+    workers starting together serialize on the write lock and skip steps
+    another process already applied.
+    """
+    if db_path in _migrated:
+        return LATEST_VERSION
+
+    with _migrate_lock:
+        if db_path in _migrated:
+            return LATEST_VERSION
+
+        with get_pool(db_path).connection() as conn:
+            current = get_schema_version(conn)
+            conn.commit()
+
+            for version, name, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    if get_schema_version(conn) >= version:
+                        conn.rollback()
+                        continue
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(
+                        'INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                        (version, name)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                print(f"✅ Applied migration {version}: {name}")
+
+        _migrated.add(db_path)
+        return LATEST_VERSION
@@ -0,0 +1,234 @@
+"""
+Bulk Participant Import
+استيراد المشاركين بالجملة من ملفات CSV و NDJSON
+"""
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from config import settings
+
+try:
+    import python_multipart
+except ImportError:
+    try:
+        import multipart as python_multipart  # releases before the package rename
+    except ImportError:  # optional, only needed for multipart/form-data uploads
+        python_multipart = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+
+
+def detect_format(content_type: str = "", filename: str = "") -> Optional[str]:
+    """csv | ndjson from a content type or file extension"""
+    content_type = content_type.lower()
+    filename = filename.lower()
+    if "csv" in content_type or filename.endswith(".csv"):
+        return "csv"
+    if any(kind in content_type for kind in ("ndjson", "jsonl", "json-seq")) \
+            or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+
+def iter_rows(path: str, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (row number, dict or error message), reading the file one line at a time"""
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        if fmt == "csv":
+            for number, row in enumerate(csv.DictReader(file), start=1):
+                if None in row:
+                    yield number, "Too many columns"
+                    continue
+                # Empty cells are missing values, so optional fields stay None
+                yield number, {key.strip(): value for key, value in row.items() if value not in ('', None)}
+        else:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    yield number, f"Invalid JSON: {e}"
+                    continue
+                yield number, item if isinstance(item, dict) else "Row must be a JSON object"
+
+
+class ImportJob:
+    """حالة مهمة استيراد واحدة"""
+
+    def __init__(self, event_id: int, path: str, fmt: str):
+        self.job_id = uuid.uuid4().hex
+        self.event_id = event_id
+        self.path = path
+        self.format = fmt
+        self.status = "queued"
+        self.rows_read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.message: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def reject(self, row: int, error: str, participant_id: Optional[str] = None):
+        self.rejected += 1
+        if len(self.errors) < settings.PARTICIPANT_IMPORT_MAX_ERRORS:
+            self.errors.append({'row': row, 'participant_id': participant_id, 'error': error})
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            'job_id': self.job_id,
+            'event_id': self.event_id,
+            'format': self.format,
+            'status': self.status,
+            'rows_read': self.rows_read,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows_read / elapsed) if elapsed else 0,
+            'message': self.message,
+            'errors': list(self.errors),
+            'errors_truncated': self.rejected > len(self.errors),
+        }
+
+
+class ParticipantImporter:
+    """يشغّل مهام الاستيراد واحدة تلو الأخرى في خيط خلفي
+
+    Each job streams its spooled upload row by row, validates rows with
+    `validate` (raising pydantic's ValidationError), and inserts them in
+    transactions of `chunk_size` rows, so memory stays flat and live writers
+    only ever wait for one chunk. Progress is visible through get() while
+    the job runs; finished jobs are kept up to `jobs_kept`. Every status
+    change (and each committed chunk) is also saved with
+    `events_db.save_import_job`, so any worker can answer a status poll.
+    """
+
+    def __init__(self, events_db, validate: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 chunk_size: int = settings.PARTICIPANT_IMPORT_CHUNK_SIZE,
+                 max_participants: int = settings.MAX_PARTICIPANTS_PER_EVENT,
+                 jobs_kept: int = settings.PARTICIPANT_IMPORT_JOBS_KEPT):
+        self.events_db = events_db
+        self.validate = validate
+        self.chunk_size = chunk_size
+        self.max_participants = max_participants
+        self.jobs_kept = jobs_kept
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[ImportJob]" = queue.Queue()
+        self._worker = None
+
+    def submit(self, event_id: int, path: str, fmt: str) -> ImportJob:
+        """Queue an import of the file at `path` (deleted once the job ends)"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported import format: {fmt}")
+        job = ImportJob(event_id, path, fmt)
+        self._save(job)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.jobs_kept:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="participant-import", daemon=True)
+                self._worker.start()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status of a job: live if this worker runs it, else as last saved"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.events_db.get_import_job(job_id)
+
+    def _save(self, job: ImportJob):
+        try:
+            self.events_db.save_import_job(job.to_dict(), self.jobs_kept)
+        except Exception as e:  # the job goes on; its status stays visible on this worker
+            logger.error(f"Saving participant import {job.job_id} status failed: {e}")
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            self._save(job)
+            try:
+                self._import(job)
+                job.status = "completed"
+            except Exception as e:
+                logger.error(f"Participant import {job.job_id} failed: {e}")
+                job.status = "failed"
+                job.message = str(e)
+            finally:
+                job.finished_at = time.time()
+                try:
+                    os.unlink(job.path)
+                except OSError:
+                    pass
+            self._save(job)
+            logger.info(
+                f"Participant import {job.job_id} {job.status}: "
+                f"{job.imported} imported, {job.rejected} rejected"
+            )
+
+    def _import(self, job: ImportJob):
+        event = self.events_db.get_event(job.event_id) or {}
+        limit = min(self.max_participants, event.get('max_participants') or self.max_participants)
+        room = limit - self.events_db.count_event_participants(job.event_id)
+        seen = set()
+        chunk: List[Tuple[int, Dict[str, Any]]] = []
+
+        for number, item in iter_rows(job.path, job.format):
+            job.rows_read += 1
+            if isinstance(item, str):
+                job.reject(number, item)
+                continue
+            try:
+                participant = self.validate(item)
+            except ValidationError as e:
+                job.reject(number, "; ".join(
+                    f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+                ), item.get('participant_id'))
+                continue
+
+            participant_id = participant['participant_id']
+            if participant_id in seen:
+                job.reject(number, "Duplicate participant_id in file", participant_id)
+                continue
+            if len(seen) >= room:
+                job.reject(number, f"Event is full ({limit} participants)", participant_id)
+                continue
+            seen.add(participant_id)
+            chunk.append((number, participant))
+            if len(chunk) >= self.chunk_size:
+                self._flush(job, chunk)
+                chunk = []
+
+        if chunk:
+            self._flush(job, chunk)
+
+    def _flush(self, job: ImportJob, chunk: List[Tuple[int, Dict[str, Any]]]):
+        skipped = set(self.events_db.register_participants(job.event_id, [row for _, row in chunk]))
+        for number, participant in chunk:
+            if participant['participant_id'] in skipped:
+                job.reject(number, "participant_id is already registered", participant['participant_id'])
+        job.imported += len(chunk) - len(skipped)
+        self._save(job)
@@ -0,0 +1,178 @@
+"""
+Last-Known Positions
+آخر موقع معروف لكل مشارك في الذاكرة مع حفظ دوري في participant_positions
+"""
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from config import settings
+from spatial import GridIndex
+
+logger = logging.getLogger(__name__)
+
+# Entry layout; participant_positions has the same columns after event_id
+FIELDS = ('participant_id', 'device_id', 'latitude', 'longitude', 'accuracy', 'speed', 'heading', 'timestamp')
+_LAT, _LNG, _TIMESTAMP = 2, 3, 7
+
+
+class PositionStore:
+    """آخر موقع لكل مشارك، لكل فعالية، يُحدَّث في مكانه
+
+    Each event keeps an OrderedDict participant_id -> (FIELDS..., seq) in
+    update order, so "what moved since cursor N" walks back from the newest
+    entry only as far as N, and a GridIndex of the same participants for
+    bbox and radius queries. An event's saved positions are loaded from
+    `load_fn(event_id)` the first time it is touched; changed entries are
+    handed to `save_fn(event_id, entries)` every `persist_interval` seconds
+    by a background thread (and at exit). Fixes older than the stored one
+    are ignored.
+
+    The store is per process: with several workers each one sees the fixes
+    it ingested, plus whatever the others had persisted when it loaded.
+    """
+
+    def __init__(self, load_fn: Callable[[int], List[tuple]],
+                 save_fn: Callable[[int, List[tuple]], None],
+                 persist_interval: float = settings.POSITIONS_PERSIST_INTERVAL):
+        self.load_fn = load_fn
+        self.save_fn = save_fn
+        self.persist_interval = persist_interval
+        self._events: Dict[int, "OrderedDict[str, tuple]"] = {}
+        self._grids: Dict[int, GridIndex] = {}
+        self._dirty: Dict[int, Set[str]] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self._stopping = threading.Event()
+
+    def _event(self, event_id: int) -> "OrderedDict[str, tuple]":
+        """The event's positions, loaded from the database on first use (call under the lock)"""
+        positions = self._events.get(event_id)
+        if positions is None:
+            positions = OrderedDict()
+            grid = GridIndex()
+            for row in self.load_fn(event_id):
+                self._seq += 1
+                positions[row[0]] = tuple(row) + (self._seq,)
+                grid.update(row[0], row[_LAT], row[_LNG])
+            self._events[event_id] = positions
+            self._grids[event_id] = grid
+        return positions
+
+    def update(self, event_id: int, fixes: Iterable[Sequence]):
+        """Apply fixes laid out as FIELDS; returns the entries that changed"""
+        changed = []
+        with self._lock:
+            positions = self._event(event_id)
+            grid = self._grids[event_id]
+            dirty = self._dirty.setdefault(event_id, set())
+            for fix in fixes:
+                participant_id = fix[0]
+                current = positions.get(participant_id)
+                if current is not None and current[_TIMESTAMP] > fix[_TIMESTAMP]:
+                    continue
+                self._seq += 1
+                entry = tuple(fix) + (self._seq,)
+                positions[participant_id] = entry
+                positions.move_to_end(participant_id)
+                grid.update(participant_id, fix[_LAT], fix[_LNG])
+                dirty.add(participant_id)
+                changed.append(entry)
+        self._ensure_writer()
+        return changed
+
+    def query(self, event_id: int, bbox: Optional[Tuple[float, float, float, float]] = None,
+              since: Optional[int] = None) -> Dict[str, Any]:
+        """Positions of an event, optionally inside bbox (min_lng, min_lat, max_lng, max_lat)
+        and/or updated after the `since` cursor; newest first.
+
+        Positions are rows in FIELDS order (listed once as 'fields'), which
+        keeps tens of thousands of them cheap to build, encode and send.
+        """
+        width = len(FIELDS)
+        with self._lock:
+            cursor = self._seq
+            positions = self._event(event_id)
+            if since is not None:
+                selected = []
+                for entry in reversed(positions.values()):
+                    if entry[-1] <= since:
+                        break
+                    selected.append(entry)
+            elif bbox is not None:
+                selected = [positions[key] for key in self._grids[event_id].within_bbox(*bbox)]
+                selected.sort(key=lambda entry: entry[-1], reverse=True)
+            else:
+                selected = list(reversed(positions.values()))
+        if bbox is not None and since is not None:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            rows = [entry[:width] for entry in selected
+                    if min_lat <= entry[_LAT] <= max_lat and min_lng <= entry[_LNG] <= max_lng]
+        else:
+            rows = [entry[:width] for entry in selected]
+        return {
+            'cursor': cursor,
+            'count': len(rows),
+            'fields': FIELDS,
+            'positions': rows,
+        }
+
+    def nearby(self, event_id: int, lat: float, lng: float, radius_m: float,
+               limit: Optional[int] = None) -> Dict[str, Any]:
+        """Participants within radius_m meters of (lat, lng), nearest first;
+        each row is FIELDS followed by the distance in meters"""
+        width = len(FIELDS)
+        with self._lock:
+            positions = self._event(event_id)
+            found = self._grids[event_id].within_radius(lat, lng, radius_m)[:limit]
+            rows = [positions[key][:width] + (round(distance, 1),) for distance, key in found]
+        return {
+            'count': len(rows),
+            'fields': FIELDS + ('distance_m',),
+            'positions': rows,
+        }
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="positions-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.stop)
+
+    def persist(self):
+        """Save every entry changed since the last call"""
+        with self._lock:
+            batches = [
+                (event_id, [self._events[event_id][pid][:len(FIELDS)] for pid in dirty])
+                for event_id, dirty in self._dirty.items() if dirty
+            ]
+            self._dirty = {}
+        for event_id, entries in batches:
+            try:
+                self.save_fn(event_id, entries)
+            except Exception as e:
+                logger.error(f"Saving {len(entries)} positions of event {event_id} failed: {e}")
+                with self._lock:
+                    self._dirty.setdefault(event_id, set()).update(entry[0] for entry in entries)
+
+    def _run(self):
+        while not self._stopping.wait(self.persist_interval):
+            self.persist()
+
+    def stop(self):
+        self._stopping.set()
+        self.persist()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'events': len(self._events),
+                'positions': sum(len(positions) for positions in self._events.values()),
+                'unsaved': sum(len(dirty) for dirty in self._dirty.values()),
+                'cursor': self._seq,
+            }
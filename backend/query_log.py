@@ -0,0 +1,237 @@
+"""
+Slow Query Log
+سجل الاستعلامات البطيئة مع خطة التنفيذ (EXPLAIN QUERY PLAN)
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")  # full table or full index scan
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+_ITER_PAGE = 256  # rows per fetchmany() when a traced cursor is iterated
+
+
+def normalize(sql: str) -> str:
+    """Statement shape: literals become ?, IN lists collapse, whitespace is squeezed"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class QueryLog:
+    """إحصائيات كل استعلام (بعد التوحيد) وآخر الاستعلامات البطيئة
+
+    Every statement is timed (execute plus the fetches that follow it).
+    Statements slower than `threshold_ms` are kept in a ring buffer; the
+    first slow run of each statement shape also captures its query plan and
+    flags full scans of tables above `large_table_rows`.
+    """
+
+    PLAN_MAX_AGE = 600  # seconds before a statement's plan is captured again
+
+    def __init__(self, threshold_ms: float = settings.SLOW_QUERY_THRESHOLD_MS,
+                 buffer_size: int = settings.SLOW_QUERY_BUFFER_SIZE,
+                 max_statements: int = settings.SLOW_QUERY_MAX_STATEMENTS,
+                 large_table_rows: int = settings.SLOW_QUERY_LARGE_TABLE_ROWS):
+        self.threshold = threshold_ms / 1000
+        self.max_statements = max_statements
+        self.large_table_rows = large_table_rows
+        self._statements: Dict[str, Dict[str, Any]] = {}
+        self._slow = deque(maxlen=buffer_size)
+        self._table_sizes: Dict[str, tuple] = {}  # table -> (estimated rows, measured at)
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, params, elapsed: float, conn: sqlite3.Connection):
+        shape = normalize(sql)
+        with self._lock:
+            stats = self._statements.get(shape)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    # Forget the cheapest statement to make room
+                    cheapest = min(self._statements, key=lambda key: self._statements[key]['total_ms'])
+                    del self._statements[cheapest]
+                stats = self._statements[shape] = {
+                    'statement': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'slow_count': 0, 'plan': None, 'full_scans': [], 'plan_captured_at': 0.0,
+                }
+            elapsed_ms = elapsed * 1000
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if elapsed < self.threshold:
+                return
+            stats['slow_count'] += 1
+            capture_plan = time.time() - stats['plan_captured_at'] > self.PLAN_MAX_AGE
+            if capture_plan:
+                stats['plan_captured_at'] = time.time()
+
+        if capture_plan and shape.split(" ", 1)[0].upper() in _EXPLAINABLE:
+            plan, full_scans = self._explain(sql, params, conn)
+            with self._lock:
+                stats['plan'] = plan
+                stats['full_scans'] = full_scans
+        logger.warning(
+            "Slow query %.1f ms: %s", elapsed_ms, shape,
+            extra={'duration_ms': round(elapsed_ms, 3), 'statement': shape, 'full_scans': stats['full_scans']}
+        )
+        with self._lock:
+            self._slow.append({
+                'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'duration_ms': round(elapsed_ms, 3),
+                'statement': shape,
+                'full_scans': stats['full_scans'],
+            })
+
+    def _explain(self, sql: str, params, conn: sqlite3.Connection):
+        """EXPLAIN QUERY PLAN on the same connection; returns (plan lines, large scanned tables)"""
+        try:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+        except sqlite3.Error as e:
+            return [f"EXPLAIN failed: {e}"], []
+        plan = [row[3] for row in rows]
+        full_scans = []
+        for detail in plan:
+            match = _SCAN.match(detail)
+            if match and self._estimated_rows(match.group(1), conn) >= self.large_table_rows:
+                full_scans.append(match.group(1))
+        return plan, full_scans
+
+    def _estimated_rows(self, table: str, conn: sqlite3.Connection) -> int:
+        """MAX(rowid) is an O(log n) upper bound on the row count; cached for a minute"""
+        cached = self._table_sizes.get(table)
+        if cached and time.time() - cached[1] < 60:
+            return cached[0]
+        try:
+            rows = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+        except sqlite3.Error:
+            rows = 0
+        self._table_sizes[table] = (rows, time.time())
+        return rows
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            statements = [
+                {**{key: value for key, value in stats.items() if key != 'plan_captured_at'},
+                 'total_ms': round(stats['total_ms'], 3),
+                 'max_ms': round(stats['max_ms'], 3),
+                 'avg_ms': round(stats['total_ms'] / stats['count'], 3)}
+                for stats in self._statements.values()
+            ]
+            slow = list(self._slow)
+        statements.sort(key=lambda stats: stats['max_ms'], reverse=True)
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'slowest': statements[:limit],
+            'recent_slow': slow[::-1][:limit],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+
+
+class TracedCursor:
+    """Cursor wrapper timing each statement together with the fetches that follow it"""
+
+    __slots__ = ('_cursor', '_conn', '_log', '_sql', '_params', '_elapsed')
+
+    def __init__(self, cursor: sqlite3.Cursor, conn: sqlite3.Connection, log: QueryLog):
+        self._cursor = cursor
+        self._conn = conn
+        self._log = log
+        self._sql = None
+        self._params = None
+        self._elapsed = 0.0
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def flush(self):
+        """Record the statement run last on this cursor"""
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            self._log.record(sql, self._params, self._elapsed, self._conn)
+
+    def execute(self, sql: str, params=()):
+        self.flush()
+        self._sql, self._params, self._elapsed = sql, params, 0.0
+        self._timed(self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        self.flush()
+        # The first row's parameters are enough for EXPLAIN
+        first = seq_of_params[0] if isinstance(seq_of_params, (list, tuple)) and seq_of_params else None
+        self._sql, self._params, self._elapsed = sql, first, 0.0
+        self._timed(self._cursor.executemany, sql, seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, size: Optional[int] = None):
+        return self._timed(self._cursor.fetchmany, size or self._cursor.arraysize)
+
+    def fetchall(self) -> List:
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        # Fetch in small timed pages so a caller that stops early never reads the rest
+        fetchmany, size = self._cursor.fetchmany, max(self._cursor.arraysize, _ITER_PAGE)
+        while True:
+            rows = self._timed(fetchmany, size)
+            if not rows:
+                return
+            yield from rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """Connection wrapper handing out TracedCursors; flush() records pending statements"""
+
+    def __init__(self, conn: sqlite3.Connection, log: QueryLog):
+        self._conn = conn
+        self._log = log
+        self._cursors: List[TracedCursor] = []
+
+    def cursor(self) -> TracedCursor:
+        cursor = TracedCursor(self._conn.cursor(), self._conn, self._log)
+        self._cursors.append(cursor)
+        return cursor
+
+    def execute(self, sql: str, params=()) -> TracedCursor:
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params) -> TracedCursor:
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def flush(self):
+        for cursor in self._cursors:
+            cursor.flush()
+        self._cursors.clear()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+query_log = QueryLog()
@@ -0,0 +1,64 @@
+"""
+Token Bucket Rate Limiter
+محدد معدل الطلبات بخوارزمية Token Bucket
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List
+
+from config import settings
+
+
+class TokenBucketLimiter:
+    """دلو رموز لكل مفتاح (IP أو مستخدم أو مسار) بتحديث O(1)
+
+    Each bucket holds up to `requests` tokens and refills continuously at
+    `requests / period` per second. The key table is an LRU bounded by
+    `max_keys`; buckets idle long enough to be full again carry no state
+    and are evicted as they reach the cold end.
+    """
+
+    def __init__(self, max_keys: int = settings.RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [tokens, last update (monotonic), seconds until full again]
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def hit(self, key: Hashable, requests: int, period: float) -> float:
+        """Take one token; returns 0 when allowed, else seconds until a token is available"""
+        now = time.monotonic()
+        rate = requests / period
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(requests), now, 0.0]
+                self._buckets[key] = bucket
+            else:
+                bucket[0] = min(float(requests), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - bucket[0]) / rate
+            bucket[2] = (requests - bucket[0]) / rate
+            self._evict(now)
+            return retry_after
+
+    def _evict(self, now: float):
+        """Drop cold buckets that are full again, then enforce the size bound"""
+        buckets = self._buckets
+        while buckets:
+            key, (_, updated, refill) = next(iter(buckets.items()))
+            if len(buckets) <= self.max_keys and updated + refill > now:
+                break
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'keys': len(self._buckets), 'max_keys': self.max_keys, 'evicted': self.evicted}
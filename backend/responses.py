@@ -0,0 +1,71 @@
+"""
+Fast JSON Responses
+استجابات JSON سريعة بدون المرور على jsonable_encoder
+"""
+import functools
+import inspect
+import json
+from typing import Any, Callable, Optional
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize plain rows directly; anything exotic goes through jsonable_encoder"""
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=jsonable_encoder, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (or compact stdlib json)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _wrap_endpoint(endpoint: Callable, status_code: Optional[int] = None) -> Callable:
+    """Return dict/list results as FastJSONResponse so FastAPI skips jsonable_encoder.
+
+    FastAPI applies a route's status_code only to results it serializes
+    itself, so the wrapper carries it onto the response.
+    """
+    status_code = status_code or 200
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            result = await endpoint(*args, **kwargs)
+            return FastJSONResponse(result, status_code) if isinstance(result, (dict, list)) else result
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            result = endpoint(*args, **kwargs)
+            return FastJSONResponse(result, status_code) if isinstance(result, (dict, list)) else result
+    return wrapper
+
+
+class FastJSONRoute(APIRoute):
+    """Route class for endpoints that return plain rows from database.py / events_management.py.
+
+    Routes declaring a response_model keep FastAPI's validation path.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        response_model = kwargs.get("response_model")
+        if isinstance(response_model, DefaultPlaceholder):
+            # Not given: FastAPI would infer it from the return annotation
+            annotated = inspect.signature(endpoint).return_annotation is not inspect.Signature.empty
+            response_model = None if not annotated else response_model
+        if response_model is None:
+            endpoint = _wrap_endpoint(endpoint, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
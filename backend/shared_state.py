@@ -0,0 +1,282 @@
+"""
+Shared State Store
+مخزن حالة مشترك بين عمليات uvicorn (حدود الطلبات، التخزين المؤقت، أرقام التغييرات)
+"""
+import asyncio
+import functools
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config import settings
+from db_pool import get_pool
+from rate_limit import TokenBucketLimiter
+
+try:
+    import redis
+except ImportError:  # optional, only needed for SHARED_STATE_BACKEND=redis
+    redis = None
+
+# Shared backends do blocking I/O (busy_timeout, network round trips): request
+# paths hand their store calls to these threads instead of stalling the loop
+store_executor = ThreadPoolExecutor(max_workers=settings.SHARED_STATE_WORKERS, thread_name_prefix="shared-state")
+
+
+class SharedStore(ABC):
+    """واجهة المخزن: قيم JSON بمدة صلاحية، عدادات ذرية، ودلاء رموز
+
+    `shared` tells callers whether other worker processes see the same data;
+    when it is False they keep their faster in-process bookkeeping.
+    """
+
+    shared = True
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Call `fn(*args)` (which uses this store) from the event loop without blocking it;
+        only the in-process store runs inline"""
+        if not self.shared:
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(store_executor, functools.partial(fn, *args))
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def setdefault(self, key: str, value: Any) -> Any:
+        """Store `value` unless `key` exists; return whichever value is stored"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Atomically add `amount` (missing keys start at 0) and return the new value"""
+
+    @abstractmethod
+    def hit(self, key: str, requests: int, period: float) -> float:
+        """Token bucket take; 0 when allowed, else seconds until a token is available"""
+
+
+class LocalStore(SharedStore):
+    """مخزن داخل العملية (الافتراضي لعامل واحد)"""
+
+    shared = False
+
+    def __init__(self, max_keys: int = settings.RATE_LIMIT_MAX_KEYS):
+        self.limiter = TokenBucketLimiter(max_keys=max_keys)
+        self._data: Dict[str, tuple] = {}  # key -> (value, expires_at or None)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            self._data.pop(key, None)
+            return None
+        return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def setdefault(self, key: str, value: Any) -> Any:
+        with self._lock:
+            current = self.get(key)
+            if current is None:
+                self.set(key, value)
+                return value
+            return current
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = (self.get(key) or 0) + amount
+            self.set(key, value)
+            return value
+
+    def hit(self, key: str, requests: int, period: float) -> float:
+        return self.limiter.hit(key, requests, period)
+
+
+SQLITE_STATE_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS kv (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        allowed INTEGER NOT NULL,
+        updated REAL NOT NULL,
+        full_at REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_buckets_full_at ON buckets (full_at)',
+    'CREATE INDEX IF NOT EXISTS idx_kv_expires_at ON kv (expires_at)',
+)
+
+# One statement per take, so concurrent workers never lose an update
+SQLITE_TAKE_TOKEN = '''
+    INSERT INTO buckets (key, tokens, allowed, updated, full_at)
+    VALUES (:key, :capacity - 1, 1, :now, :now + 1 / :rate)
+    ON CONFLICT (key) DO UPDATE SET
+        allowed = MIN(:capacity, tokens + (:now - updated) * :rate) >= 1,
+        tokens = MIN(:capacity, tokens + (:now - updated) * :rate)
+                 - (MIN(:capacity, tokens + (:now - updated) * :rate) >= 1),
+        updated = :now,
+        full_at = :now + (:capacity - MIN(:capacity, tokens + (:now - updated) * :rate)
+                 + (MIN(:capacity, tokens + (:now - updated) * :rate) >= 1)) / :rate
+    RETURNING tokens, allowed
+'''
+
+
+class SQLiteStore(SharedStore):
+    """مخزن مشترك في ملف SQLite مستقل (WAL) لعدة عمليات على نفس الجهاز"""
+
+    PURGE_EVERY = 1000  # writes between sweeps of expired keys and full buckets
+
+    def __init__(self, path: str = settings.SHARED_STATE_PATH):
+        self.path = path
+        self._pool = get_pool(path)
+        self._writes = 0
+        with self._pool.connection() as conn:
+            for statement in SQLITE_STATE_TABLES:
+                conn.execute(statement)
+            conn.commit()
+
+    def _write(self, sql: str, params) -> Optional[tuple]:
+        with self._pool.connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                now = time.time()
+                conn.execute('DELETE FROM kv WHERE expires_at <= ?', (now,))
+                conn.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+            conn.commit()
+            return row
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time())
+            ).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._write(
+            'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value, default=str), time.time() + ttl if ttl else None)
+        )
+
+    def setdefault(self, key: str, value: Any) -> Any:
+        self._write('INSERT OR IGNORE INTO kv (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+        return self.get(key)
+
+    def delete(self, key: str):
+        self._write('DELETE FROM kv WHERE key = ?', (key,))
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        row = self._write('''
+            INSERT INTO kv (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value
+            RETURNING value
+        ''', (key, amount))
+        return int(row['value'])
+
+    def hit(self, key: str, requests: int, period: float) -> float:
+        rate = requests / period
+        row = self._write(SQLITE_TAKE_TOKEN, {
+            'key': key, 'capacity': float(requests), 'rate': rate, 'now': time.time()
+        })
+        return 0.0 if row['allowed'] else (1 - row['tokens']) / rate
+
+
+# Same token bucket as SQLITE_TAKE_TOKEN, run atomically inside Redis
+REDIS_TAKE_TOKEN = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+'''
+
+
+class RedisStore(SharedStore):
+    """مخزن Redis (أو أي خادم متوافق مع بروتوكوله)"""
+
+    def __init__(self, url: str = settings.SHARED_STATE_URL):
+        if redis is None:
+            raise RuntimeError("SHARED_STATE_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self._take_token = self.client.register_script(REDIS_TAKE_TOKEN)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.client.set(key, json.dumps(value, default=str), px=int(ttl * 1000) if ttl else None)
+
+    def setdefault(self, key: str, value: Any) -> Any:
+        self.client.set(key, json.dumps(value), nx=True)
+        return self.get(key)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return int(self.client.incrby(key, amount))
+
+    def hit(self, key: str, requests: int, period: float) -> float:
+        rate = requests / period
+        allowed, tokens = self._take_token(keys=[key], args=[requests, rate, time.time()])
+        return 0.0 if int(allowed) else (1 - float(tokens)) / rate
+
+
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> SharedStore:
+    """Process-wide store selected by SHARED_STATE_BACKEND (local | sqlite | redis)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = settings.SHARED_STATE_BACKEND
+                if backend == "sqlite":
+                    _store = SQLiteStore()
+                elif backend == "redis":
+                    _store = RedisStore()
+                elif backend == "local":
+                    _store = LocalStore()
+                else:
+                    raise ValueError(f"Unknown SHARED_STATE_BACKEND: {backend}")
+    return _store
@@ -0,0 +1,165 @@
+"""
+Spatial Index
+فهرس مكاني بشبكة منتظمة للبحث بنصف القطر والمستطيل المحيط
+"""
+import math
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from config import settings
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat: float, lng: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """(min_lng, min_lat, max_lng, max_lat) enclosing the circle"""
+    dlat = radius_m / METERS_PER_DEGREE
+    dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lng - dlng, lat - dlat, lng + dlng, lat + dlat
+
+
+class GridIndex:
+    """شبكة منتظمة من الخلايا: كل خلية تحمل مفاتيح النقاط التي تقع فيها
+
+    Cells are `cell_m` meters of latitude on each side (the same number of
+    degrees of longitude, so they narrow away from the equator). Moving a
+    point only touches two cells, and a query only visits the cells its
+    bbox overlaps before checking exact coordinates. Not thread-safe: the
+    owner holds its own lock.
+    """
+
+    def __init__(self, cell_m: float = settings.SPATIAL_GRID_CELL_METERS):
+        self.cell_deg = cell_m / METERS_PER_DEGREE
+        self._cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._points: Dict[Hashable, Tuple[float, float, Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def update(self, key: Hashable, lat: float, lng: float):
+        """Insert or move a point"""
+        cell = self._cell(lat, lng)
+        current = self._points.get(key)
+        if current is not None and current[2] != cell:
+            self._discard(key, current[2])
+        if current is None or current[2] != cell:
+            self._cells.setdefault(cell, set()).add(key)
+        self._points[key] = (lat, lng, cell)
+
+    def remove(self, key: Hashable):
+        current = self._points.pop(key, None)
+        if current is not None:
+            self._discard(key, current[2])
+
+    def _discard(self, key: Hashable, cell: Tuple[int, int]):
+        keys = self._cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self._cells[cell]
+
+    def within_bbox(self, min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> List[Hashable]:
+        """Keys of the points inside the bbox (edges included)"""
+        lat_lo, lng_lo = self._cell(min_lat, min_lng)
+        lat_hi, lng_hi = self._cell(max_lat, max_lng)
+        found = []
+        points = self._points
+        if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) > len(self._cells):
+            # A bbox wider than the populated area: walk the cells instead
+            cells = (keys for (i, j), keys in self._cells.items()
+                     if lat_lo <= i <= lat_hi and lng_lo <= j <= lng_hi)
+        else:
+            cells = (self._cells.get((i, j)) for i in range(lat_lo, lat_hi + 1)
+                     for j in range(lng_lo, lng_hi + 1))
+        for keys in cells:
+            if not keys:
+                continue
+            for key in keys:
+                lat, lng, _ = points[key]
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    found.append(key)
+        return found
+
+    def within_radius(self, lat: float, lng: float, radius_m: float) -> List[Tuple[float, Hashable]]:
+        """(distance in meters, key) of the points within radius_m, nearest first"""
+        points = self._points
+        found = []
+        for key in self.within_bbox(*radius_bbox(lat, lng, radius_m)):
+            point = points[key]
+            distance = haversine_m(lat, lng, point[0], point[1])
+            if distance <= radius_m:
+                found.append((distance, key))
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class PointIndex:
+    """نقاط بمفاتيح (مثل مواقع الضباط) مع بياناتها وفهرسها المكاني، آمنة بين الخيوط
+
+    `load_fn()` supplies the saved points as (key, lat, lng, data) the first
+    time the index is used.
+    """
+
+    def __init__(self, load_fn: Optional[Callable[[], Iterable[Tuple[Hashable, float, float, Any]]]] = None,
+                 cell_m: float = settings.SPATIAL_GRID_CELL_METERS):
+        self.load_fn = load_fn
+        self._grid = GridIndex(cell_m)
+        self._data: Dict[Hashable, Any] = {}
+        self._loaded = load_fn is None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            for key, lat, lng, data in self.load_fn():
+                self._grid.update(key, lat, lng)
+                self._data[key] = data
+            self._loaded = True
+
+    def set(self, key: Hashable, lat: float, lng: float, data: Any):
+        with self._lock:
+            self._ensure_loaded()
+            self._grid.update(key, lat, lng)
+            self._data[key] = data
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            self._ensure_loaded()
+            self._grid.remove(key)
+            self._data.pop(key, None)
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            self._ensure_loaded()
+            return self._data.get(key)
+
+    def all(self) -> List[Any]:
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._data.values())
+
+    def within_bbox(self, min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> List[Any]:
+        with self._lock:
+            self._ensure_loaded()
+            return [self._data[key] for key in self._grid.within_bbox(min_lng, min_lat, max_lng, max_lat)]
+
+    def within_radius(self, lat: float, lng: float, radius_m: float,
+                      limit: Optional[int] = None) -> List[Tuple[float, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            found = self._grid.within_radius(lat, lng, radius_m)[:limit]
+            return [(distance, self._data[key]) for distance, key in found]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._grid)
@@ -903,6 +903,31 @@ function stopSimulation() {
     }
 }
 
+/****************************************
+ * التحديث التدريجي: جلب التغييرات فقط منذ آخر مؤشر
+ ****************************************/
+let eventsCursor = 0;
+const eventsById = new Map();
+
+async function fetchEventsDelta() {
+    const res = await fetch(`${API_URL}?since_id=${eventsCursor}`);
+    const delta = await res.json();
+
+    if (delta.reset) eventsById.clear();
+    (delta.events || []).forEach(e => eventsById.set(e.id, e));
+    eventsCursor = delta.cursor;
+    if (delta.has_more) return fetchEventsDelta();
+
+    const events = [...eventsById.values()]
+        .sort((a, b) => (b.timestamp || "").localeCompare(a.timestamp || ""))
+        .slice(0, 1000);
+    if (eventsById.size > events.length) {
+        eventsById.clear();
+        events.forEach(e => eventsById.set(e.id, e));
+    }
+    return events;
+}
+
 /****************************************
  * جلب البيانات (مع Offline Mode + وضع الدوريات)
  ****************************************/
@@ -910,8 +935,7 @@ async function fetchEvents() {
     if (!fetchingEnabled) return;
 
     try {
-        const res = await fetch(API_URL);
-        const events = await res.json();
+        const events = await fetchEventsDelta();
 
         offlineBanner.style.display = "none";
         connectionStatus.innerHTML = `<span class="conn-dot"></span> متصل`;
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Backend modules import each other as top-level modules (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing them opens ./smart_security.db and ./logs: keep those out of the checkout
+os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
@@ -0,0 +1,51 @@
+"""
+Admission Deadlines
+التحقق من مهلة الطلب لكل مسار في التحكم في القبول
+"""
+import asyncio
+
+import pytest
+
+from admission import PriorityLimiter
+from middleware import AdmissionControlMiddleware
+
+
+async def _slow_app(scope, receive, send):
+    await asyncio.sleep(0.2)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _status(app, method: str, path: str) -> int:
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    asyncio.run(app(scope, receive, send))
+    return next(message["status"] for message in sent if message["type"] == "http.response.start")
+
+
+@pytest.fixture
+def admission():
+    return AdmissionControlMiddleware(
+        _slow_app, PriorityLimiter(limit=4), route_classes={}, timeout=0.05,
+        route_timeouts={"POST /ingest/{id}": None, "/upload": 1.0},
+    )
+
+
+def test_default_deadline_answers_504(admission):
+    assert _status(admission, "GET", "/report") == 504
+
+
+def test_route_without_deadline_runs_to_completion(admission):
+    assert _status(admission, "POST", "/ingest/7") == 200
+    assert _status(admission, "GET", "/ingest/7") == 504  # the rule is for POST only
+
+
+def test_route_with_longer_deadline(admission):
+    assert _status(admission, "POST", "/upload") == 200
@@ -0,0 +1,38 @@
+"""
+Async Mirrors
+التحقق من أن كل دالة كتابة تُنفَّذ على منفذ الكتابة
+"""
+import os
+import re
+
+import pytest
+
+# Methods named like this change the database and must run on the write executor
+_WRITE_NAME = re.compile(
+    r"^(init|create|add|update|delete|resolve|register|verify|log|track|save|change)_"
+)
+# ...except these, which only read or compute
+_NOT_WRITES = {
+    "add_event_async",  # awaits the ingest queue itself; database.add_event_async is called directly
+    "create_access_token", "verify_password", "verify_credential",
+}
+
+
+@pytest.fixture(scope="module")
+def async_db(tmp_path_factory):
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("db"))  # importing database creates ./smart_security.db
+    try:
+        import async_db
+        yield async_db
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize("mirror", ["db", "users", "events_db"])
+def test_every_write_method_is_mirrored_as_a_write(async_db, mirror):
+    mirror = getattr(async_db, mirror)
+    target = mirror._target
+    names = {name for name in dir(target) if not name.startswith("_") and callable(getattr(target, name))}
+    writes = {name for name in names if _WRITE_NAME.match(name)} - _NOT_WRITES
+    assert writes - mirror._writes == set()
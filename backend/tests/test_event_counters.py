@@ -0,0 +1,40 @@
+"""
+Event Counters
+التحقق من أن العدادات المادية تطابق جدول الأحداث (بما فيها القيم الفارغة)
+"""
+import pytest
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    import database
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "counters.db"))
+    database.init_database()
+    return database
+
+
+def _counted(database, column: str):
+    with database.get_db('test') as conn:
+        return {
+            row[0]: row[1]
+            for row in conn.execute(f"SELECT COALESCE({column}, ''), COUNT(*) FROM events GROUP BY 1")
+        }
+
+
+def test_counters_match_events_with_null_keys(database):
+    with database.get_db('test') as conn:
+        conn.executemany(
+            "INSERT INTO events (timestamp, device_id, type, level, status) VALUES (datetime('now'), 'd', 't', ?, ?)",
+            [('info', None), ('warning', None), ('warning', 'open'), ('critical', None), ('info', 'open')]
+        )
+        conn.execute("UPDATE events SET status = NULL WHERE id = 3")
+        conn.execute("UPDATE events SET level = 'info', status = 'resolved' WHERE id = 2")
+        conn.execute("DELETE FROM events WHERE id = 4")
+        conn.commit()
+
+    stats = database.get_statistics()
+    assert stats['total_events'] == 4
+    assert stats['events_by_level'] == _counted(database, 'level') == {'info': 3, 'warning': 1}
+    assert stats['events_by_status'] == _counted(database, 'status') == {'': 2, 'open': 1, 'resolved': 1}
+    with database.get_db('test') as conn:
+        assert conn.execute("SELECT COUNT(*) FROM event_counters WHERE key IS NULL").fetchone()[0] == 0
@@ -0,0 +1,203 @@
+"""
+Ingest Queue
+اختبارات طابور الإدخال والحفظ الجماعي
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ingest_queue import DURABILITY_ENQUEUE, IngestQueue, IngestQueueFull
+
+
+def _slow_once(delay: float):
+    """flush_fn whose first batch takes `delay` seconds; ids are the items themselves"""
+    calls = []
+
+    def flush(items):
+        if not calls:
+            time.sleep(delay)
+        calls.append(list(items))
+        return list(items)
+
+    flush.calls = calls
+    return flush
+
+
+def _blocking():
+    """flush_fn that waits until released; ids are the items themselves"""
+    release = threading.Event()
+    calls = []
+
+    def flush(items):
+        release.wait()
+        calls.append(list(items))
+        return list(items)
+
+    flush.release, flush.calls = release, calls
+    return flush
+
+
+def test_concurrent_submits_share_one_group_commit():
+    flush = _blocking()
+    ingest = IngestQueue(flush, batch_size=100, flush_interval_ms=50)
+
+    async def scenario():
+        first = asyncio.ensure_future(ingest.submit_async(0))
+        await asyncio.sleep(0.05)  # the writer holds item 0 in a flush
+        rest = [asyncio.ensure_future(ingest.submit_async(i)) for i in range(1, 51)]
+        await asyncio.sleep(0.01)
+        flush.release.set()
+        return [await first] + list(await asyncio.gather(*rest))
+
+    try:
+        assert asyncio.run(scenario()) == list(range(51))
+        assert flush.calls == [[0], list(range(1, 51))]
+        assert ingest.stats()['batches'] == 2
+    finally:
+        ingest.stop()
+
+
+def test_failed_group_falls_back_to_one_commit_per_item():
+    def flush(items):
+        if 'bad' in items:
+            raise ValueError('bad row')
+        return [f'id-{item}' for item in items]
+
+    ingest = IngestQueue(flush, flush_interval_ms=50)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(ingest.submit_async(item) for item in ('a', 'bad', 'b')), return_exceptions=True
+        )
+
+    try:
+        first, bad, last = asyncio.run(scenario())
+    finally:
+        ingest.stop()
+    assert (first, last) == ('id-a', 'id-b')
+    assert isinstance(bad, ValueError)
+    assert (ingest.stats()['committed'], ingest.stats()['failed']) == (2, 1)
+
+
+def test_full_queue_rejects_and_batches_are_all_or_nothing():
+    flush = _blocking()
+    ingest = IngestQueue(flush, max_size=5, flush_interval_ms=1, durability=DURABILITY_ENQUEUE,
+                         enqueue_timeout=0.05)
+
+    async def scenario():
+        await ingest.submit_async(0)
+        await asyncio.sleep(0.05)  # item 0 is in the blocked flush; the queue is empty again
+        await ingest.submit_many_async([1, 2, 3])
+        with pytest.raises(IngestQueueFull):
+            await ingest.submit_many_async([4, 5, 6])  # only 2 places left: none is queued
+        assert ingest.stats()['queue_depth'] == 3
+        await ingest.submit_many_async([4, 5])
+        with pytest.raises(IngestQueueFull):
+            await ingest.submit_async(6)
+
+    try:
+        asyncio.run(scenario())
+        assert ingest.stats()['rejected'] == 4
+    finally:
+        flush.release.set()
+        ingest.stop()
+    assert [item for call in flush.calls for item in call] == [0, 1, 2, 3, 4, 5]
+
+
+def test_enqueue_durability_acks_before_the_commit():
+    flush = _blocking()
+    ingest = IngestQueue(flush, flush_interval_ms=1, durability=DURABILITY_ENQUEUE)
+    try:
+        assert asyncio.run(ingest.submit_async('x')) is None
+        assert asyncio.run(ingest.submit_many_async(['y', 'z'])) == [None, None]
+    finally:
+        flush.release.set()
+        ingest.stop()
+    assert [item for call in flush.calls for item in call] == ['x', 'y', 'z']
+
+
+def test_timed_out_waiter_does_not_kill_the_writer():
+    ingest = IngestQueue(_slow_once(0.3), flush_interval_ms=1, ack_timeout=0.1)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await ingest.submit_async(1)
+        await asyncio.sleep(0.4)  # the slow flush finishes and acks the abandoned item
+        return await ingest.submit_async(2)
+
+    try:
+        assert asyncio.run(scenario()) == 2
+        assert ingest._writer.is_alive()
+        assert ingest.stats()['committed'] == 2  # the timed-out item was still written
+    finally:
+        ingest.stop()
+
+
+def test_cancelled_waiter_does_not_kill_the_writer():
+    ingest = IngestQueue(_slow_once(0.2), flush_interval_ms=1)
+
+    async def scenario():
+        waiter = asyncio.ensure_future(ingest.submit_async(1))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.3)
+        return await ingest.submit_async(2)
+
+    try:
+        assert asyncio.run(scenario()) == 2
+        assert ingest._writer.is_alive()
+    finally:
+        ingest.stop()
+
+
+def test_timed_out_batch_does_not_kill_the_writer():
+    ingest = IngestQueue(_slow_once(0.3), flush_interval_ms=1, ack_timeout=0.1)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await ingest.submit_many_async([1, 2, 3])
+        await asyncio.sleep(0.4)
+        return await ingest.submit_many_async([4, 5])
+
+    try:
+        assert asyncio.run(scenario()) == [4, 5]
+        assert ingest._writer.is_alive()
+        assert ingest.stats()['committed'] == 5
+    finally:
+        ingest.stop()
+
+
+@pytest.fixture
+def events_database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # importing database opens ./smart_security.db
+    import database
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "ingest.db"))
+    database.init_database()
+    return database
+
+
+def test_post_commit_failure_does_not_write_the_group_twice(events_database, monkeypatch):
+    database = events_database
+
+    def broken_store(*tags):
+        raise ConnectionError("shared store down")
+
+    monkeypatch.setattr(database.stats_cache, "invalidate", broken_store)
+    ingest = IngestQueue(database.add_events, flush_interval_ms=1)
+    event = {"device_id": "officer_1", "type": "status_update", "level": "info"}
+
+    async def scenario():
+        return await asyncio.gather(*(ingest.submit_async(dict(event)) for _ in range(5)))
+
+    try:
+        ids = asyncio.run(scenario())
+    finally:
+        ingest.stop()
+    assert len(set(ids)) == 5
+    assert ingest.stats()['failed'] == 0
+    with database.get_db('test') as conn:
+        assert conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 5
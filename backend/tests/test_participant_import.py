@@ -0,0 +1,60 @@
+"""
+Participant Import
+اختبارات استيراد المشاركين بالجملة
+"""
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def events_db(tmp_path):
+    import events_management
+    db = events_management.EventsManagementDB(str(tmp_path / "participants.db"))
+    db.create_event({
+        'event_name': 'Hajj', 'event_type': 'hajj', 'start_date': '2026-05-01T00:00:00',
+        'end_date': '2026-05-10T00:00:00', 'max_participants': 100000,
+    })
+    return db
+
+
+def test_concurrent_imports_count_each_participant_once(events_db):
+    participants = [{'participant_id': f'P{i}', 'full_name': f'Pilgrim {i}'} for i in range(2000)]
+    barrier = threading.Barrier(4)
+    skipped = []
+
+    def register():
+        barrier.wait()
+        skipped.append(len(events_db.register_participants(1, participants)))
+
+    threads = [threading.Thread(target=register) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    created = [len(participants) - count for count in skipped]
+    assert sorted(created) == [0, 0, 0, len(participants)]
+    assert events_db.count_event_participants(1) == len(participants)
+
+
+def test_job_status_is_visible_to_other_workers(events_db, tmp_path):
+    from participant_import import ParticipantImporter
+
+    upload = tmp_path / "participants.ndjson"
+    upload.write_text('{"participant_id": "A1", "full_name": "Ali"}\nnot json\n')
+    receiving = ParticipantImporter(events_db, validate=dict)
+    other = ParticipantImporter(events_db, validate=dict)  # same database, its own process state
+
+    job = receiving.submit(1, str(upload), "ndjson")
+    for _ in range(200):
+        status = other.get(job.job_id)
+        if status and status['status'] == 'completed':
+            break
+        time.sleep(0.01)
+
+    assert status['status'] == 'completed'
+    assert (status['event_id'], status['imported'], status['rejected']) == (1, 1, 1)
+    assert status['errors'][0]['row'] == 2
+    assert other.get('missing') is None
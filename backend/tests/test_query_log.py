@@ -0,0 +1,40 @@
+"""
+Traced Cursor
+التحقق من أن المؤشر المتتبَّع يقرأ النتائج على دفعات عند التكرار
+"""
+import sqlite3
+
+from query_log import QueryLog, TracedConnection
+
+
+def _traced(rows: int) -> TracedConnection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (n INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", ((i,) for i in range(rows)))
+    return TracedConnection(conn, QueryLog())
+
+
+def test_iteration_returns_every_row():
+    cursor = _traced(1000).execute("SELECT n FROM t ORDER BY n")
+    assert [row[0] for row in cursor] == list(range(1000))
+
+
+def test_early_break_leaves_the_rest_unread():
+    cursor = _traced(1000).execute("SELECT n FROM t ORDER BY n")
+    for row in cursor:
+        if row[0] == 9:
+            break
+    # Only the first page was fetched: the underlying cursor resumes after it
+    remaining = cursor.fetchall()
+    assert remaining and len(remaining) < 1000 - 10
+    assert remaining[-1][0] == 999
+
+
+def test_statement_is_recorded_after_iteration():
+    conn = _traced(10)
+    log = conn._log
+    log.threshold = 0.0
+    for _ in conn.execute("SELECT n FROM t"):
+        pass
+    conn.flush()
+    assert [(s["statement"], s["count"]) for s in log.report()["slowest"]] == [("SELECT n FROM t", 1)]
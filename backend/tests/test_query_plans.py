@@ -0,0 +1,85 @@
+"""
+Hot Query Plans
+التحقق من أن استعلامات المسار الساخن تستخدم الفهارس (EXPLAIN QUERY PLAN)
+"""
+import os
+import re
+
+import pytest
+
+# "SCAN <table>" is a full pass over the table (or over a whole index)
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+
+@pytest.fixture(scope="module")
+def plans(tmp_path_factory):
+    """Run every hot query once against a freshly migrated database and
+    return {statement: plan lines}, as captured by the slow-query log."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("db"))  # the module-level events_db opens ./smart_security.db
+    try:
+        import database
+        import events_management
+        from query_log import query_log
+
+        database.DATABASE_PATH = os.path.abspath("hot_queries.db")
+        database.init_database()
+        events_db = events_management.EventsManagementDB(database.DATABASE_PATH)
+
+        query_log.reset()
+        threshold, query_log.threshold = query_log.threshold, 0.0  # capture the plan of every statement
+        try:
+            database.get_events(limit=100)
+            database.get_events(limit=100, status='open')
+            events_db.get_participant_location_history('P1', 1)
+            events_db.get_active_alerts(1)
+            events_db.verify_credential('QR-1', 1)
+            events_db.get_event_statistics(1)
+            statements = query_log.report(limit=1000)['slowest']
+        finally:
+            query_log.threshold = threshold
+            query_log.reset()
+    finally:
+        os.chdir(cwd)
+    return {stats['statement']: stats['plan'] for stats in statements}
+
+
+def _plan(plans, pattern):
+    """The plan of the one captured (normalized) statement matching the regex"""
+    matches = [plan for statement, plan in plans.items() if re.search(pattern, statement)]
+    assert len(matches) == 1, f"expected one statement matching {pattern!r}, got {len(matches)}"
+    return matches[0]
+
+
+def _assert_searches(plan):
+    for detail in plan:
+        assert not _SCAN.match(detail), f"full scan: {detail} (plan: {plan})"
+        assert "USE TEMP B-TREE" not in detail, f"unindexed sort: {detail} (plan: {plan})"
+
+
+def test_get_events_without_filter_walks_timestamp_index(plans):
+    plan = _plan(plans, r"FROM events ORDER BY timestamp DESC LIMIT")
+    # No WHERE: reading the newest rows in index order and stopping at LIMIT is the best plan
+    assert plan == ["SCAN events USING INDEX idx_events_timestamp"], plan
+
+
+def test_get_events_by_status(plans):
+    plan = _plan(plans, r"FROM events WHERE status = \?")
+    _assert_searches(plan)
+    assert any(detail.startswith("SEARCH events USING INDEX") for detail in plan), plan
+
+
+@pytest.mark.parametrize("pattern", [
+    r"FROM location_tracking WHERE participant_id = \? AND event_id = \?",
+    r"FROM security_alerts WHERE event_id = \? AND resolved = \? ORDER BY created_at",
+    r"FROM access_credentials ac JOIN event_participants",
+    # get_event_statistics
+    r"COUNT\(\*\) as total FROM event_participants WHERE event_id = \?$",
+    r"COUNT\(\*\) as total FROM event_participants WHERE event_id = \? AND is_verified",
+    r"COUNT\(\*\) as total FROM iot_devices",
+    r"COUNT\(\*\) as total FROM security_alerts",
+    r"COUNT\(\*\) as total FROM fraud_attempts",
+    r"COUNT\(\*\) as total FROM access_logs",
+])
+def test_hot_query_uses_index(plans, pattern):
+    _assert_searches(_plan(plans, pattern))
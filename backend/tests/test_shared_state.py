@@ -0,0 +1,72 @@
+"""
+Shared State Store
+التحقق من أن مخازن الحالة المشتركة لا تحجب حلقة الأحداث
+"""
+import asyncio
+import threading
+
+import pytest
+
+from change_tracker import ChangeTracker
+from middleware import RateLimitMiddleware
+from shared_state import LocalStore, SharedStore
+
+
+class RecordingStore(LocalStore):
+    """In-process store that claims to be shared and records the calling threads"""
+
+    shared = True
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.current_thread().name)
+        return super().get(key)
+
+    def hit(self, key, requests, period):
+        self.threads.add(threading.current_thread().name)
+        return super().hit(key, requests, period)
+
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_rate_limit_takes_shared_tokens_off_the_loop():
+    store = RecordingStore()
+    limiter = RateLimitMiddleware(_ok, max_requests=1, window=60, store=store)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [], "client": ("10.0.0.1", 1)}
+    for _ in range(2):
+        asyncio.run(limiter(scope, None, send))
+
+    assert [m["status"] for m in sent if m["type"] == "http.response.start"] == [200, 429]
+    assert store.threads and all(name.startswith("shared-state") for name in store.threads)
+
+
+def test_change_tracker_reads_shared_versions_off_the_loop():
+    store = RecordingStore()
+    tracker = ChangeTracker(store)
+    tracker.bump("events")
+    store.threads.clear()
+
+    assert asyncio.run(tracker.versions_async(["events"])) == (1,)
+    assert asyncio.run(tracker.etag_async(["events"])) == tracker.etag(["events"])
+    assert "MainThread" in store.threads  # the synchronous etag() above
+    store.threads.discard("MainThread")
+    assert store.threads and all(name.startswith("shared-state") for name in store.threads)
+
+
+def test_incomplete_backend_fails_when_created():
+    class NoBuckets(SharedStore):
+        get = set = setdefault = delete = incr = LocalStore.get
+
+    with pytest.raises(TypeError, match="hit"):
+        NoBuckets()